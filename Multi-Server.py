@@ -0,0 +1,7 @@
+from http_suite.cache import ResultCache
+from http_suite.multi import MultiServer
+
+ms = MultiServer(
+    host="127.0.0.1", port=50123, unix="/tmp/calculator.sock", cache=ResultCache()
+)
+ms.run()
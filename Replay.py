@@ -0,0 +1,31 @@
+"""Replays a capture journal against servers and compares their latencies."""
+
+import argparse
+
+from http_suite.replay import Replayer, compare
+
+parser = argparse.ArgumentParser(description=__doc__)
+parser.add_argument("journal", help="journal written by a server's Capture")
+parser.add_argument(
+    "ports", nargs="+", type=int, help="server ports, the first one is the baseline"
+)
+parser.add_argument("--host", default="127.0.0.1", help="server host address")
+parser.add_argument(
+    "--speed",
+    type=float,
+    default=1.0,
+    help="times faster than captured, 0 to send as fast as possible",
+)
+args = parser.parse_args()
+
+results = [
+    Replayer(args.journal, host=args.host, port=port, speed=args.speed or None).run()
+    for port in args.ports
+]
+
+for port, result in zip(args.ports, results):
+    print("Port {}: {}".format(port, result.summary()))
+
+for port, result in zip(args.ports[1:], results[1:]):
+    print("\nPort {} against port {}:".format(port, args.ports[0]))
+    print(compare(results[0], result))
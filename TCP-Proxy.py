@@ -0,0 +1,6 @@
+from http_suite.proxy import TCPProxy
+
+backends = [("127.0.0.1", 50124), ("127.0.0.1", 50125), ("127.0.0.1", 50126)]
+
+tp = TCPProxy(backends, host="127.0.0.1", port=50123)
+tp.run()
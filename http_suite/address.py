@@ -0,0 +1,60 @@
+"""Socket addresses: IPv4 hosts and Unix domain socket paths."""
+
+import os
+import socket
+import stat
+
+
+def is_unix_path(host: str) -> bool:
+    """Check whether a host is a Unix domain socket path.
+
+    Any host containing a slash, such as "/tmp/calculator.sock" or
+    "./calculator.sock", is a path, since IP addresses and host names never do.
+
+    Args:
+        host (str): The host or path.
+
+    Returns:
+        bool: True for a Unix domain socket path.
+    """
+    return isinstance(host, str) and "/" in host
+
+
+def address_family(host: str) -> int:
+    """Get the socket family for a host.
+
+    Args:
+        host (str): The host or path.
+
+    Returns:
+        int: AF_UNIX for paths, AF_INET otherwise.
+    """
+    return socket.AF_UNIX if is_unix_path(host) else socket.AF_INET
+
+
+def socket_address(host: str, port: int):
+    """Build the address to bind, connect or send to.
+
+    Args:
+        host (str): The host or path.
+        port (int): The port number, ignored for paths.
+
+    Returns:
+        The path for Unix domain sockets, a ``(host, port)`` pair otherwise.
+    """
+    return host if is_unix_path(host) else (host, port)
+
+
+def remove_stale_socket(path: str):
+    """Remove a socket file left behind by a previous process.
+
+    Regular files are left alone so that a mistyped path never deletes data.
+
+    Args:
+        path (str): The socket path.
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,94 @@
+"""Admission control: shed load early when requests queue for too long."""
+
+import threading
+import time
+
+
+class ServiceUnavailable(SystemError):
+    """Exception raised when a request is shed to protect the server."""
+
+
+class AdmissionController:
+    """Decides whether to serve a request based on queueing delay and load.
+
+    The controller follows the controlled-delay (CoDel) idea: a queue that
+    drains regularly is healthy, however long its bursts, while a queue whose
+    delay stays above ``target`` for a whole ``interval`` is standing and only
+    adds latency. Requests may wait up to ``interval`` while the queue is
+    healthy, but only up to ``target`` once it has been standing, so the server
+    keeps serving fresh requests instead of timing out on stale ones.
+
+    Args:
+        target (float): Acceptable queueing delay in seconds. Defaults to 0.005.
+        interval (float): How long the delay may stay above the target before
+            the queue counts as standing, in seconds. Defaults to 0.1.
+        max_inflight (int): Maximum requests processed at once. Defaults to
+            None (no limit).
+        clock (callable): Time source, in the same timebase as the arrival
+            times given to ``admit``. Defaults to ``time.time``.
+    """
+
+    def __init__(
+        self,
+        target: float = 0.005,
+        interval: float = 0.1,
+        max_inflight: int = None,
+        clock=time.time,
+    ):
+        self.target = target
+        self.interval = interval
+        self.max_inflight = max_inflight
+        self.clock = clock
+
+        self.inflight = 0
+        self.last_empty = clock()
+        # Servers running one loop per thread share the controller
+        self.lock = threading.Lock()
+
+    def overloaded(self, now: float) -> bool:
+        """Check whether the queue has been standing for a whole interval.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            bool: True if the delay has not dropped below the target lately.
+        """
+        return now - self.last_empty > self.interval
+
+    def admit(self, arrival: float = None) -> str:
+        """Decide whether to serve a request.
+
+        Args:
+            arrival (float): When the request arrived, e.g. the kernel receive
+                timestamp. Defaults to now.
+
+        Returns:
+            str: None to serve the request, otherwise the reason to shed it
+            ("inflight" or "queue_delay").
+        """
+        now = self.clock()
+        delay = 0.0 if arrival is None else max(0.0, now - arrival)
+
+        if delay < self.target:
+            self.last_empty = now
+
+        if self.max_inflight is not None and self.inflight >= self.max_inflight:
+            return "inflight"
+
+        limit = self.target if self.overloaded(now) else self.interval
+
+        if delay > limit:
+            return "queue_delay"
+
+        return None
+
+    def begin(self):
+        """Count a request as in flight."""
+        with self.lock:
+            self.inflight += 1
+
+    def end(self):
+        """Count a request as finished."""
+        with self.lock:
+            self.inflight -= 1
@@ -0,0 +1,158 @@
+"""Client-side coalescing of individual evaluations into batch requests."""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .client import UDPReliableClient, UDPUnreliableClient
+
+
+class BatchingClient:
+    """Wrapper that sends many ``evaluate`` calls as one batch request.
+
+    Calls made within ``linger`` seconds of each other, up to ``max_batch`` of
+    them, travel in a single POST to the server's ``/batch`` path, and each
+    caller's future receives its own result. A background thread does the
+    sending, so callers never wait for each other.
+
+    UDP clients must be ``fragmented``: a batch response outgrows a single
+    datagram long before ``max_batch`` results, and would be cut short.
+
+    Args:
+        client (Client): A connected TCPClient, or a fragmented UDP client.
+        linger (float): How long to wait for more calls after the first one,
+            in seconds. Defaults to 0.005.
+        max_batch (int): Maximum number of expressions per batch.
+            Defaults to 64.
+        **send_args: Extra arguments of ``client.http_send``, such as the
+            server's ``host`` and ``port`` for UDP clients.
+
+    Raises:
+        ValueError: If the client is a UDP client without fragmentation.
+    """
+
+    def __init__(self, client, linger: float = 0.005, max_batch: int = 64, **send_args):
+        udp = isinstance(client, (UDPReliableClient, UDPUnreliableClient))
+        if udp and not client.fragmented:
+            raise ValueError("Batching needs a fragmented UDP client")
+
+        self.client = client
+        self.linger = linger
+        self.max_batch = max_batch
+        self.send_args = send_args
+
+        self.queue = queue.Queue()
+        self.closed = False
+
+        self.batches = 0
+        self.expressions = 0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def evaluate(self, expression: str) -> Future:
+        """Queue an expression for evaluation.
+
+        Args:
+            expression (str): The expression, e.g. "+ 1 2".
+
+        Returns:
+            Future: Resolves to the result, or False if the server rejected the
+            expression.
+
+        Raises:
+            RuntimeError: If the client was closed.
+        """
+        if self.closed:
+            raise RuntimeError("Batching client is closed")
+
+        future = Future()
+        self.queue.put((expression, future))
+
+        return future
+
+    def close(self):
+        """Send the calls still queued and stop the background thread."""
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def collect(self) -> list:
+        """Wait for a first call, then for more until the linger time passes.
+
+        Returns:
+            list: The ``(expression, future)`` pairs of the batch, or None once
+            the client is closed and drained.
+        """
+        first = self.queue.get()
+
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+
+            try:
+                item = self.queue.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                break
+
+            if item is None:
+                # Send what we have; the sentinel stops the loop afterwards
+                self.queue.put(None)
+                break
+
+            batch.append(item)
+
+        return batch
+
+    def send(self, batch: list):
+        """Send one batch and resolve its futures.
+
+        Args:
+            batch (list): The ``(expression, future)`` pairs.
+        """
+        expressions = [expression for expression, _ in batch]
+
+        try:
+            self.client.http_send(
+                file="/batch",
+                method="POST",
+                params={"expression": expressions},
+                **self.send_args,
+            )
+            body = self.client.result()
+
+            if body is False:
+                raise RuntimeError("Batch request rejected")
+
+            lines = body.splitlines()
+
+            if len(lines) != len(batch):
+                raise RuntimeError("Batch response has the wrong number of results")
+
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+
+        self.batches += 1
+        self.expressions += len(batch)
+
+        for line, (_, future) in zip(lines, batch):
+            status, _, value = line.partition(" ")
+            future.set_result(value if status == "200" else False)
+
+    def run(self):
+        """Send batches until the client is closed."""
+        while True:
+            batch = self.collect()
+
+            if batch is None:
+                break
+
+            self.send(batch)
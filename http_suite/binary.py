@@ -0,0 +1,236 @@
+"""Compact binary framing of calculator requests and responses.
+
+A frame is a 10-byte header followed by its payload. The header holds a magic
+byte, the opcode, a 32-bit request ID and the payload length. The magic is not
+an ASCII character, so a server tells binary frames from HTTP text by their
+first byte.
+
+Requests carry the two operands as zigzag varints. Responses carry an integer
+result as a zigzag varint, a fractional result as a double, or an error code.
+"""
+
+import struct
+
+MAGIC = b"\xcb"
+
+HEADER = struct.Struct("!sBII")
+
+# Request opcodes
+ADD = 0x01
+SUBTRACT = 0x02
+MULTIPLY = 0x03
+DIVIDE = 0x04
+
+# Response opcodes
+RESULT_INT = 0x80
+RESULT_FLOAT = 0x81
+ERROR = 0x82
+
+OPCODES = {"+": ADD, "-": SUBTRACT, "*": MULTIPLY, "/": DIVIDE}
+OPERATIONS = {code: op for op, code in OPCODES.items()}
+
+ERRORS = [
+    "ValueError",
+    "OperationIncomplete",
+    "InvalidOperation",
+    "NotAnInteger",
+    "ZeroDivisionError",
+    "ServiceUnavailable",
+    "RateLimited",
+]
+
+
+class IncompleteFrame(ValueError):
+    """Exception raised when a payload ends in the middle of a value."""
+
+
+def encode_varint(value: int) -> bytes:
+    """Encode a signed integer of any size as a zigzag varint.
+
+    Args:
+        value (int): The integer.
+
+    Returns:
+        bytes: Seven bits per byte, least significant first, with the high
+        bit set on every byte but the last.
+    """
+    value = value << 1 if value >= 0 else (-value << 1) - 1
+
+    encoded = bytearray()
+
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    encoded.append(value)
+
+    return bytes(encoded)
+
+
+def decode_varint(data: bytes, offset: int = 0) -> tuple:
+    """Decode a zigzag varint.
+
+    Args:
+        data (bytes): The buffer.
+        offset (int): Where the varint starts. Defaults to 0.
+
+    Returns:
+        tuple: The integer and the offset after it.
+
+    Raises:
+        IncompleteFrame: If the buffer ends before the varint does.
+    """
+    value = 0
+    shift = 0
+
+    while True:
+        if offset >= len(data):
+            raise IncompleteFrame("Truncated varint")
+
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            break
+
+    value = value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    return value, offset
+
+
+def encode_frame(opcode: int, request_id: int, payload: bytes = b"") -> bytes:
+    """Build a frame.
+
+    Args:
+        opcode (int): The opcode.
+        request_id (int): The request ID, echoed in the response.
+        payload (bytes): The payload. Defaults to empty.
+
+    Returns:
+        bytes: The frame.
+    """
+    return HEADER.pack(MAGIC, opcode, request_id, len(payload)) + payload
+
+
+def split_frames(buffer: bytes) -> tuple:
+    """Split a stream buffer into complete frames.
+
+    Args:
+        buffer (bytes): Received bytes, starting at a frame boundary.
+
+    Returns:
+        tuple: The list of ``(opcode, request_id, payload)`` tuples and the
+        bytes of the trailing incomplete frame.
+
+    Raises:
+        ValueError: If a frame does not start with the magic byte.
+    """
+    frames = []
+    offset = 0
+
+    while len(buffer) - offset >= HEADER.size:
+        magic, opcode, request_id, length = HEADER.unpack_from(buffer, offset)
+
+        if magic != MAGIC:
+            raise ValueError("Not a binary frame")
+
+        end = offset + HEADER.size + length
+        if end > len(buffer):
+            break
+
+        frames.append((opcode, request_id, bytes(buffer[offset + HEADER.size : end])))
+        offset = end
+
+    return frames, buffer[offset:]
+
+
+def encode_request(request_id: int, op: str, a: int, b: int) -> bytes:
+    """Build a request frame.
+
+    Args:
+        request_id (int): The request ID.
+        op (str): The operation, one of "+", "-", "*" or "/".
+        a (int): The first operand.
+        b (int): The second operand.
+
+    Returns:
+        bytes: The frame.
+
+    Raises:
+        KeyError: If the operation is not supported.
+    """
+    return encode_frame(OPCODES[op], request_id, encode_varint(a) + encode_varint(b))
+
+
+def decode_operands(payload: bytes) -> tuple:
+    """Decode the operands of a request payload.
+
+    Args:
+        payload (bytes): The payload.
+
+    Returns:
+        tuple: The two operands.
+
+    Raises:
+        IncompleteFrame: If the payload holds fewer than two operands.
+    """
+    a, offset = decode_varint(payload)
+    b, offset = decode_varint(payload, offset)
+
+    return a, b
+
+
+def encode_result(request_id: int, result) -> bytes:
+    """Build a response frame for a result.
+
+    Args:
+        request_id (int): The request ID.
+        result (int or float): The result.
+
+    Returns:
+        bytes: The frame.
+    """
+    if isinstance(result, int):
+        return encode_frame(RESULT_INT, request_id, encode_varint(result))
+
+    return encode_frame(RESULT_FLOAT, request_id, struct.pack("!d", result))
+
+
+def encode_error(request_id: int, exc: Exception) -> bytes:
+    """Build a response frame for an error.
+
+    Args:
+        request_id (int): The request ID.
+        exc (Exception): The exception raised by the calculator.
+
+    Returns:
+        bytes: The frame.
+    """
+    name = type(exc).__name__
+    code = ERRORS.index(name) if name in ERRORS else 0
+
+    return encode_frame(ERROR, request_id, bytes([code]))
+
+
+def decode_response(opcode: int, payload: bytes) -> tuple:
+    """Decode the payload of a response frame.
+
+    Args:
+        opcode (int): The response opcode.
+        payload (bytes): The payload.
+
+    Returns:
+        tuple: True and the result as a string, or False and the name of the
+        exception raised by the server.
+    """
+    if opcode == RESULT_INT:
+        return True, str(decode_varint(payload)[0])
+
+    if opcode == RESULT_FLOAT:
+        return True, str(struct.unpack("!d", payload)[0])
+
+    code = payload[0] if payload and payload[0] < len(ERRORS) else 0
+
+    return False, ERRORS[code]
@@ -0,0 +1,659 @@
+"""Result caches shared by the transports of a server, or by several servers."""
+
+import collections
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are synchronized
+    fcntl = None
+
+# File header: magic, number of buckets, ways per bucket and slot size
+FILE_HEADER = struct.Struct("=8sIII")
+MAGIC = b"CALCSHM1"
+
+# Bucket header: the clock hand and the slots used, padded to keep slots aligned
+BUCKET_HEADER = struct.Struct("=BB6x")
+
+# Slot header: seqlock version, reference bit, key and value sizes, key hash
+SLOT_HEADER = struct.Struct("=IBxHIQ")
+SEQ = struct.Struct("=I")
+
+# Attempts to read a slot that keeps being written before giving up
+READ_RETRIES = 4
+
+# Snapshot header: magic, format version, index slots, entries, time written,
+# and the checksum of the fields before it
+SNAPSHOT_HEADER = struct.Struct("=8sHxxIIdI")
+SNAPSHOT_MAGIC = b"CALCSNP1"
+SNAPSHOT_VERSION = 1
+
+# Snapshot index slot: key hash (0 if empty) and offset of the record
+INDEX_SLOT = struct.Struct("=QQ")
+
+# Snapshot record header: key and value sizes, checksum of key and value
+RECORD_HEADER = struct.Struct("=HII")
+
+
+def key_hash(key: bytes) -> int:
+    """Hash a key identically in every process.
+
+    Args:
+        key (bytes): The key.
+
+    Returns:
+        int: A non-zero 64-bit hash.
+    """
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big") or 1
+
+
+def write_snapshot(path: str, items: list):
+    """Write results to a snapshot file, replacing it atomically.
+
+    The file holds a header, an open-addressing index of key hashes and the
+    records, so that it is read in place through ``mmap``.
+
+    Args:
+        path (str): The snapshot file.
+        items (list): The (key, result) pairs, most valuable first.
+    """
+    slots = 1
+    while slots < 2 * len(items):
+        slots *= 2
+
+    index = bytearray(slots * INDEX_SLOT.size)
+    records = bytearray()
+    start = SNAPSHOT_HEADER.size + len(index)
+
+    for key, result in items:
+        key, value = key.encode(), result.encode()
+        digest = key_hash(key)
+        slot = digest % slots
+
+        while INDEX_SLOT.unpack_from(index, slot * INDEX_SLOT.size)[0]:
+            slot = (slot + 1) % slots
+
+        INDEX_SLOT.pack_into(
+            index, slot * INDEX_SLOT.size, digest, start + len(records)
+        )
+        records += RECORD_HEADER.pack(len(key), len(value), zlib.crc32(key + value))
+        records += key + value
+
+    fields = (SNAPSHOT_MAGIC, SNAPSHOT_VERSION, slots, len(items), time.time())
+    header = SNAPSHOT_HEADER.pack(*fields, 0)
+    header = SNAPSHOT_HEADER.pack(*fields, zlib.crc32(header[:-4]))
+
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+
+    with open(temporary, "wb") as snapshot:
+        snapshot.write(header)
+        snapshot.write(index)
+        snapshot.write(records)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+
+    os.replace(temporary, path)
+
+
+class CacheSnapshot:
+    """Results of a snapshot file, looked up in place without loading them.
+
+    Opening a snapshot only maps the file and checks its header, so it takes
+    the same time whatever its size. Every record is checked against its own
+    checksum when it is read, and one that fails counts as not cached.
+
+    Args:
+        path (str): The snapshot file.
+
+    Raises:
+        ValueError: The file is not a snapshot of this format version, or its
+            header is corrupt.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as snapshot:
+            self.map = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if len(self.map) < SNAPSHOT_HEADER.size:
+                raise ValueError("Truncated cache snapshot")
+
+            magic, version, slots, count, written, checksum = (
+                SNAPSHOT_HEADER.unpack_from(self.map)
+            )
+
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("Not a version {} snapshot".format(SNAPSHOT_VERSION))
+            if zlib.crc32(self.map[: SNAPSHOT_HEADER.size - 4]) != checksum:
+                raise ValueError("Corrupt cache snapshot header")
+            if len(self.map) < SNAPSHOT_HEADER.size + slots * INDEX_SLOT.size:
+                raise ValueError("Truncated cache snapshot")
+        except ValueError:
+            self.map.close()
+            raise
+
+        self.slots = slots
+        self.count = count
+        self.written = written
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, offset: int) -> tuple:
+        """Read a record.
+
+        Args:
+            offset (int): Its offset.
+
+        Returns:
+            tuple: The key and value, or None if the record is corrupt.
+        """
+        if offset + RECORD_HEADER.size > len(self.map):
+            return None
+
+        key_length, value_length, checksum = RECORD_HEADER.unpack_from(
+            self.map, offset
+        )
+        start = offset + RECORD_HEADER.size
+        data = self.map[start : start + key_length + value_length]
+
+        if zlib.crc32(data) != checksum or len(data) != key_length + value_length:
+            return None
+
+        return data[:key_length], data[key_length:]
+
+    def get(self, key: str) -> str:
+        """Look up a result.
+
+        Args:
+            key (str): The normalized expression.
+
+        Returns:
+            str: The result, or None if it is not in the snapshot.
+        """
+        encoded = key.encode()
+        digest = key_hash(encoded)
+        slot = digest % self.slots
+
+        for _ in range(self.slots):
+            offset = SNAPSHOT_HEADER.size + slot * INDEX_SLOT.size
+            stored, position = INDEX_SLOT.unpack_from(self.map, offset)
+
+            if stored == 0:
+                return None
+
+            if stored == digest:
+                record = self.record(position)
+
+                if record is not None and record[0] == encoded:
+                    return record[1].decode()
+
+            slot = (slot + 1) % self.slots
+
+        return None
+
+    def items(self):
+        """Iterate over the results, in the order they were written.
+
+        Yields:
+            tuple: The key and result of each intact record.
+        """
+        offset = SNAPSHOT_HEADER.size + self.slots * INDEX_SLOT.size
+
+        for _ in range(self.count):
+            record = self.record(offset)
+
+            if record is None:
+                return
+
+            yield record[0].decode(), record[1].decode()
+            offset += RECORD_HEADER.size + len(record[0]) + len(record[1])
+
+    def close(self):
+        """Unmap the file."""
+        self.map.close()
+
+
+class ResultCache:
+    """Least recently used cache of results by normalized expression.
+
+    Only successful evaluations are cached: errors are cheap to find again
+    and are counted by type on every request.
+
+    With a ``snapshot`` file, the cache starts warm from the results saved by
+    the previous process. They are looked up in the file on a miss, moving to
+    memory as they are used, so starting costs no more than opening the file.
+    The cache is saved to the file at most every ``snapshot_interval`` seconds
+    while it changes, in the background, and when the server closes.
+
+    Args:
+        capacity (int): Maximum results kept. Defaults to 65536.
+        snapshot (str): Path of the snapshot file. Defaults to None.
+        snapshot_interval (float): Seconds between snapshots. Defaults to 60.0.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that had to evaluate.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 65536,
+        snapshot: str = None,
+        snapshot_interval: float = 60.0,
+    ):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        # Threads of a ThreadedServer share the cache
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval
+        self.saved = time.monotonic()
+        self.saving = None
+        self.saving_lock = threading.Lock()
+        self.changed = False
+
+        # Results of the previous process, looked up lazily
+        self.warm = None
+
+        if snapshot is not None:
+            try:
+                self.warm = CacheSnapshot(snapshot)
+            except (OSError, ValueError):
+                # Missing, stale or corrupt: start cold
+                pass
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> str:
+        """Get a cached result.
+
+        Args:
+            key (str): The normalized expression, e.g. "+ 1 2".
+
+        Returns:
+            str: The result, or None if it is not cached.
+        """
+        with self.lock:
+            result = self.entries.get(key)
+
+            if result is not None:
+                self.entries.move_to_end(key)
+
+        if result is None and self.warm is not None:
+            result = self.warm.get(key)
+
+            if result is not None:
+                self.put(key, result)
+
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return result
+
+    def put(self, key: str, result: str):
+        """Cache a result, evicting the least recently used beyond capacity.
+
+        Args:
+            key (str): The normalized expression.
+            result (str): Its result.
+        """
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+        self.changed = True
+
+        if (
+            self.snapshot is not None
+            and time.monotonic() - self.saved >= self.snapshot_interval
+        ):
+            self.save(wait=False)
+
+    def save(self, wait: bool = True):
+        """Save the cache to its snapshot file.
+
+        The most recently used results are saved first, followed by the
+        results of the previous snapshot not used since, up to capacity.
+
+        Args:
+            wait (bool): Wait for the file to be written, instead of writing
+                it in a background thread. Defaults to True.
+        """
+        if self.snapshot is None:
+            return
+
+        with self.saving_lock:
+            if self.saving is not None:
+                self.saving.join()
+
+            self.saved = time.monotonic()
+            self.changed = False
+
+            with self.lock:
+                items = list(reversed(self.entries.items()))
+
+            saving = self.saving = threading.Thread(
+                target=self.write_snapshot, args=(items, self.warm), daemon=True
+            )
+            saving.start()
+
+        if wait:
+            saving.join()
+
+    def write_snapshot(self, items: list, warm: CacheSnapshot):
+        """Write a snapshot, completing recent results with older ones.
+
+        Args:
+            items (list): The (key, result) pairs in memory, most recent first.
+            warm (CacheSnapshot): The previous snapshot, or None.
+        """
+        if warm is not None and len(items) < self.capacity:
+            recent = set(key for key, _ in items)
+
+            for key, result in warm.items():
+                if len(items) >= self.capacity:
+                    break
+                if key not in recent:
+                    items.append((key, result))
+
+        write_snapshot(self.snapshot, items)
+
+    def close(self):
+        """Save the cache to its snapshot file if it changed since it was saved."""
+        if self.changed:
+            self.save()
+        elif self.saving is not None:
+            self.saving.join()
+
+        if self.warm is not None:
+            self.warm.close()
+            self.warm = None
+
+
+class SharedResultCache:
+    """Result cache in a memory-mapped file shared by several processes.
+
+    Every process mapping the same ``path`` sees the results of the others,
+    so server processes behind a proxy or listening on one port keep a
+    single warm cache instead of one per process.
+
+    The table has a fixed size. A key hashes to a bucket of ``ways`` slots,
+    and is stored in any of them (open addressing within the bucket). Each
+    slot carries a version, odd while it is being written: readers copy the
+    slot without locking and retry if its version changed (a seqlock), so
+    lookups never wait for writers. Writers lock only their bucket, with a
+    byte-range lock on the file and a lock shared by the threads of the
+    process. A full bucket evicts with the clock algorithm: lookups set the
+    reference bit of the slot they hit, and the bucket's hand skips and
+    clears referenced slots until it finds one that was not used since its
+    last pass.
+
+    Results that do not fit in a slot are not cached.
+
+    Args:
+        path (str): The file backing the table, e.g. under ``/dev/shm``. It
+            is created, or reset if its geometry differs.
+        buckets (int): Number of buckets. Defaults to 8192.
+        ways (int): Slots per bucket. Defaults to 8.
+        slot_size (int): Bytes per slot, headers included. Defaults to 256.
+
+    Attributes:
+        hits (int): Lookups of this process answered from the cache.
+        misses (int): Lookups of this process that had to evaluate.
+    """
+
+    def __init__(
+        self, path: str, buckets: int = 8192, ways: int = 8, slot_size: int = 256
+    ):
+        self.path = path
+        self.buckets = buckets
+        self.ways = ways
+        self.slot_size = slot_size
+        self.capacity = buckets * ways
+
+        self.bucket_size = BUCKET_HEADER.size + ways * slot_size
+        self.size = FILE_HEADER.size + buckets * self.bucket_size
+
+        self.hits = 0
+        self.misses = 0
+
+        # Threads of one process do not exclude each other with file locks
+        self.locks = [threading.Lock() for _ in range(64)]
+
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            self.lock_range(0, FILE_HEADER.size)
+            try:
+                geometry = (MAGIC, buckets, ways, slot_size)
+                header = os.pread(self.fd, FILE_HEADER.size, 0)
+                intact = len(header) == FILE_HEADER.size
+                intact = intact and FILE_HEADER.unpack(header) == geometry
+
+                if not intact or os.fstat(self.fd).st_size != self.size:
+                    os.ftruncate(self.fd, 0)
+                    os.ftruncate(self.fd, self.size)
+                    os.pwrite(self.fd, FILE_HEADER.pack(*geometry), 0)
+            finally:
+                self.unlock_range(0, FILE_HEADER.size)
+
+            self.map = mmap.mmap(self.fd, self.size)
+        except Exception:
+            os.close(self.fd)
+            raise
+
+    def __len__(self) -> int:
+        return sum(
+            BUCKET_HEADER.unpack_from(self.map, self.bucket_offset(bucket))[1]
+            for bucket in range(self.buckets)
+        )
+
+    def lock_range(self, offset: int, length: int):
+        """Lock part of the file against other processes.
+
+        Args:
+            offset (int): The first byte.
+            length (int): The number of bytes.
+        """
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, offset)
+
+    def unlock_range(self, offset: int, length: int):
+        """Unlock part of the file.
+
+        Args:
+            offset (int): The first byte.
+            length (int): The number of bytes.
+        """
+        if fcntl is not None:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, offset)
+
+    def bucket_offset(self, bucket: int) -> int:
+        """Get the position of a bucket in the file.
+
+        Args:
+            bucket (int): The bucket.
+
+        Returns:
+            int: Its offset.
+        """
+        return FILE_HEADER.size + bucket * self.bucket_size
+
+    def slot_offset(self, bucket: int, way: int) -> int:
+        """Get the position of a slot in the file.
+
+        Args:
+            bucket (int): The bucket.
+            way (int): The slot within the bucket.
+
+        Returns:
+            int: Its offset.
+        """
+        return self.bucket_offset(bucket) + BUCKET_HEADER.size + way * self.slot_size
+
+    def read_slot(self, offset: int) -> tuple:
+        """Copy a slot consistently without locking it.
+
+        Args:
+            offset (int): The slot's offset.
+
+        Returns:
+            tuple: The hash, key and value, or None if the slot kept changing.
+        """
+        for _ in range(READ_RETRIES):
+            seq, _, key_length, value_length, digest = SLOT_HEADER.unpack_from(
+                self.map, offset
+            )
+
+            if seq & 1:
+                continue
+
+            start = offset + SLOT_HEADER.size
+            data = self.map[start : start + key_length + value_length]
+
+            if SEQ.unpack_from(self.map, offset)[0] == seq:
+                return digest, data[:key_length], data[key_length:]
+
+        return None
+
+    def get(self, key: str) -> str:
+        """Get a cached result.
+
+        Args:
+            key (str): The normalized expression, e.g. "+ 1 2".
+
+        Returns:
+            str: The result, or None if it is not cached.
+        """
+        encoded = key.encode()
+        digest = key_hash(encoded)
+        bucket = digest % self.buckets
+
+        for way in range(self.ways):
+            offset = self.slot_offset(bucket, way)
+            slot = self.read_slot(offset)
+
+            if slot is not None and slot[0] == digest and slot[1] == encoded:
+                # Setting a byte needs no lock: at worst the bit is lost
+                self.map[offset + SEQ.size] = 1
+                self.hits += 1
+                return slot[2].decode()
+
+        self.misses += 1
+
+        return None
+
+    def put(self, key: str, result: str):
+        """Cache a result, evicting with the clock algorithm if its bucket is full.
+
+        Args:
+            key (str): The normalized expression.
+            result (str): Its result.
+        """
+        encoded = key.encode()
+        value = result.encode()
+
+        if SLOT_HEADER.size + len(encoded) + len(value) > self.slot_size:
+            return
+
+        digest = key_hash(encoded)
+        bucket = digest % self.buckets
+        start = self.bucket_offset(bucket)
+
+        with self.locks[bucket % len(self.locks)]:
+            self.lock_range(start, self.bucket_size)
+            try:
+                way = self.choose_way(bucket, digest, encoded)
+                self.write_slot(self.slot_offset(bucket, way), digest, encoded, value)
+            finally:
+                self.unlock_range(start, self.bucket_size)
+
+    def choose_way(self, bucket: int, digest: int, key: bytes) -> int:
+        """Choose the slot of a key in its locked bucket.
+
+        Args:
+            bucket (int): The bucket.
+            digest (int): The key's hash.
+            key (bytes): The key.
+
+        Returns:
+            int: The slot already holding the key, else an empty one, else
+            the one evicted by the clock hand.
+        """
+        empty = None
+        hand_offset = self.bucket_offset(bucket)
+        hand, used = BUCKET_HEADER.unpack_from(self.map, hand_offset)
+
+        for way in range(self.ways):
+            offset = self.slot_offset(bucket, way)
+            _, _, key_length, _, stored = SLOT_HEADER.unpack_from(self.map, offset)
+
+            if stored == digest:
+                start = offset + SLOT_HEADER.size
+                if self.map[start : start + key_length] == key:
+                    return way
+            elif stored == 0 and empty is None:
+                empty = way
+
+        if empty is not None:
+            BUCKET_HEADER.pack_into(self.map, hand_offset, hand, used + 1)
+            return empty
+
+        # Give referenced slots a second chance, clearing their bit
+        while self.map[self.slot_offset(bucket, hand) + SEQ.size]:
+            self.map[self.slot_offset(bucket, hand) + SEQ.size] = 0
+            hand = (hand + 1) % self.ways
+
+        BUCKET_HEADER.pack_into(self.map, hand_offset, (hand + 1) % self.ways, used)
+
+        return hand
+
+    def write_slot(self, offset: int, digest: int, key: bytes, value: bytes):
+        """Write a slot of a locked bucket, making readers retry meanwhile.
+
+        Args:
+            offset (int): The slot's offset.
+            digest (int): The key's hash.
+            key (bytes): The key.
+            value (bytes): The value.
+        """
+        seq = SEQ.unpack_from(self.map, offset)[0]
+
+        SEQ.pack_into(self.map, offset, seq + 1)
+        start = offset + SLOT_HEADER.size
+        self.map[start : start + len(key) + len(value)] = key + value
+        SLOT_HEADER.pack_into(
+            self.map, offset, seq + 1, 0, len(key), len(value), digest
+        )
+        SEQ.pack_into(self.map, offset, (seq + 2) & 0xFFFFFFFF)
+
+    def save(self, wait: bool = True):
+        """Do nothing: the table lives in its file, which outlives the processes.
+
+        Args:
+            wait (bool): Unused.
+        """
+
+    def close(self):
+        """Unmap the table. The file is left for the other processes."""
+        if not self.map.closed:
+            self.map.close()
+            os.close(self.fd)
@@ -75,6 +75,20 @@ class Calculator:
 
         return a / b
 
+    def normalize(self, message: str) -> str:
+        """Normalize the spacing of an expression.
+
+        Expressions that only differ in spacing normalize to the same string.
+
+        Args:
+            message (str): The input string containing the operation and operands.
+
+        Returns:
+            str: The expression with single spaces and no surrounding blanks.
+        """
+        message = message.strip()
+        return re.sub(" +", " ", message)
+
     def evaluate(self, message: str) -> str:
         """Evaluate a string message containing an arithmetic operation.
 
@@ -90,8 +104,7 @@ class Calculator:
             NotAnInteger: If one or more operands are not integers.
         """
         # Remove multiple spaces
-        message = message.strip()
-        message = re.sub(" +", " ", message)
+        message = self.normalize(message)
 
         # Check for number of arguments
         params = message.split(" ")
@@ -110,6 +123,26 @@ class Calculator:
         except ValueError:
             raise NotAnInteger("One of the operands is not an integer")
 
+        return str(self.apply(op, a, b))
+
+    def apply(self, op: str, a: int, b: int):
+        """Apply an operation to two integers.
+
+        Args:
+            op (str): The operation, one of "+", "-", "*" or "/".
+            a (int): The first operand.
+            b (int): The second operand.
+
+        Returns:
+            int or float: The result, as an int whenever it is integral.
+
+        Raises:
+            InvalidOperation: If the operation is not supported.
+            ZeroDivisionError: If dividing by zero.
+        """
+        if op not in self.operations:
+            raise InvalidOperation("Operation not supported")
+
         # Run operations and return result
         result = 0
 
@@ -126,4 +159,4 @@ class Calculator:
         if type(result) is not int and result.is_integer():
             result = int(result)
 
-        return str(result)
+        return result
@@ -0,0 +1,162 @@
+"""Traffic capture: a binary journal of the requests a server receives."""
+
+import struct
+import threading
+import time
+
+# Journal header: magic, format version and when the capture started
+JOURNAL_HEADER = struct.Struct("=8sHxxd")
+JOURNAL_MAGIC = b"CALCJRN1"
+JOURNAL_VERSION = 1
+
+# Record header: seconds since the start, source ID, transport, payload size
+RECORD_HEADER = struct.Struct("=dIBI")
+
+TCP = 0
+UDP = 1
+
+
+class Record:
+    """A request of a journal.
+
+    Args:
+        offset (float): Seconds between the start of the capture and its
+            arrival.
+        source (int): ID of the connection or UDP client that sent it.
+        transport (int): ``TCP`` or ``UDP``.
+        payload (bytes): The HTTP message, binary frames or datagram.
+    """
+
+    __slots__ = ("offset", "source", "transport", "payload")
+
+    def __init__(self, offset: float, source: int, transport: int, payload: bytes):
+        self.offset = offset
+        self.source = source
+        self.transport = transport
+        self.payload = payload
+
+
+class Capture:
+    """Writes the requests received by servers to a journal file.
+
+    Every complete request is recorded with its arrival time and the ID of its
+    source: one per TCP connection and one per UDP client address, so client
+    addresses are not kept. Records are written through a large buffer, so
+    capturing costs one copy per request.
+
+    Args:
+        path (str): The journal file, overwritten.
+        buffer_size (int): Bytes buffered before writing. Defaults to 1 MiB.
+        clock (callable): Time source of the arrival times. Defaults to
+            ``time.time``.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.start = clock()
+
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(
+            JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, self.start)
+        )
+
+        self.sources = {}
+        self.next_source = 0
+        self.records = 0
+
+        # Threads of a ThreadedServer share the journal
+        self.lock = threading.Lock()
+
+    def new_source(self) -> int:
+        """Get the ID of a new source, such as a TCP connection.
+
+        Returns:
+            int: The ID.
+        """
+        with self.lock:
+            self.next_source += 1
+            return self.next_source
+
+    def source(self, address) -> int:
+        """Get the ID of a UDP client.
+
+        Args:
+            address: The client's address.
+
+        Returns:
+            int: The same ID for every datagram of the client.
+        """
+        with self.lock:
+            source = self.sources.get(address)
+
+            if source is None:
+                self.next_source += 1
+                source = self.sources[address] = self.next_source
+
+            return source
+
+    def record(self, transport: int, source: int, payload: bytes, arrival=None):
+        """Record a request.
+
+        Args:
+            transport (int): ``TCP`` or ``UDP``.
+            source (int): The ID of its source.
+            payload (bytes): The request.
+            arrival (float): When it arrived. Defaults to now.
+        """
+        offset = (self.clock() if arrival is None else arrival) - self.start
+        header = RECORD_HEADER.pack(offset, source, transport, len(payload))
+
+        with self.lock:
+            if self.file.closed:
+                return
+
+            self.file.write(header)
+            self.file.write(payload)
+            self.records += 1
+
+    def close(self):
+        """Write what is buffered and close the journal."""
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+def read_journal(path: str):
+    """Read the requests of a journal in the order they arrived.
+
+    Args:
+        path (str): The journal file.
+
+    Yields:
+        Record: Every complete record. A record cut short by a crash ends the
+        journal.
+
+    Raises:
+        ValueError: If the file is not a journal of this format version.
+    """
+    with open(path, "rb") as journal:
+        header = journal.read(JOURNAL_HEADER.size)
+
+        if len(header) < JOURNAL_HEADER.size:
+            raise ValueError("Truncated journal")
+
+        magic, version, _ = JOURNAL_HEADER.unpack(header)
+
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError("Not a version {} journal".format(JOURNAL_VERSION))
+
+        while True:
+            header = journal.read(RECORD_HEADER.size)
+
+            if len(header) < RECORD_HEADER.size:
+                return
+
+            offset, source, transport, size = RECORD_HEADER.unpack(header)
+            payload = journal.read(size)
+
+            if len(payload) < size:
+                return
+
+            yield Record(offset, source, transport, payload)
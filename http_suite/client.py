@@ -1,10 +1,25 @@
 """Client Agent."""
 
+import collections
+import random
 import re
 import socket
+import zlib
 
+from . import binary, fragment
+from .address import address_family, is_unix_path, remove_stale_socket, socket_address
 from .bcolors import bcolors
-from .http import HTTPParser, HTTPRequest
+from .gather import advance, send_buffers, set_nodelay
+from .http import (
+    ENCODINGS,
+    ChunkedDecoder,
+    HTTPParser,
+    HTTPRequest,
+    compress_message,
+    decode_message,
+)
+from .impairment import ImpairedSocket, Impairment
+from .tracing import Tracer
 
 
 class TimeoutException(SystemError):
@@ -46,15 +61,35 @@ class Client:
     Args:
         buffer_size (int): Size of the buffer for receiving data.
         debug (bool): Enable or disable debug mode.
+        transport: Factory of the client's socket with a ``socket(family, type)``
+            method, such as the ``socket`` module, or a ``SimNetwork`` for UDP
+            clients.
+        tracer (Tracer): Writes the phases of sampled requests to a trace
+            file. Defaults to None.
+        compress_min_size (int): Accept gzip and deflate responses, and send
+            request bodies of at least this many bytes with gzip. Defaults to
+            None, neither.
     """
 
     def __init__(
         self,
         buffer_size: int = 1024,
         debug: bool = False,
+        transport=socket,
+        tracer: Tracer = None,
+        compress_min_size: int = None,
     ):
         self.debug = debug
         self.buffer_size = buffer_size
+        self.transport = transport
+        self.tracer = tracer
+        self.compress_min_size = compress_min_size
+
+        # Trace of the request waiting for its response, if it is sampled
+        self.trace = None
+
+        self.request_id = 0
+        self.pending = b""
 
     def send(self, message: str):
         """Send a message to the server.
@@ -82,10 +117,10 @@ class Client:
             str: The processed response.
         """
         parser = HTTPParser()
-        response = parser.parse_response(message)
+        response = parser.read_response(message)
 
-        if response["status"] == 200:
-            return response["data"]
+        if response.status == 200:
+            return response.data
         else:
             return False
 
@@ -95,8 +130,125 @@ class Client:
         Returns:
             str: The processed response.
         """
-        response = self.receive().decode()
-        return self.process_response(response)
+        response = decode_message(self.receive())
+        self.trace_phase("receive")
+
+        result = self.process_response(response)
+        self.finish_trace("parse")
+
+        return result
+
+    def build_request(
+        self,
+        host: str,
+        file: str = "/",
+        method: str = "POST",
+        params: dict = None,
+        data: str = None,
+    ):
+        """Build an HTTP request, compressed if compression is enabled.
+
+        Args:
+            host (str): The server's hostname or IP address.
+            file (str): The file path in the HTTP request.
+            method (str): The HTTP method (e.g., GET, POST).
+            params (dict): Query parameters for the request.
+            data (str): Data to include in the request body.
+
+        Returns:
+            str or CompressedMessage: The request.
+        """
+        if self.compress_min_size is None:
+            return HTTPRequest(host=host).build_request(
+                file=file, method=method, params=params, data=data
+            )
+
+        request = HTTPRequest(
+            host=host, accept_encoding=", ".join(ENCODINGS)
+        ).build_request(file=file, method=method, params=params, data=data)
+
+        return compress_message(request, "gzip", self.compress_min_size)
+
+    def start_trace(self, method: str, file: str):
+        """Starts tracing a request if it is sampled.
+
+        Args:
+            method (str): The HTTP method of the request.
+            file (str): The file path of the request.
+        """
+        if self.tracer is not None:
+            self.trace = self.tracer.start("{} {}".format(method, file))
+
+    def trace_phase(self, phase: str):
+        """Ends a phase of the request, if it is traced.
+
+        Args:
+            phase (str): The phase, e.g. "send".
+        """
+        if self.trace is not None:
+            self.trace.mark(phase)
+
+    def finish_trace(self, phase: str):
+        """Ends the last phase and the trace of the request.
+
+        Args:
+            phase (str): The last phase, e.g. "parse".
+        """
+        if self.trace is not None:
+            self.trace.mark(phase)
+            self.trace.finish()
+            self.trace = None
+
+    def binary_request(self, expression: str) -> bytes:
+        """Build a binary request frame for an expression.
+
+        Args:
+            expression (str): The expression, e.g. "+ 1 2".
+
+        Returns:
+            bytes: The frame, or None if the expression cannot be encoded.
+        """
+        exp = parse_expression(expression)
+
+        try:
+            a = int(exp["a"])
+            b = int(exp["b"])
+        except (TypeError, ValueError):
+            return None
+
+        if exp["op"] not in binary.OPCODES:
+            return None
+
+        self.request_id = (self.request_id + 1) & 0xFFFFFFFF
+
+        return binary.encode_request(self.request_id, exp["op"], a, b)
+
+    def binary_response(self, frames: list) -> str:
+        """Find the response to the last binary request.
+
+        Args:
+            frames (list): Received ``(opcode, request_id, payload)`` frames.
+
+        Returns:
+            str: The result, False if the server rejected the expression, or
+            None if no frame answers the last request.
+        """
+        for opcode, request_id, payload in frames:
+            if request_id != self.request_id:
+                continue
+
+            ok, value = binary.decode_response(opcode, payload)
+
+            if self.debug:
+                print(
+                    "\n{}{}Received binary response:{} {}".format(
+                        bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, value
+                    )
+                )
+
+            return value if ok else False
+
+        return None
 
 
 class TCPClient(Client):
@@ -105,21 +257,29 @@ class TCPClient(Client):
     Args:
         buffer_size (int): Size of the buffer for receiving data.
         debug (bool): Enable or disable debug mode.
+        transport: Factory of the client's socket. Defaults to ``socket``.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest request body compressed, also
+            accepting compressed responses, or None. Defaults to None.
     """
 
     def __init__(
         self,
         buffer_size: int = 1024,
         debug: bool = False,
+        transport=socket,
+        tracer: Tracer = None,
+        compress_min_size: int = None,
     ):
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        super().__init__(buffer_size, debug)
+        self.client_socket = transport.socket(socket.AF_INET, socket.SOCK_STREAM)
+        super().__init__(buffer_size, debug, transport, tracer, compress_min_size)
 
     def connect(self, host: str = "127.0.0.1", port: int = 51234):
         """Connect to the server.
 
         Args:
-            host (str): The server's hostname or IP address.
+            host (str): The server's hostname, IP address or Unix domain socket
+                path.
             port (int): The server's port number.
         """
         if self.debug:
@@ -129,8 +289,15 @@ class TCPClient(Client):
                 )
             )
 
+        # A Unix domain socket path needs a socket of another family
+        family = address_family(host)
+        if self.client_socket.family != family:
+            self.client_socket.close()
+            self.client_socket = self.transport.socket(family, socket.SOCK_STREAM)
+
         try:
-            self.client_socket.connect((host, port))
+            self.client_socket.connect(socket_address(host, port))
+            set_nodelay(self.client_socket)
         except ConnectionRefusedError:
             print(
                 "{}{}Error: Connection refused.{}".format(
@@ -144,18 +311,23 @@ class TCPClient(Client):
         Args:
             message (str): The message to send.
         """
-        message_length = len(message)
-        message = message.encode()
+        self.send_all([message.encode()])
+
+    def send_all(self, messages: list):
+        """Send messages back to back, written together as far as possible.
 
-        total_sent = 0
+        Args:
+            messages (list): The encoded messages.
+        """
+        buffers = collections.deque(messages)
 
-        while total_sent < message_length:
-            sent = self.client_socket.send(message[total_sent:])
+        while buffers:
+            sent = send_buffers(self.client_socket, list(buffers))
 
             if sent == 0:
                 raise RuntimeError("Connection broken")
 
-            total_sent = total_sent + sent
+            advance(buffers, sent)
 
     def http_send(
         self,
@@ -174,10 +346,12 @@ class TCPClient(Client):
             params (dict): Query parameters for the request.
             data (str): Data to include in the request body.
         """
-        http_req = HTTPRequest(host=host)
-        request = http_req.build_request(
-            file=file, method=method, params=params, data=data
+        self.start_trace(method, file)
+
+        request = self.build_request(
+            host, file=file, method=method, params=params, data=data
         )
+        self.trace_phase("build")
 
         if self.debug:
             print(
@@ -188,6 +362,31 @@ class TCPClient(Client):
             print(request)
 
         self.send(request)
+        self.trace_phase("send")
+
+    def pipeline(self, expressions: list, host: str = "127.0.0.1") -> list:
+        """Evaluate expressions with one request each, sent all at once.
+
+        The requests are pipelined: they are written before any response is
+        read, so the server answers them back to back.
+
+        Args:
+            expressions (list): The expressions, e.g. ["+ 1 2", "* 3 4"].
+            host (str): The server's hostname or IP address.
+
+        Returns:
+            list: The result of every expression in order, or False if it is
+            invalid.
+        """
+        requests = [
+            self.build_request(
+                host, method="POST", params={"expression": expression}
+            ).encode()
+            for expression in expressions
+        ]
+        self.send_all(requests)
+
+        return [self.result() for _ in expressions]
 
     def receive(self) -> str:
         """Receive a response from the server.
@@ -195,20 +394,143 @@ class TCPClient(Client):
         Returns:
             str: The received response.
         """
-        chunk = self.client_socket.recv(self.buffer_size)
+        parser = HTTPParser()
+        length = parser.message_length(self.pending) if self.pending else None
 
-        if chunk == b"":
-            raise RuntimeError("Connection broken")
+        # Read until the Content-Length of the response is satisfied
+        while length is None:
+            chunk = self.client_socket.recv(self.buffer_size)
+
+            if chunk == b"":
+                raise RuntimeError("Connection broken")
+
+            self.pending += chunk
+            length = parser.message_length(self.pending)
+
+        chunk, self.pending = self.pending[:length], self.pending[length:]
 
         if self.debug:
             print(
                 "\n{}{}Received response:{}\n{}".format(
-                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, chunk.decode()
+                    bcolors.BOLD,
+                    bcolors.OKBLUE,
+                    bcolors.ENDC,
+                    chunk.decode(errors="replace"),
                 )
             )
 
         return chunk
 
+    def stream_batch(self, expressions: list, host: str = "127.0.0.1"):
+        """Evaluate expressions in one request, yielding results as they come.
+
+        The server streams the results with chunked transfer encoding, so the
+        first one arrives as soon as it is evaluated.
+
+        Args:
+            expressions (list): The expressions, e.g. ["+ 1 2", "* 3 4"].
+            host (str): The server's hostname or IP address.
+
+        Yields:
+            str: The result of every expression in order, or False if it is
+            invalid.
+
+        Raises:
+            RuntimeError: If the server rejects the batch, closes the
+                connection or sends malformed chunks.
+        """
+        self.http_send(
+            host=host,
+            file="/batch/stream",
+            method="POST",
+            params={"expression": expressions},
+        )
+
+        # Read the header, then decode the body as it arrives
+        while b"\r\n\r\n" not in self.pending:
+            chunk = self.client_socket.recv(self.buffer_size)
+
+            if chunk == b"":
+                raise RuntimeError("Connection broken")
+
+            self.pending += chunk
+
+        header, _, data = self.pending.partition(b"\r\n\r\n")
+        self.pending = b""
+        self.trace_phase("receive")
+
+        if not header.startswith(b"HTTP/1.1 200"):
+            raise RuntimeError("Batch request rejected")
+
+        decoder = ChunkedDecoder()
+        lines = b""
+
+        # Compressed chunks are decompressed as they arrive
+        decompressor = None
+        if b"content-encoding" in header.lower():
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+        while True:
+            try:
+                body = decoder.feed(data)
+            except ValueError as exc:
+                raise RuntimeError("Malformed chunked response") from exc
+
+            if decompressor is None:
+                lines += body
+            else:
+                lines += decompressor.decompress(body)
+
+            *complete, lines = lines.split(b"\n")
+
+            for line in complete:
+                status, _, value = line.decode().partition(" ")
+                yield value if status == "200" else False
+
+            if decoder.done:
+                break
+
+            data = self.client_socket.recv(self.buffer_size)
+
+            if data == b"":
+                raise RuntimeError("Connection broken")
+
+        # Keep what followed the response for the next one
+        self.pending = bytes(decoder.buffer)
+        self.finish_trace("stream")
+
+    def binary_evaluate(self, expression: str) -> str:
+        """Evaluate an expression with the binary protocol.
+
+        The whole connection uses binary framing once this is called.
+
+        Args:
+            expression (str): The expression, e.g. "+ 1 2".
+
+        Returns:
+            str: The result, or False if the expression is invalid.
+        """
+        frame = self.binary_request(expression)
+
+        if frame is None:
+            return False
+
+        self.client_socket.sendall(frame)
+
+        while True:
+            frames, self.pending = binary.split_frames(self.pending)
+            result = self.binary_response(frames)
+
+            if result is not None:
+                return result
+
+            chunk = self.client_socket.recv(self.buffer_size)
+
+            if chunk == b"":
+                raise RuntimeError("Connection broken")
+
+            self.pending += chunk
+
 
 class UDPReliableClient(Client):
     """Reliable UDP Client for communicating with a server.
@@ -216,8 +538,16 @@ class UDPReliableClient(Client):
     Args:
         buffer_size (int): Size of the buffer for receiving data.
         server_port (int): The port number to bind the client socket.
-        server_addr (str): The address to bind the client socket.
+        server_addr (str): The address to bind the client socket. A Unix
+            domain socket path talks to servers listening on a path.
         debug (bool): Enable or disable debug mode.
+        impairment (Impairment): Impairment of received packets. Defaults to None.
+        transport: Factory of the client's socket. Defaults to ``socket``.
+        fragmented (bool): Split requests and reassemble responses larger than
+            ``buffer_size``. Defaults to False.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest request body compressed, also
+            accepting compressed responses, or None. Defaults to None.
     """
 
     def __init__(
@@ -226,17 +556,35 @@ class UDPReliableClient(Client):
         server_port: int = 50321,
         server_addr: int = "127.0.0.1",
         debug: bool = False,
+        impairment: Impairment = None,
+        transport=socket,
+        fragmented: bool = False,
+        tracer: Tracer = None,
+        compress_min_size: int = None,
     ):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_socket = transport.socket(
+            address_family(server_addr), socket.SOCK_DGRAM
+        )
 
         self.server_port = server_port
         self.server_addr = server_addr
 
-        self.server_socket.bind((server_addr, server_port))
+        if is_unix_path(server_addr):
+            remove_stale_socket(server_addr)
+
+        self.server_socket.bind(socket_address(server_addr, server_port))
+
+        if impairment is not None:
+            self.server_socket = ImpairedSocket(self.server_socket, inbound=impairment)
 
         self.MAX_TIMEOUT = 2.0
 
-        super().__init__(buffer_size, debug)
+        self.fragmented = fragmented
+        self.message_id = random.getrandbits(32)
+        self.reassembler = fragment.Reassembler()
+        self.fragments = []
+
+        super().__init__(buffer_size, debug, transport, tracer, compress_min_size)
 
     def send(self, message: str = None, host: str = "127.0.0.1", port: int = 50123):
         """Send a message to the server.
@@ -250,7 +598,15 @@ class UDPReliableClient(Client):
             message = ""
         message = message.encode()
 
-        self.server_socket.sendto(message, (host, port))
+        if not self.fragmented:
+            self.server_socket.sendto(message, socket_address(host, port))
+            return
+
+        self.message_id = (self.message_id + 1) & 0xFFFFFFFF
+        self.fragments = fragment.fragment(message, self.message_id, self.buffer_size)
+
+        for datagram in self.fragments:
+            self.server_socket.sendto(datagram, socket_address(host, port))
 
     def http_send(
         self,
@@ -271,10 +627,12 @@ class UDPReliableClient(Client):
             params (dict): Query parameters for the request.
             data (str): Data to include in the request body.
         """
-        http_req = HTTPRequest(host=host)
-        request = http_req.build_request(
-            file=file, method=method, params=params, data=data
+        self.start_trace(method, file)
+
+        request = self.build_request(
+            host, file=file, method=method, params=params, data=data
         )
+        self.trace_phase("build")
 
         if self.debug:
             print(
@@ -285,6 +643,7 @@ class UDPReliableClient(Client):
             print(request)
 
         self.send(message=request, host=host, port=port)
+        self.trace_phase("send")
 
     def receive(self) -> str:
         """Receive a response from the server.
@@ -294,18 +653,69 @@ class UDPReliableClient(Client):
         """
         data, addr = self.server_socket.recvfrom(self.buffer_size)
 
+        # Collect fragments of the current response, resending requested ones
+        while self.fragmented and fragment.is_fragment(data):
+            kind, message_id, index, count, body = fragment.parse(data)
+
+            if message_id == self.message_id:
+                if kind == fragment.NACK:
+                    requested = set(body)
+                    for i, datagram in enumerate(self.fragments):
+                        if not requested or i in requested:
+                            self.server_socket.sendto(datagram, addr)
+                else:
+                    message = self.reassembler.add(message_id, index, count, body)
+                    if message is not None:
+                        data = message
+                        break
+
+            data, addr = self.server_socket.recvfrom(self.buffer_size)
+
         if data == b"":
             raise RuntimeError("Connection broken")
 
-        else:
+        elif self.debug:
             print(
                 "\n{}{}Received response:{}\n{}".format(
-                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, data.decode()
+                    bcolors.BOLD,
+                    bcolors.OKBLUE,
+                    bcolors.ENDC,
+                    data.decode(errors="replace"),
                 )
             )
 
         return data
 
+    def binary_evaluate(
+        self, expression: str, host: str = "127.0.0.1", port: int = 50123
+    ) -> str:
+        """Evaluate an expression with the binary protocol.
+
+        Args:
+            expression (str): The expression, e.g. "+ 1 2".
+            host (str): The server's hostname or IP address.
+            port (int): The server's port number.
+
+        Returns:
+            str: The result, or False if the expression is invalid.
+        """
+        frame = self.binary_request(expression)
+
+        if frame is None:
+            return False
+
+        self.server_socket.sendto(frame, socket_address(host, port))
+
+        while True:
+            data, addr = self.server_socket.recvfrom(self.buffer_size)
+
+            # Skip answers to earlier requests
+            if data[:1] == binary.MAGIC:
+                result = self.binary_response(binary.split_frames(data)[0])
+
+                if result is not None:
+                    return result
+
 
 class UDPUnreliableClient(Client):
     """Unreliable UDP Client for communicating with a server.
@@ -313,9 +723,17 @@ class UDPUnreliableClient(Client):
     Args:
         buffer_size (int): Size of the buffer for receiving data.
         server_port (int): The port number to bind the client socket.
-        server_addr (str): The address to bind the client socket.
+        server_addr (str): The address to bind the client socket. A Unix
+            domain socket path talks to servers listening on a path.
         debug (bool): Enable or disable debug mode.
         max_timeout (float): Maximum timeout for retries.
+        impairment (Impairment): Impairment of received packets. Defaults to None.
+        transport: Factory of the client's socket. Defaults to ``socket``.
+        fragmented (bool): Split requests and reassemble responses larger than
+            ``buffer_size``, retransmitting only lost fragments. Defaults to False.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest request body compressed, also
+            accepting compressed responses, or None. Defaults to None.
     """
 
     def __init__(
@@ -325,17 +743,34 @@ class UDPUnreliableClient(Client):
         server_addr: int = "127.0.0.1",
         debug: bool = False,
         max_timeout: float = 2.0,
+        impairment: Impairment = None,
+        transport=socket,
+        fragmented: bool = False,
+        tracer: Tracer = None,
+        compress_min_size: int = None,
     ):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server_socket = transport.socket(
+            address_family(server_addr), socket.SOCK_DGRAM
+        )
 
         self.server_port = server_port
         self.server_addr = server_addr
 
-        self.server_socket.bind((server_addr, server_port))
+        if is_unix_path(server_addr):
+            remove_stale_socket(server_addr)
+
+        self.server_socket.bind(socket_address(server_addr, server_port))
+
+        if impairment is not None:
+            self.server_socket = ImpairedSocket(self.server_socket, inbound=impairment)
 
         self.max_timeout = max_timeout
 
-        super().__init__(buffer_size, debug)
+        self.fragmented = fragmented
+        self.message_id = random.getrandbits(32)
+        self.reassembler = fragment.Reassembler()
+
+        super().__init__(buffer_size, debug, transport, tracer, compress_min_size)
 
     def send(
         self,
@@ -354,7 +789,7 @@ class UDPUnreliableClient(Client):
             message = ""
         message = message.encode()
 
-        self.server_socket.sendto(message, (host, port))
+        self.server_socket.sendto(message, socket_address(host, port))
 
     def http_req(
         self,
@@ -381,10 +816,15 @@ class UDPUnreliableClient(Client):
         Raises:
             TimeoutException: If the maximum timeout is exceeded.
         """
-        http_req = HTTPRequest(host=host)
-        request = http_req.build_request(
-            file=file, method=method, params=params, data=data
+        self.start_trace(method, file)
+
+        request = self.build_request(
+            host, file=file, method=method, params=params, data=data
         )
+        self.trace_phase("build")
+
+        if self.fragmented:
+            return self.fragmented_req(request, host, port)
 
         current_timeout = 0.1
 
@@ -410,14 +850,121 @@ class UDPUnreliableClient(Client):
                 if data == b"":
                     raise RuntimeError("Connection broken")
                 else:
-                    print(
-                        "\n{}{}Received response:{}\n{}".format(
-                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, data.decode()
+                    message = decode_message(data)
+
+                    if self.debug:
+                        print(
+                            "\n{}{}Received response:{}\n{}".format(
+                                bcolors.BOLD,
+                                bcolors.OKBLUE,
+                                bcolors.ENDC,
+                                message,
+                            )
                         )
-                    )
-                    return self.process_response(data.decode())
+                    # Retries and the server's answer are all in this phase
+                    self.trace_phase("receive")
+
+                    result = self.process_response(message)
+                    self.finish_trace("parse")
+
+                    return result
 
             except socket.timeout:
-                print("Request timed out. Trying again...\n")
+                if self.debug:
+                    print("Request timed out. Trying again...\n")
                 current_timeout *= 2
                 continue
+
+    def fragmented_req(self, request: str, host: str, port: int):
+        """Send a fragmented request and reassemble the response.
+
+        On each timeout the client sends a NACK listing the response fragments
+        it is missing, and the server resends only those, or replies with a
+        NACK for the request fragments it is missing itself.
+
+        Args:
+            request (str): The HTTP request.
+            host (str): The server's hostname or IP address.
+            port (int): The server's port number.
+
+        Returns:
+            str: The processed response.
+
+        Raises:
+            TimeoutException: If the maximum timeout is exceeded.
+        """
+        address = socket_address(host, port)
+
+        self.message_id = (self.message_id + 1) & 0xFFFFFFFF
+        fragments = fragment.fragment(
+            request.encode(), self.message_id, self.buffer_size
+        )
+
+        if self.debug:
+            print(
+                "{}{}Sending HTTP Request in {} fragments...{}".format(
+                    bcolors.BOLD, bcolors.OKBLUE, len(fragments), bcolors.ENDC
+                )
+            )
+            print(request)
+
+        for datagram in fragments:
+            self.server_socket.sendto(datagram, address)
+
+        current_timeout = 0.1
+
+        while True:
+            if current_timeout > self.max_timeout:
+                self.reassembler.discard(self.message_id)
+                raise TimeoutException("Timeout exceeded.")
+
+            self.server_socket.settimeout(current_timeout)
+
+            try:
+                data, addr = self.server_socket.recvfrom(self.buffer_size)
+
+            except socket.timeout:
+                if self.debug:
+                    print("Request timed out. Asking for missing fragments...\n")
+
+                count, missing = self.reassembler.progress(self.message_id)
+                self.server_socket.sendto(
+                    fragment.nack(self.message_id, count, missing, self.buffer_size),
+                    address,
+                )
+                current_timeout *= 2
+                continue
+
+            # Ignore plain datagrams and fragments of earlier requests
+            if not fragment.is_fragment(data):
+                continue
+
+            kind, message_id, index, count, body = fragment.parse(data)
+
+            if message_id != self.message_id:
+                continue
+
+            if kind == fragment.NACK:
+                requested = set(body)
+                for i, datagram in enumerate(fragments):
+                    if not requested or i in requested:
+                        self.server_socket.sendto(datagram, address)
+                continue
+
+            message = self.reassembler.add(message_id, index, count, body)
+
+            if message is not None:
+                message = decode_message(message)
+
+                if self.debug:
+                    print(
+                        "\n{}{}Received response:{}\n{}".format(
+                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, message
+                        )
+                    )
+                self.trace_phase("receive")
+
+                result = self.process_response(message)
+                self.finish_trace("parse")
+
+                return result
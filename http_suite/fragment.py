@@ -0,0 +1,298 @@
+"""Fragmentation and reassembly of messages larger than a UDP datagram.
+
+Every fragment starts with an 11-byte header: a 2-byte magic, the packet kind,
+a 32-bit message ID and the 16-bit index and count of the fragment. The magic
+starts with a non-ASCII byte, so fragments are never mistaken for plain HTTP.
+
+Losses are repaired with negative acknowledgements (NACK). The client, which
+owns the retry timer, sends a NACK listing the response fragments it is
+missing; the server resends only those, or answers with a NACK listing the
+request fragments it is missing itself. A NACK with a count of zero means the
+sender knows nothing about the message and everything must be resent.
+"""
+
+import collections
+import struct
+import time
+
+MAGIC = b"\xcaF"
+
+DATA = 0
+NACK = 1
+
+HEADER = struct.Struct("!2sBIHH")
+
+MAX_FRAGMENTS = 0xFFFF
+
+
+class MessageTooLarge(ValueError):
+    """Exception raised when a message needs more than 65535 fragments."""
+
+
+def is_fragment(data: bytes) -> bool:
+    """Check whether a datagram is a fragment or a NACK.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        bool: True if the datagram carries the fragment header.
+    """
+    return len(data) >= HEADER.size and data[:2] == MAGIC
+
+
+def fragment(message: bytes, message_id: int, size: int) -> list:
+    """Split a message into datagrams of at most ``size`` bytes.
+
+    Args:
+        message (bytes): The message.
+        message_id (int): The message ID, shared by all fragments.
+        size (int): The maximum datagram size, header included.
+
+    Returns:
+        list: The datagrams, in order.
+
+    Raises:
+        MessageTooLarge: If the message needs too many fragments.
+    """
+    payload_size = size - HEADER.size
+    count = max(1, -(-len(message) // payload_size))
+
+    if count > MAX_FRAGMENTS:
+        raise MessageTooLarge("Message needs {} fragments".format(count))
+
+    view = memoryview(message)
+
+    return [
+        HEADER.pack(MAGIC, DATA, message_id, index, count)
+        + view[index * payload_size : (index + 1) * payload_size]
+        for index in range(count)
+    ]
+
+
+def nack(message_id: int, count: int, missing: list, size: int) -> bytes:
+    """Build a NACK asking for fragments to be resent.
+
+    Args:
+        message_id (int): The message ID.
+        count (int): The number of fragments of the message, or 0 if unknown.
+        missing (list): The indices to resend (every fragment if empty).
+        size (int): The maximum datagram size; extra indices are left for a
+            later NACK.
+
+    Returns:
+        bytes: The NACK datagram.
+    """
+    missing = missing[: (size - HEADER.size) // 2]
+
+    return HEADER.pack(MAGIC, NACK, message_id, 0, count) + struct.pack(
+        "!{}H".format(len(missing)), *missing
+    )
+
+
+def parse(data: bytes) -> tuple:
+    """Split a fragment or NACK into its header fields and body.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        tuple: The kind, message ID, index, count and body. The body of a NACK
+        is the list of requested indices.
+    """
+    _, kind, message_id, index, count = HEADER.unpack_from(data)
+    body = data[HEADER.size :]
+
+    if kind == NACK:
+        body = list(struct.unpack("!{}H".format(len(body) // 2), body))
+
+    return kind, message_id, index, count, body
+
+
+class _Partial:
+    """Fragments received so far for one message."""
+
+    __slots__ = ("count", "fragments", "size", "started")
+
+    def __init__(self, count: int, started: float):
+        self.count = count
+        self.fragments = {}
+        self.size = 0
+        self.started = started
+
+
+class Reassembler:
+    """Reassembles fragmented messages in bounded memory.
+
+    Incomplete messages are forgotten after ``timeout`` seconds, and the oldest
+    ones are evicted when more than ``max_messages`` or ``max_bytes`` are held.
+
+    Args:
+        max_messages (int): Maximum incomplete messages held. Defaults to 256.
+        max_bytes (int): Maximum bytes held. Defaults to 16 MiB.
+        timeout (float): Lifetime of an incomplete message in seconds.
+            Defaults to 10.0.
+        clock (callable): Time source. Defaults to ``time.monotonic``.
+    """
+
+    def __init__(
+        self,
+        max_messages: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        timeout: float = 10.0,
+        clock=time.monotonic,
+    ):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.clock = clock
+
+        self.partials = collections.OrderedDict()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.partials)
+
+    def __contains__(self, key) -> bool:
+        return key in self.partials
+
+    def discard(self, key):
+        """Forget an incomplete message.
+
+        Args:
+            key: The message key.
+        """
+        partial = self.partials.pop(key, None)
+
+        if partial is not None:
+            self.size -= partial.size
+
+    def expire(self):
+        """Forget incomplete messages older than the timeout."""
+        deadline = self.clock() - self.timeout
+
+        while self.partials:
+            key, partial = next(iter(self.partials.items()))
+            if partial.started > deadline:
+                break
+            self.discard(key)
+
+    def add(self, key, index: int, count: int, body: bytes) -> bytes:
+        """Add a fragment.
+
+        Args:
+            key: The message key, e.g. the sender's address and message ID.
+            index (int): The fragment index.
+            count (int): The number of fragments of the message.
+            body (bytes): The fragment payload.
+
+        Returns:
+            bytes: The message once every fragment arrived, otherwise None.
+        """
+        if count == 1:
+            return bytes(body)
+
+        self.expire()
+
+        partial = self.partials.get(key)
+
+        if partial is None:
+            partial = self.partials[key] = _Partial(count, self.clock())
+
+        if index >= partial.count or index in partial.fragments:
+            return None
+
+        partial.fragments[index] = bytes(body)
+        partial.size += len(body)
+        self.size += len(body)
+
+        if len(partial.fragments) == partial.count:
+            self.discard(key)
+            return b"".join(partial.fragments[i] for i in range(partial.count))
+
+        # Evict the oldest messages, possibly this one, to stay in bounds
+        while self.partials and (
+            self.size > self.max_bytes or len(self.partials) > self.max_messages
+        ):
+            self.discard(next(iter(self.partials)))
+
+        return None
+
+    def progress(self, key) -> tuple:
+        """Get the fragment count and missing indices of an incomplete message.
+
+        Args:
+            key: The message key.
+
+        Returns:
+            tuple: The count and the list of missing indices, or ``(0, [])`` if
+            no fragment of the message is held.
+        """
+        partial = self.partials.get(key)
+
+        if partial is None:
+            return 0, []
+
+        missing = [i for i in range(partial.count) if i not in partial.fragments]
+
+        return partial.count, missing
+
+
+class SentMessages:
+    """Recently sent fragments kept for selective retransmission.
+
+    Args:
+        max_messages (int): Maximum messages kept. Defaults to 256.
+        timeout (float): Lifetime of a message in seconds. Defaults to 10.0.
+        clock (callable): Time source. Defaults to ``time.monotonic``.
+    """
+
+    def __init__(
+        self, max_messages: int = 256, timeout: float = 10.0, clock=time.monotonic
+    ):
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.clock = clock
+        self.messages = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def add(self, key, fragments: list):
+        """Keep the fragments of a message.
+
+        Args:
+            key: The message key.
+            fragments (list): The fragment datagrams.
+        """
+        self.messages.pop(key, None)
+        self.messages[key] = (self.clock(), fragments)
+
+        while len(self.messages) > self.max_messages:
+            self.messages.popitem(last=False)
+
+    def get(self, key, indices: list) -> list:
+        """Get fragments of a message for retransmission.
+
+        Args:
+            key: The message key.
+            indices (list): The indices to resend, or empty for all.
+
+        Returns:
+            list: The fragments, or None if the message is unknown or expired.
+        """
+        entry = self.messages.get(key)
+
+        if entry is None:
+            return None
+
+        sent_at, fragments = entry
+
+        if sent_at < self.clock() - self.timeout:
+            del self.messages[key]
+            return None
+
+        if not indices:
+            return fragments
+
+        return [fragments[i] for i in indices if i < len(fragments)]
@@ -0,0 +1,98 @@
+"""Scatter-gather writes: queued buffers sent with one system call."""
+
+import os
+import socket
+
+# Most buffers a single sendmsg call takes
+IOV_MAX = 1024
+if hasattr(os, "sysconf") and "SC_IOV_MAX" in os.sysconf_names:
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+
+# Holds partial segments back until uncorked. Linux only
+TCP_CORK = getattr(socket, "TCP_CORK", None)
+
+
+def is_tcp(sock: socket.socket) -> bool:
+    """Check whether a socket is a TCP socket, rather than a Unix domain one.
+
+    Args:
+        sock (socket.socket): The socket.
+
+    Returns:
+        bool: True for TCP sockets.
+    """
+    return sock.family in (socket.AF_INET, socket.AF_INET6)
+
+
+def set_nodelay(sock: socket.socket):
+    """Send small writes right away instead of waiting to fill a segment.
+
+    Writes are coalesced before they reach the socket, so Nagle's algorithm
+    would only delay the last segment of every response.
+
+    Args:
+        sock (socket.socket): A connected socket.
+    """
+    if is_tcp(sock):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def set_cork(sock: socket.socket, cork: bool):
+    """Hold back partial segments while a response is written in pieces.
+
+    Uncorking sends what is held back at once. Does nothing where TCP_CORK is
+    not available.
+
+    Args:
+        sock (socket.socket): A connected socket.
+        cork (bool): True to cork, False to uncork.
+    """
+    if TCP_CORK is not None and is_tcp(sock):
+        sock.setsockopt(socket.IPPROTO_TCP, TCP_CORK, int(cork))
+
+
+def send_buffers(sock: socket.socket, buffers: list) -> int:
+    """Write buffers in order with one system call.
+
+    Sockets without ``sendmsg`` send the buffers joined instead.
+
+    Args:
+        sock (socket.socket): The socket.
+        buffers (list): The bytes or memoryviews to send, at least one.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        BlockingIOError: If a non-blocking socket cannot take more data.
+    """
+    if len(buffers) == 1:
+        return sock.send(buffers[0])
+
+    if not hasattr(sock, "sendmsg"):
+        return sock.send(b"".join(buffers))
+
+    return sock.sendmsg(buffers[:IOV_MAX])
+
+
+def advance(buffers, sent: int):
+    """Drop what was written from the front of a queue of buffers.
+
+    A buffer written in part is replaced by a memoryview of its rest, so the
+    bytes left are never copied. The queue stops at the first item that is
+    not a buffer, such as a file to send.
+
+    Args:
+        buffers (collections.deque): The queue.
+        sent (int): The number of bytes written.
+    """
+    while buffers and isinstance(buffers[0], (bytes, memoryview)):
+        size = len(buffers[0])
+
+        if sent < size:
+            if sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
+            return
+
+        sent -= size
+        buffers.popleft()
@@ -1,8 +1,19 @@
 """HTTP Requests and Responses."""
 
+import os
 import urllib
+import zlib
 from email.utils import formatdate
 
+# Content codings supported, in order of preference
+ENCODINGS = ("gzip", "deflate")
+
+# Smaller bodies are sent as they are: compressing them saves next to nothing
+COMPRESS_MIN_SIZE = 1024
+
+# Largest body decompressed, so a small message cannot expand without bound
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
 
 class Status406(SystemError):
     """Custom exception for HTTP 406 Not Acceptable status."""
@@ -10,37 +21,320 @@ class Status406(SystemError):
     pass
 
 
+def content_length(body: str) -> str:
+    """Build the Content-Length header of a message body.
+
+    The body is followed by a line break, which counts towards its length.
+
+    Args:
+        body (str): The body, or None for a message without one.
+
+    Returns:
+        str: The header line.
+    """
+    if body is None:
+        return "Content-Length: 0\r\n"
+
+    return "Content-Length: {}\r\n".format(len(str(body).encode()) + 2)
+
+
+def encode_chunk(data: bytes) -> bytes:
+    """Frame data as one chunk of a chunked transfer-encoded body.
+
+    Args:
+        data (bytes): The chunk data, which must not be empty.
+
+    Returns:
+        bytes: The chunk size in hex, the data and their line breaks.
+    """
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+# The zero-size chunk ending a chunked body, without trailers
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def chunk_size(line: bytes) -> int:
+    """Read the size of a chunk from its size line.
+
+    Args:
+        line (bytes): The line before the chunk data, without its line break.
+
+    Returns:
+        int: The size of the chunk data.
+
+    Raises:
+        ValueError: If the size is not a hexadecimal number.
+    """
+    size = line.split(b";")[0].strip()
+
+    if not size or size.strip(b"0123456789abcdefABCDEF"):
+        raise ValueError("Invalid chunk size: {!r}".format(bytes(size)))
+
+    return int(size, 16)
+
+
+def compressor(encoding: str):
+    """Create a compressor producing a body in a content coding.
+
+    HTTP's "deflate" is the zlib format, not raw deflate.
+
+    Args:
+        encoding (str): "gzip" or "deflate".
+
+    Returns:
+        zlib.Compress: The compressor.
+    """
+    wbits = zlib.MAX_WBITS | 16 if encoding == "gzip" else zlib.MAX_WBITS
+
+    return zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+
+def negotiate_encoding(accept: str) -> str:
+    """Choose the content coding of a response from an Accept-Encoding header.
+
+    Args:
+        accept (str): The header value, e.g. "gzip;q=0.8, deflate".
+
+    Returns:
+        str: The supported coding with the highest quality, gzip on ties, or
+        None if the client accepts none of them.
+    """
+    qualities = {}
+
+    for item in accept.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if coding == "*":
+            for encoding in ENCODINGS:
+                qualities.setdefault(encoding, quality)
+        elif coding in ENCODINGS:
+            qualities[coding] = quality
+
+    best = None
+
+    for encoding in ENCODINGS:
+        if qualities.get(encoding, 0.0) > qualities.get(best, 0.0):
+            best = encoding
+
+    return best
+
+
+def compress_message(message: str, encoding: str, min_size: int = COMPRESS_MIN_SIZE):
+    """Compress the body of an HTTP message with a Content-Length.
+
+    Args:
+        message (str): The message.
+        encoding (str): "gzip" or "deflate".
+        min_size (int): Smallest body compressed, in bytes. Defaults to 1024.
+
+    Returns:
+        str or CompressedMessage: The message as it is if its body is smaller
+        than ``min_size``, or else the message with its body compressed.
+    """
+    header, separator, body = message.partition("\r\n\r\n")
+    data = body.encode()
+
+    if not separator or len(data) < min_size:
+        return message
+
+    engine = compressor(encoding)
+    data = engine.compress(data) + engine.flush()
+
+    lines = [
+        line
+        for line in header.split("\r\n")
+        if not line.lower().startswith("content-length:")
+    ]
+    lines.append("Content-Encoding: {}".format(encoding))
+    lines.append("Content-Length: {}".format(len(data)))
+
+    return CompressedMessage("\r\n".join(lines) + "\r\n\r\n", data)
+
+
+def decode_message(data: bytes) -> str:
+    """Decode a received HTTP message, decompressing its body if it is encoded.
+
+    The Content-Encoding header is removed and the Content-Length header set
+    to the size of the decompressed body. A chunked body is decompressed into
+    a single chunk.
+
+    Args:
+        data (bytes): The message.
+
+    Returns:
+        str: The message as if it was sent without compression.
+
+    Raises:
+        ValueError: If the coding is not supported, the body is corrupt, or it
+            decompresses to more than ``MAX_DECOMPRESSED_SIZE`` bytes.
+    """
+    header_end = data.find(b"\r\n\r\n")
+
+    if header_end == -1 or b"content-encoding" not in data[:header_end].lower():
+        return data.decode()
+
+    encoding = None
+    chunked = False
+    lines = []
+
+    for line in data[:header_end].decode().split("\r\n"):
+        field, _, value = line.partition(":")
+        field = field.strip().lower()
+
+        if field == "content-encoding":
+            encoding = value.strip().lower()
+            continue
+
+        if field == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+        elif field == "content-length":
+            continue
+
+        lines.append(line)
+
+    if encoding not in ENCODINGS:
+        raise ValueError("Unsupported content coding: {}".format(encoding))
+
+    body = data[header_end + 4 :]
+
+    if chunked:
+        body = ChunkedDecoder().feed(body)
+
+    # Detects the gzip or zlib header itself
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32)
+
+    try:
+        body = decompressor.decompress(body, MAX_DECOMPRESSED_SIZE)
+    except zlib.error as exc:
+        raise ValueError("Corrupt {} body".format(encoding)) from exc
+
+    if decompressor.unconsumed_tail:
+        raise ValueError("Decompressed body too large")
+
+    if chunked:
+        body = (encode_chunk(body) if body else b"") + LAST_CHUNK
+    else:
+        lines.append("Content-Length: {}".format(len(body)))
+
+    return "\r\n".join(lines) + "\r\n\r\n" + body.decode()
+
+
+class CompressedMessage:
+    """HTTP message whose body was compressed, so it is held as bytes.
+
+    Attributes:
+        header (str): The header, up to the blank line.
+        body (bytes): The compressed body.
+    """
+
+    def __init__(self, header: str, body: bytes):
+        self.header = header
+        self.body = body
+
+    def __str__(self) -> str:
+        return "{}<{} compressed bytes>".format(self.header, len(self.body))
+
+    def encode(self) -> bytes:
+        """Produce the whole message.
+
+        Returns:
+            bytes: The header and the compressed body.
+        """
+        return self.header.encode() + self.body
+
+
+class ChunkedDecoder:
+    """Incremental decoder of a chunked transfer-encoded body.
+
+    Attributes:
+        done (bool): Whether the last chunk was received.
+        buffer (bytearray): Bytes not decoded yet, or received after the body
+            once it is done.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> bytes:
+        """Decode received bytes.
+
+        Args:
+            data (bytes): The bytes received.
+
+        Returns:
+            bytes: The body data of the chunks completed by these bytes.
+        
+        Raises:
+            ValueError: If a chunk size is not a hexadecimal number.
+        """
+        self.buffer += data
+        body = bytearray()
+
+        while not self.done:
+            line_end = self.buffer.find(b"\r\n")
+
+            if line_end == -1:
+                break
+
+            size = chunk_size(self.buffer[:line_end])
+            end = line_end + 2 + size
+
+            if len(self.buffer) < end + 2:
+                break
+
+            body += self.buffer[line_end + 2 : end]
+            del self.buffer[: end + 2]
+            self.done = size == 0
+
+        return bytes(body)
+
+
 class HTTPRequest:
     """Class for building HTTP requests.
 
     Args:
         host (str): The host address for the HTTP request. Defaults to "127.0.0.1".
+        accept_encoding (str): Content codings the client accepts in responses,
+            e.g. "gzip, deflate". Defaults to None, sending no Accept-Encoding.
     """
 
-    def __init__(self, host: str = "127.0.0.1"):
+    def __init__(self, host: str = "127.0.0.1", accept_encoding: str = None):
         self.http_version = "HTTP/1.1"
         self.server = "calculator/0.1"
         self.host = host
         self.content_type = "text/plain"
+        self.accept_encoding = accept_encoding
+
+        fields = "Host: {host}\r\nContent-Type: {content_type}\r\n".format(
+            host=self.host, content_type=self.content_type
+        )
+        if accept_encoding is not None:
+            fields += "Accept-Encoding: {}\r\n".format(accept_encoding)
+
+        # Braces of the fields are escaped for the file formatted in later
+        fields = fields.replace("{", "{{").replace("}", "}}")
 
         self.post_header_template = (
-            "POST {{file}} {http_version}\r\n"
-            "Host: {host}\r\n"
-            "Content-Type: {content_type}\r\n"
-        ).format(
-            http_version=self.http_version,
-            host=self.host,
-            content_type=self.content_type,
+            "POST {{file}} {http_version}\r\n".format(http_version=self.http_version)
+            + fields
         )
 
         self.get_header_template = (
-            "GET {{file}} {http_version}\r\n"
-            "Host: {host}\r\n"
-            "Content-Type: {content_type}\r\n"
-        ).format(
-            http_version=self.http_version,
-            host=self.host,
-            content_type=self.content_type,
+            "GET {{file}} {http_version}\r\n".format(http_version=self.http_version)
+            + fields
         )
 
     def __build_post(self, params: dict, data: str, file: str) -> str:
@@ -48,7 +342,7 @@ class HTTPRequest:
 
         Args:
             params (dict): Parameters to include in the request body.
-            data (str): Additional data for the request.
+            data (str): Raw body, sent when there are no parameters.
             file (str): The file path for the request.
 
         Returns:
@@ -57,10 +351,12 @@ class HTTPRequest:
         request = self.post_header_template.format(file=file)
 
         if params is not None:
-            body = urllib.parse.urlencode(params)
-            request += "\r\n{}\r\n".format(body)
+            body = urllib.parse.urlencode(params, doseq=True)
+            request += content_length(body) + "\r\n{}\r\n".format(body)
+        elif data is not None:
+            request += content_length(data) + "\r\n{}\r\n".format(data)
         else:
-            request += "\r\n"
+            request += content_length(None) + "\r\n"
 
         return request
 
@@ -78,10 +374,10 @@ class HTTPRequest:
         request = self.get_header_template.format(file=file)
 
         if params is not None:
-            body = urllib.parse.urlencode(params)
-            request += "\r\n{}\r\n".format(body)
+            body = urllib.parse.urlencode(params, doseq=True)
+            request += content_length(body) + "\r\n{}\r\n".format(body)
         else:
-            request += "\r\n"
+            request += content_length(None) + "\r\n"
 
         return request
 
@@ -116,20 +412,26 @@ class HTTPResponse:
 
     def __init__(self):
         self.http_version = "HTTP/1.1"
-        self.status_codes = {200: "200 OK", 406: "406 Not Acceptable"}
+        self.status_codes = {
+            200: "200 OK",
+            202: "202 Accepted",
+            404: "404 Not Found",
+            406: "406 Not Acceptable",
+            429: "429 Too Many Requests",
+            503: "503 Service Unavailable",
+        }
         self.content_type = "text/plain"
         self.server = "calculator/0.1"
 
         self.response_header_template = (
             "{version} {{status}}\r\n"
             "Date: {{date}}\r\n"
-            "Content-Type: {content_type}\r\n"
+            "Content-Type: {{content_type}}\r\n"
             "Server: {server}\r\n"
             "Connection: close\r\n"
         ).format(
             version=self.http_version,
             server=self.server,
-            content_type=self.content_type,
         )
 
     def __gmt_date(self):
@@ -140,52 +442,153 @@ class HTTPResponse:
         """
         return formatdate(timeval=None, localtime=False, usegmt=True)
 
-    def __build_200(self, data: str = None) -> str:
+    def __build_200(self, data: str = None, content_type: str = None) -> str:
         """Build a 200 OK HTTP response.
 
         Args:
             data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
 
         Returns:
             str: The constructed 200 OK response.
         """
         response = self.response_header_template.format(
-            status=self.status_codes[200], date=self.__gmt_date(), data=data
+            status=self.status_codes[200],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+
+        if data is not None:
+            response += content_length(data) + "\r\n{}\r\n".format(data)
+        else:
+            response += content_length(None) + "\r\n"
+
+        return response
+
+    def __build_202(self, data: str = None, content_type: str = None) -> str:
+        """Build a 202 Accepted HTTP response.
+
+        Args:
+            data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            str: The constructed 202 Accepted response.
+        """
+        response = self.response_header_template.format(
+            status=self.status_codes[202],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
         )
 
         if data is not None:
-            response += "\r\n{}\r\n".format(data)
+            response += content_length(data) + "\r\n{}\r\n".format(data)
         else:
-            response += "\r\n"
+            response += content_length(None) + "\r\n"
 
         return response
 
-    def __build_406(self, data: str = None) -> str:
+    def __build_404(self, data: str = None, content_type: str = None) -> str:
+        """Build a 404 Not Found HTTP response.
+
+        Args:
+            data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            str: The constructed 404 Not Found response.
+        """
+        response = self.response_header_template.format(
+            status=self.status_codes[404],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+
+        if data is not None:
+            response += content_length(data) + "\r\n{}\r\n".format(data)
+        else:
+            response += content_length(None) + "\r\n"
+
+        return response
+
+    def __build_406(self, data: str = None, content_type: str = None) -> str:
         """Build a 406 Not Acceptable HTTP response.
 
         Args:
             data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
 
         Returns:
             str: The constructed 406 Not Acceptable response.
         """
         response = self.response_header_template.format(
-            status=self.status_codes[406], date=self.__gmt_date(), data=data
+            status=self.status_codes[406],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+
+        if data is not None:
+            response += content_length(data) + "\r\n{}\r\n".format(data)
+        else:
+            response += content_length(None) + "\r\n"
+
+        return response
+
+    def __build_429(self, data: str = None, content_type: str = None) -> str:
+        """Build a 429 Too Many Requests HTTP response.
+
+        Args:
+            data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            str: The constructed 429 Too Many Requests response.
+        """
+        response = self.response_header_template.format(
+            status=self.status_codes[429],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+
+        if data is not None:
+            response += content_length(data) + "\r\n{}\r\n".format(data)
+        else:
+            response += content_length(None) + "\r\n"
+
+        return response
+
+    def __build_503(self, data: str = None, content_type: str = None) -> str:
+        """Build a 503 Service Unavailable HTTP response.
+
+        Args:
+            data (str): The response body data. Defaults to None.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            str: The constructed 503 Service Unavailable response.
+        """
+        response = self.response_header_template.format(
+            status=self.status_codes[503],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
         )
 
         if data is not None:
-            response += "\r\n{}\r\n".format(data)
+            response += content_length(data) + "\r\n{}\r\n".format(data)
         else:
-            response += "\r\n"
+            response += content_length(None) + "\r\n"
 
         return response
 
-    def build_response(self, data: str = None, status: int = 200) -> str:
+    def build_response(
+        self, data: str = None, status: int = 200, content_type: str = None
+    ) -> str:
         """Build an HTTP response.
 
         Args:
             data (str): The response body data. Defaults to None.
             status (int): The HTTP status code. Defaults to 200.
+            content_type (str): The body's media type. Defaults to "text/plain".
 
         Returns:
             str: The constructed HTTP response.
@@ -193,12 +596,320 @@ class HTTPResponse:
         response = ""
 
         if status == 200:
-            response = self.__build_200(data)
+            response = self.__build_200(data, content_type)
+        elif status == 202:
+            response = self.__build_202(data, content_type)
+        elif status == 404:
+            response = self.__build_404(data, content_type)
         elif status == 406:
-            response = self.__build_406(data)
+            response = self.__build_406(data, content_type)
+        elif status == 429:
+            response = self.__build_429(data, content_type)
+        elif status == 503:
+            response = self.__build_503(data, content_type)
 
         return response
 
+    def build_stream_response(self, pieces, content_type: str = None):
+        """Build a 200 OK HTTP response with a chunked body.
+
+        Args:
+            pieces: Iterable producing the body as strings.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            StreamResponse: The response.
+        """
+        header = self.response_header_template.format(
+            status=self.status_codes[200],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+        header += "Transfer-Encoding: chunked\r\n\r\n"
+
+        return StreamResponse(header, pieces)
+
+    def build_file_response(self, path: str, content_type: str = None):
+        """Build a 200 OK HTTP response whose body is read from files.
+
+        Args:
+            path (str or list): The file, or the files to concatenate.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            FileResponse: The response.
+        """
+        paths = [path] if isinstance(path, str) else list(path)
+        size = sum(os.path.getsize(path) for path in paths)
+
+        header = self.response_header_template.format(
+            status=self.status_codes[200],
+            date=self.__gmt_date(),
+            content_type=content_type or self.content_type,
+        )
+        header += "Content-Length: {}\r\n\r\n".format(size)
+
+        return FileResponse(header, paths, size)
+
+
+class StreamResponse:
+    """HTTP response with a chunked body produced while it is sent.
+
+    Stream servers send the pieces as they are produced, a few per chunk, so
+    the body is never held in memory. ``encode`` produces it all at once for
+    the others.
+
+    Attributes:
+        header (str): The response header, up to the blank line.
+        pieces: Iterator over the body, as strings.
+    """
+
+    def __init__(self, header: str, pieces):
+        self.header = header
+        self.pieces = iter(pieces)
+        self.compressor = None
+
+    def __str__(self) -> str:
+        return "{}<streamed body>".format(self.header)
+
+    def compress(self, encoding: str):
+        """Compress the body as it is produced.
+
+        Every chunk is flushed from the compressor, so it can be decompressed
+        as soon as it arrives.
+
+        Args:
+            encoding (str): "gzip" or "deflate".
+        """
+        self.compressor = compressor(encoding)
+        self.header = "{}Content-Encoding: {}\r\n\r\n".format(
+            self.header[:-2], encoding
+        )
+
+    def frame(self, data: bytes, last: bool = False) -> bytes:
+        """Frame body data as a chunk, compressing it if the body is.
+
+        Args:
+            data (bytes): The body data, empty only for the last chunk.
+            last (bool): Whether the body ends with this data. Defaults to False.
+
+        Returns:
+            bytes: The chunk, followed by the last chunk if the body ends.
+        """
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(
+                zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+            )
+
+        chunk = encode_chunk(data) if data else b""
+
+        return chunk + LAST_CHUNK if last else chunk
+
+    def encode(self) -> bytes:
+        """Produce the whole response.
+
+        Returns:
+            bytes: The header and the body in one chunk.
+        """
+        data = bytearray()
+
+        for piece in self.pieces:
+            data += piece.encode()
+
+        return self.header.encode() + self.frame(bytes(data), last=True)
+
+    def close(self):
+        """Stop producing the body, e.g. when the client went away."""
+        if hasattr(self.pieces, "close"):
+            self.pieces.close()
+
+
+class FileResponse:
+    """HTTP response whose body is only read from its files when sent.
+
+    Stream servers send the files with ``os.sendfile``, without copying them
+    through user space. ``encode`` reads them into memory for the others.
+
+    Attributes:
+        header (str): The response header, up to the blank line.
+        paths (list): The files making up the body, in order.
+        size (int): The body size in bytes.
+    """
+
+    def __init__(self, header: str, paths: list, size: int):
+        self.header = header
+        self.paths = paths
+        self.size = size
+
+    def __str__(self) -> str:
+        return "{}<{} bytes from {} file(s)>".format(
+            self.header, self.size, len(self.paths)
+        )
+
+    def encode(self) -> bytes:
+        """Read the whole response.
+
+        Returns:
+            bytes: The header and the body.
+        """
+        response = bytearray(self.header.encode())
+
+        for path in self.paths:
+            with open(path, "rb") as body:
+                response += body.read()
+
+        return bytes(response)
+
+
+def parse_fields(head: str) -> dict:
+    """Parse the header fields of a message header.
+
+    Args:
+        head (str): The header, from the start line to the blank line.
+
+    Returns:
+        dict: The header fields and their values.
+    """
+    fields = {}
+
+    for line in head.split("\r\n")[1:]:
+        field, colon, value = line.partition(":")
+
+        if colon:
+            fields[field.strip()] = value.strip()
+
+    return fields
+
+
+class Request:
+    """A parsed HTTP request.
+
+    The request line and the body are split off when the request is read. The
+    header fields and the query parameters are only parsed on first access,
+    so requests whose headers are never read never pay for them. Items can
+    also be read like the dicts of ``HTTPParser.parse_request``, e.g.
+    ``request["params"]``.
+
+    Args:
+        method (str): The HTTP method, e.g. "POST".
+        file (str): The file path.
+        head (str): The header, from the request line to the blank line.
+        body (str): The body, without its trailing line break.
+    """
+
+    __slots__ = ("method", "file", "head", "body", "_fields", "_params")
+
+    def __init__(self, method: str, file: str, head: str, body: str):
+        self.method = method
+        self.file = file
+        self.head = head
+        self.body = body
+        self._fields = None
+        self._params = None
+
+    @property
+    def fields(self) -> dict:
+        """The header fields and their values."""
+        if self._fields is None:
+            self._fields = parse_fields(self.head)
+
+        return self._fields
+
+    def header(self, name: str) -> str:
+        """Get the value of a header field, found without parsing the others.
+
+        Args:
+            name (str): The field name, in any case.
+
+        Returns:
+            str: The value, or None if the request has no such field.
+        """
+        if self._fields is not None:
+            for field, value in self._fields.items():
+                if field.lower() == name.lower():
+                    return value
+            return None
+
+        start = self.head.lower().find("\r\n{}:".format(name.lower()))
+
+        if start == -1:
+            return None
+
+        end = self.head.find("\r\n", start + 2)
+
+        return self.head[start + len(name) + 3 : None if end == -1 else end].strip()
+
+    @property
+    def params(self) -> dict:
+        """The parameters of the body, each with the list of its values."""
+        if self._params is None:
+            self._params = urllib.parse.parse_qs(self.body) if self.body else {}
+
+        return self._params
+
+    def __getitem__(self, key: str):
+        if key not in ("method", "fields", "file", "params", "body"):
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def as_dict(self) -> dict:
+        """Get the request as returned by ``HTTPParser.parse_request``.
+
+        Returns:
+            dict: The method, fields, file, params and body.
+        """
+        return {
+            "method": self.method,
+            "fields": self.fields,
+            "file": self.file,
+            "params": self.params,
+            "body": self.body,
+        }
+
+
+class Response:
+    """A parsed HTTP response.
+
+    The header fields are only parsed on first access. Items can also be read
+    like the dicts of ``HTTPParser.parse_response``, e.g. ``response["data"]``.
+
+    Args:
+        status (int): The status code.
+        head (str): The header, from the status line to the blank line.
+        data (str): The body, without its trailing line break.
+    """
+
+    __slots__ = ("status", "head", "data", "_fields")
+
+    def __init__(self, status: int, head: str, data: str):
+        self.status = status
+        self.head = head
+        self.data = data
+        self._fields = None
+
+    @property
+    def fields(self) -> dict:
+        """The header fields and their values."""
+        if self._fields is None:
+            self._fields = parse_fields(self.head)
+
+        return self._fields
+
+    def __getitem__(self, key: str):
+        if key not in ("status", "fields", "data"):
+            raise KeyError(key)
+
+        return getattr(self, key)
+
+    def as_dict(self) -> dict:
+        """Get the response as returned by ``HTTPParser.parse_response``.
+
+        Returns:
+            dict: The status, fields and data.
+        """
+        return {"status": self.status, "fields": self.fields, "data": self.data}
+
 
 class HTTPParser:
     """Class to parse HTTP responses and requests."""
@@ -224,6 +935,81 @@ class HTTPParser:
 
         return fields
 
+    def message_length(self, buffer: bytes) -> int:
+        """Get the length of the first complete HTTP message in a buffer.
+
+        Chunked messages end with their last chunk. Other messages without a
+        Content-Length header end with the bytes received so far once their
+        header is complete.
+
+        Args:
+            buffer (bytes): Bytes received on a stream.
+
+        Returns:
+            int: The length of the first message, or None if it is incomplete.
+
+        Raises:
+            ValueError: If the Content-Length is not a non-negative integer, or
+                a chunk size is not a hexadecimal number.
+        """
+        header_end = buffer.find(b"\r\n\r\n")
+
+        if header_end == -1:
+            return None
+
+        header_end += 4
+        length = None
+
+        for line in buffer[:header_end].split(b"\r\n")[1:]:
+            field, _, value = line.partition(b":")
+            field = field.strip().lower()
+
+            if field == b"content-length":
+                value = value.strip()
+
+                if not value.isdigit():
+                    raise ValueError("Invalid Content-Length: {!r}".format(value))
+
+                length = int(value)
+            elif field == b"transfer-encoding" and b"chunked" in value.lower():
+                return self.chunked_length(buffer, header_end)
+
+        if length is None:
+            return len(buffer)
+
+        if len(buffer) < header_end + length:
+            return None
+
+        return header_end + length
+
+    def chunked_length(self, buffer: bytes, offset: int) -> int:
+        """Get where a chunked body ends.
+
+        Args:
+            buffer (bytes): Bytes received on a stream.
+            offset (int): Where the body starts.
+
+        Returns:
+            int: The offset after the last chunk, or None if it is incomplete.
+        
+        Raises:
+            ValueError: If a chunk size is not a hexadecimal number.
+        """
+        while True:
+            line_end = buffer.find(b"\r\n", offset)
+
+            if line_end == -1:
+                return None
+
+            size = chunk_size(buffer[offset:line_end])
+            offset = line_end + 2 + size + 2
+
+            if offset > len(buffer):
+                return None
+
+            if size == 0:
+                return offset
+
     def get_contents(self, response: str) -> str:
         """Extract the body content from an HTTP message.
 
@@ -253,6 +1039,21 @@ class HTTPParser:
         status_code = int(first_line.split(" ")[1])
         return status_code
 
+    def read_response(self, response: str) -> Response:
+        """Parse an HTTP response, leaving its header fields for later.
+
+        Args:
+            response (str): The HTTP response.
+
+        Returns:
+            Response: The response.
+        """
+        head, _, data = response.partition("\r\n\r\n")
+        line_end = head.find("\r\n")
+        line = head if line_end == -1 else head[:line_end]
+
+        return Response(int(line.split(" ")[1]), head, data.rstrip())
+
     def parse_response(self, response: str) -> dict:
         """Parse an HTTP response into its components.
 
@@ -262,11 +1063,7 @@ class HTTPParser:
         Returns:
             dict: A dictionary containing the status, fields, and data.
         """
-        return {
-            "status": self.get_status_code(response),
-            "fields": self.get_header_fields(response),
-            "data": self.get_contents(response),
-        }
+        return self.read_response(response).as_dict()
 
     def get_params(self, request: str) -> dict:
         """Extract parameters from a POST HTTP request.
@@ -306,6 +1103,26 @@ class HTTPParser:
         """
         return request.splitlines()[0].split(" ")[1]
 
+    def read_request(self, request: str) -> Request:
+        """Parse an HTTP request, leaving its fields and parameters for later.
+
+        Args:
+            request (str): The HTTP request.
+
+        Returns:
+            Request: The request, or None if it has no request line.
+        """
+        head, _, body = request.partition("\r\n\r\n")
+        line_end = head.find("\r\n")
+        line = head if line_end == -1 else head[:line_end]
+
+        parts = line.split(" ")
+
+        if len(parts) < 2:
+            return None
+
+        return Request(parts[0], parts[1], head, body.rstrip())
+
     def parse_request(self, request: str) -> dict:
         """Parse an HTTP request into its components.
 
@@ -313,14 +1130,12 @@ class HTTPParser:
             request (str): The HTTP request.
 
         Returns:
-            dict: A dictionary containing the method, fields, file, and params.
+            dict: A dictionary containing the method, fields, file, params and
+            body, or False if the request is invalid.
         """
-        try:
-            return {
-                "method": self.get_method(request),
-                "fields": self.get_header_fields(request),
-                "file": self.get_filename(request),
-                "params": self.get_params(request),
-            }
-        except Exception:
+        parsed = self.read_request(request)
+
+        if parsed is None:
             return False
+
+        return parsed.as_dict()
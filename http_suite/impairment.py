@@ -0,0 +1,387 @@
+"""Seeded network impairments: burst loss, delay, reordering and duplication."""
+
+import heapq
+import itertools
+import random
+import select
+import socket
+import time
+
+
+class GilbertElliott:
+    """Two-state Markov model of bursty packet loss.
+
+    The channel alternates between a good and a bad state. Before each packet it
+    moves from good to bad with probability ``p_good_bad`` and from bad to good
+    with probability ``p_bad_good``, then loses the packet with the loss rate of
+    its current state.
+
+    Args:
+        p_good_bad (float): Probability of entering the bad state.
+        p_bad_good (float): Probability of leaving the bad state.
+        loss_good (float): Loss rate in the good state. Defaults to 0.0.
+        loss_bad (float): Loss rate in the bad state. Defaults to 1.0.
+    """
+
+    def __init__(
+        self,
+        p_good_bad: float,
+        p_bad_good: float,
+        loss_good: float = 0.0,
+        loss_bad: float = 1.0,
+    ):
+        self.p_good_bad = p_good_bad
+        self.p_bad_good = p_bad_good
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.bad = False
+
+    def lost(self, rng: random.Random) -> bool:
+        """Advance the channel by one packet and decide whether it is lost.
+
+        Args:
+            rng (random.Random): The random number generator to draw from.
+
+        Returns:
+            bool: True if the packet is lost.
+        """
+        if self.bad:
+            self.bad = rng.random() >= self.p_bad_good
+        else:
+            self.bad = rng.random() < self.p_good_bad
+
+        return rng.random() < (self.loss_bad if self.bad else self.loss_good)
+
+
+def constant_delay(seconds: float):
+    """Delay every packet by the same amount.
+
+    Args:
+        seconds (float): The delay.
+
+    Returns:
+        callable: A delay function taking a random number generator.
+    """
+    return lambda rng: seconds
+
+
+def uniform_delay(low: float, high: float):
+    """Delay packets uniformly between two bounds.
+
+    Args:
+        low (float): The minimum delay in seconds.
+        high (float): The maximum delay in seconds.
+
+    Returns:
+        callable: A delay function taking a random number generator.
+    """
+    return lambda rng: rng.uniform(low, high)
+
+
+def normal_delay(mean: float, jitter: float):
+    """Delay packets around a mean with normally distributed jitter.
+
+    Args:
+        mean (float): The mean delay in seconds.
+        jitter (float): The standard deviation in seconds.
+
+    Returns:
+        callable: A delay function taking a random number generator.
+    """
+    return lambda rng: max(0.0, rng.gauss(mean, jitter))
+
+
+def exponential_delay(mean: float):
+    """Delay packets with an exponential distribution (long tail).
+
+    Args:
+        mean (float): The mean delay in seconds.
+
+    Returns:
+        callable: A delay function taking a random number generator.
+    """
+    return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+
+
+class Impairment:
+    """Deterministic impairment of a packet stream.
+
+    Every decision is drawn from a private generator, so the same seed and the
+    same sequence of packets always produce the same losses and delays.
+
+    Args:
+        loss (float): Independent loss probability. Defaults to 0.0.
+        burst (GilbertElliott): Burst loss model applied before ``loss``.
+        delay (callable): Delay function, e.g. ``normal_delay(0.05, 0.01)``.
+        reorder (float): Probability of holding a packet back by
+            ``reorder_gap`` so that later packets overtake it. Defaults to 0.0.
+        reorder_gap (float): Extra delay of reordered packets in seconds.
+            Defaults to 0.01.
+        duplicate (float): Probability of delivering a packet twice.
+            Defaults to 0.0.
+        bandwidth (float): Link capacity in bytes per second. Packets are
+            serialized one after the other when set. Defaults to None.
+        seed (int): Seed of the random number generator. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        loss: float = 0.0,
+        burst: GilbertElliott = None,
+        delay=None,
+        reorder: float = 0.0,
+        reorder_gap: float = 0.01,
+        duplicate: float = 0.0,
+        bandwidth: float = None,
+        seed: int = None,
+    ):
+        self.loss = loss
+        self.burst = burst
+        self.delay = delay
+        self.reorder = reorder
+        self.reorder_gap = reorder_gap
+        self.duplicate = duplicate
+        self.bandwidth = bandwidth
+        self.rng = random.Random(seed)
+
+        self.link_free_at = 0.0
+
+        self.packets = 0
+        self.dropped = 0
+        self.duplicated = 0
+        self.reordered = 0
+
+    def schedule(self, size: int, now: float) -> list:
+        """Decide the fate of a packet.
+
+        Args:
+            size (int): The packet size in bytes.
+            now (float): The time the packet was sent.
+
+        Returns:
+            list: The delivery times of the packet's copies (empty if lost).
+        """
+        self.packets += 1
+
+        if self.burst is not None and self.burst.lost(self.rng):
+            self.dropped += 1
+            return []
+
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return []
+
+        # Serialize packets on a link of limited capacity
+        if self.bandwidth:
+            self.link_free_at = max(now, self.link_free_at) + size / self.bandwidth
+            now = self.link_free_at
+
+        copies = 1
+        if self.duplicate and self.rng.random() < self.duplicate:
+            self.duplicated += 1
+            copies = 2
+
+        times = []
+
+        for _ in range(copies):
+            at = now
+
+            if self.delay is not None:
+                at += self.delay(self.rng)
+
+            if self.reorder and self.rng.random() < self.reorder:
+                self.reordered += 1
+                at += self.reorder_gap
+
+            times.append(at)
+
+        return times
+
+
+class DelayLine:
+    """Queue of items released at scheduled times."""
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push(self, at: float, item):
+        """Schedule an item.
+
+        Args:
+            at (float): The release time.
+            item: The item to release.
+        """
+        heapq.heappush(self.heap, (at, next(self.counter), item))
+
+    def next_time(self) -> float:
+        """Get the release time of the earliest item.
+
+        Returns:
+            float: The release time, or None if the queue is empty.
+        """
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float):
+        """Release the earliest item if it is due.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            The item, or None if nothing is due.
+        """
+        if self.heap and self.heap[0][0] <= now:
+            return heapq.heappop(self.heap)[2]
+
+        return None
+
+
+class ImpairedSocket:
+    """Datagram socket wrapper applying impairments to both directions.
+
+    Delayed packets wait in delay lines instead of sleeping, and ``recvfrom``
+    waits with ``select`` until either a real packet arrives or a delayed one is
+    due, so the receive loop keeps draining the socket while packets are held.
+    Delayed outgoing packets are flushed whenever the socket is used.
+
+    Args:
+        sock (socket.socket): The datagram socket to wrap.
+        inbound (Impairment): Impairment of received packets. Defaults to None.
+        outbound (Impairment): Impairment of sent packets. Defaults to None.
+        on_drop (callable): Called with ``(data, addr)`` for each lost
+            incoming packet. Defaults to None.
+        clock (callable): Time source. Defaults to ``time.monotonic``.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        inbound: Impairment = None,
+        outbound: Impairment = None,
+        on_drop=None,
+        clock=time.monotonic,
+    ):
+        self.sock = sock
+        self.inbound = inbound
+        self.outbound = outbound
+        self.on_drop = on_drop
+        self.clock = clock
+        self.timeout = sock.gettimeout()
+
+        self.received = DelayLine()
+        self.sending = DelayLine()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+    def settimeout(self, timeout: float):
+        """Set the timeout of ``recvfrom``.
+
+        Args:
+            timeout (float): The timeout in seconds, or None to block.
+        """
+        self.timeout = timeout
+
+    def gettimeout(self) -> float:
+        """Get the timeout of ``recvfrom``.
+
+        Returns:
+            float: The timeout in seconds, or None.
+        """
+        return self.timeout
+
+    def flush(self, now: float):
+        """Send every outgoing packet that is due.
+
+        Args:
+            now (float): The current time.
+        """
+        while True:
+            packet = self.sending.pop_due(now)
+            if packet is None:
+                break
+            self.sock.sendto(*packet)
+
+    def sendto(self, data: bytes, addr) -> int:
+        """Send a packet through the outbound impairment.
+
+        Args:
+            data (bytes): The packet payload.
+            addr: The destination address.
+
+        Returns:
+            int: The number of bytes accepted.
+        """
+        now = self.clock()
+
+        if self.outbound is None:
+            self.sock.sendto(data, addr)
+        else:
+            for at in self.outbound.schedule(len(data), now):
+                self.sending.push(at, (data, addr))
+
+        self.flush(now)
+
+        return len(data)
+
+    def recvfrom(self, buffer_size: int):
+        """Receive the next packet that survives the inbound impairment.
+
+        Args:
+            buffer_size (int): The maximum packet size to return.
+
+        Returns:
+            tuple: The packet payload and the sender's address.
+
+        Raises:
+            socket.timeout: If no packet is delivered before the timeout.
+        """
+        now = self.clock()
+        deadline = None if self.timeout is None else now + self.timeout
+
+        while True:
+            self.flush(now)
+
+            packet = self.received.pop_due(now)
+            if packet is not None:
+                data, addr = packet
+                return data[:buffer_size], addr
+
+            # Wake up for whichever comes first: a held packet or the timeout
+            wake = [
+                t
+                for t in (self.received.next_time(), self.sending.next_time(), deadline)
+                if t is not None
+            ]
+            wait = max(0.0, min(wake) - now) if wake else None
+
+            if deadline is not None and now >= deadline:
+                # Past the deadline, and with a zero timeout, only poll for
+                # packets the kernel already queued
+                readable, _, _ = select.select([self.sock], [], [], 0)
+
+                if not readable:
+                    raise socket.timeout("timed out")
+            else:
+                readable, _, _ = select.select([self.sock], [], [], wait)
+
+            if readable:
+                data, addr = self.sock.recvfrom(65535)
+                arrived = self.clock()
+
+                if self.inbound is None:
+                    self.received.push(arrived, (data, addr))
+                else:
+                    times = self.inbound.schedule(len(data), arrived)
+
+                    if not times and self.on_drop is not None:
+                        self.on_drop(data, addr)
+
+                    for at in times:
+                        self.received.push(at, (data, addr))
+
+            now = self.clock()
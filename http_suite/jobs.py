@@ -0,0 +1,354 @@
+"""Bulk jobs: expression files evaluated in the background by a process pool."""
+
+import collections
+import concurrent.futures
+import glob
+import json
+import os
+import shutil
+import tempfile
+import uuid
+
+from .calc import Calculator
+
+
+def evaluate_file(source: str, destination: str) -> int:
+    """Evaluate every expression of a file, one per line.
+
+    Results are written with the line format of ``POST /batch``, e.g. "200 3"
+    or "406 -1", and only appear under ``destination`` once complete. After a
+    restart, a chunk may be evaluated by the old and the new process at once:
+    both write the same results, and the first to finish removes the source.
+
+    Args:
+        source (str): Path of the expression file. It is removed afterwards.
+        destination (str): Path of the result file.
+
+    Returns:
+        int: The number of expressions evaluated.
+    """
+    calc = Calculator()
+    count = 0
+    part = "{}.{}.part".format(destination, os.getpid())
+
+    try:
+        expressions = open(source)
+    except FileNotFoundError:
+        # Evaluated by another process in the meantime
+        if os.path.exists(destination):
+            return 0
+        raise
+
+    with expressions, open(part, "w") as results:
+        for expression in expressions:
+            if not expression.strip():
+                continue
+
+            try:
+                results.write("200 {}\n".format(calc.evaluate(expression)))
+            except Exception:
+                results.write("406 -1\n")
+
+            count += 1
+
+    os.replace(part, destination)
+
+    try:
+        os.remove(source)
+    except FileNotFoundError:
+        pass
+
+    return count
+
+
+class Job:
+    """A bulk job, split into chunks evaluated independently.
+
+    Attributes:
+        id (str): The job ID.
+        expressions (int): The number of expressions submitted.
+        results (list): Paths of the result file of every chunk, in order.
+        futures (list): Futures of the chunks.
+    """
+
+    def __init__(self, id: str, expressions: int, results: list, futures: list):
+        self.id = id
+        self.expressions = expressions
+        self.results = results
+        self.futures = futures
+
+    @property
+    def status(self) -> str:
+        """str: "queued", "running", "done" or "failed"."""
+        if any(
+            future.done() and not future.cancelled() and future.exception()
+            for future in self.futures
+        ):
+            return "failed"
+
+        if all(future.done() for future in self.futures):
+            return "done"
+
+        if any(future.running() or future.done() for future in self.futures):
+            return "running"
+
+        return "queued"
+
+    def progress(self) -> dict:
+        """Get the status of the job.
+
+        Returns:
+            dict: The ID, status, number of expressions and of chunks, and
+            number of chunks done.
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "expressions": self.expressions,
+            "chunks": len(self.futures),
+            "chunks_done": sum(future.done() for future in self.futures),
+        }
+
+    def size(self) -> int:
+        """Get the size of the results of a finished job.
+
+        Returns:
+            int: The total size of the result files in bytes.
+        """
+        return sum(os.path.getsize(path) for path in self.results)
+
+
+class JobManager:
+    """Runs bulk jobs on a process pool and keeps their results on disk.
+
+    Submitted files are split into chunks of ``chunk_size`` expressions, so
+    that a single large job keeps every worker busy. Only the last
+    ``max_jobs`` jobs are kept; older ones are deleted with their files. The
+    pool and the spool directory are only created by the first job.
+
+    Every job has a manifest in the spool directory, so a process taking the
+    directory over after a restart finds the jobs of its predecessor: they
+    are loaded when first asked for, and their unfinished chunks evaluated
+    again.
+
+    Args:
+        directory (str): Spool directory of inputs and results. Defaults to a
+            new temporary directory.
+        workers (int): Worker processes. Defaults to the number of CPUs.
+        chunk_size (int): Expressions per chunk. Defaults to 100000.
+        max_jobs (int): Jobs kept. Defaults to 64.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        workers: int = None,
+        chunk_size: int = 100000,
+        max_jobs: int = 64,
+    ):
+        self.directory = directory
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_jobs = max_jobs
+
+        self.pool = None
+        self.jobs = collections.OrderedDict()
+        self.owns_directory = directory is None
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def adopt(self, directory: str):
+        """Take over the spool directory of a previous process.
+
+        Its jobs are loaded when first asked for, and the directory is removed
+        on close unless it is handed over again.
+
+        Args:
+            directory (str): The spool directory.
+        """
+        self.directory = directory
+        self.owns_directory = True
+
+    def get(self, job_id: str) -> Job:
+        """Get a job.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            Job: The job, or None if it is unknown or was deleted.
+        """
+        job = self.jobs.get(job_id)
+
+        if job is None and job_id is not None:
+            job = self.load(job_id)
+
+        return job
+
+    def path(self, job_id: str, name: str) -> str:
+        """Get the path of a file of a job in the spool directory.
+
+        Args:
+            job_id (str): The job ID.
+            name (str): The file name after the ID, e.g. "0.out".
+
+        Returns:
+            str: The path.
+        """
+        return os.path.join(self.directory, "{}.{}".format(job_id, name))
+
+    def prepare(self):
+        """Create the spool directory and the pool if not done yet."""
+        if self.pool is None:
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix="calculator-jobs-")
+            os.makedirs(self.directory, exist_ok=True)
+
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+    def submit(self, expressions: str) -> Job:
+        """Start a job.
+
+        Args:
+            expressions (str): The expression file, one expression per line.
+
+        Returns:
+            Job: The job.
+        """
+        self.prepare()
+
+        job_id = uuid.uuid4().hex
+        lines = expressions.splitlines()
+        results = []
+        futures = []
+
+        for index, start in enumerate(range(0, max(1, len(lines)), self.chunk_size)):
+            source = self.path(job_id, "{}.in".format(index))
+            destination = self.path(job_id, "{}.out".format(index))
+
+            with open(source, "w") as chunk:
+                chunk.write("\n".join(lines[start : start + self.chunk_size]))
+
+            results.append(destination)
+            futures.append(self.pool.submit(evaluate_file, source, destination))
+
+        with open(self.path(job_id, "job"), "w") as manifest:
+            json.dump({"expressions": len(lines), "chunks": len(results)}, manifest)
+
+        return self.add(Job(job_id, len(lines), results, futures))
+
+    def load(self, job_id: str) -> Job:
+        """Resume a job found in the spool directory.
+
+        Finished chunks are kept, the others evaluated again.
+
+        Args:
+            job_id (str): The job ID.
+
+        Returns:
+            Job: The job, or None if there is no such job.
+        """
+        try:
+            valid = uuid.UUID(job_id).hex == job_id
+        except ValueError:
+            valid = False
+
+        if not valid or self.directory is None:
+            return None
+
+        try:
+            with open(self.path(job_id, "job")) as manifest:
+                description = json.load(manifest)
+        except (OSError, ValueError):
+            return None
+
+        self.prepare()
+
+        results = []
+        futures = []
+
+        for index in range(description["chunks"]):
+            source = self.path(job_id, "{}.in".format(index))
+            destination = self.path(job_id, "{}.out".format(index))
+
+            if os.path.exists(source) and not os.path.exists(destination):
+                future = self.pool.submit(evaluate_file, source, destination)
+            else:
+                future = concurrent.futures.Future()
+                if os.path.exists(destination):
+                    future.set_result(None)
+                else:
+                    future.set_exception(FileNotFoundError(destination))
+
+            results.append(destination)
+            futures.append(future)
+
+        return self.add(Job(job_id, description["expressions"], results, futures))
+
+    def add(self, job: Job) -> Job:
+        """Keep a job, deleting the oldest ones beyond ``max_jobs``.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            Job: The job.
+        """
+        self.jobs[job.id] = job
+
+        while len(self.jobs) > self.max_jobs:
+            self.delete(next(iter(self.jobs)))
+
+        return job
+
+    def delete(self, job_id: str):
+        """Forget a job, cancel what is left of it and remove its files.
+
+        Args:
+            job_id (str): The job ID.
+        """
+        job = self.jobs.pop(job_id, None)
+
+        if job is None:
+            return
+
+        try:
+            os.remove(self.path(job_id, "job"))
+        except FileNotFoundError:
+            pass
+
+        for future, path in zip(job.futures, job.results):
+            future.cancel()
+            future.add_done_callback(lambda future, path=path: self.remove(path))
+
+    def remove(self, path: str):
+        """Remove the result file of a chunk, if it was written.
+
+        Args:
+            path (str): The path of the result file.
+        """
+        leftovers = [path, path[: -len(".out")] + ".in"]
+        leftovers += glob.glob(glob.escape(path) + ".*.part")
+
+        for leftover in leftovers:
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+
+    def close(self, keep: bool = False):
+        """Stop taking work and remove the spool directory if it was created.
+
+        Chunks not started yet are cancelled, and running ones are not waited
+        for: the process only finishes them on exit.
+
+        Args:
+            keep (bool): Keep the spool directory for a new process to adopt.
+                Defaults to False.
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+        if self.owns_directory and self.directory is not None and not keep:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,88 @@
+"""Graceful restarts: hand listening sockets over to a new server process.
+
+On restart the server starts a copy of its own command line with the file
+descriptors of its bound sockets in ``CALCULATOR_LISTEN_FD``, separated by
+commas. The new process serves from those sockets instead of binding new
+ones, then tells the old
+process, named in ``CALCULATOR_PARENT_PID``, to drain. The socket is never
+closed in between, so clients are neither refused nor kept waiting. The
+spool directory of bulk jobs is handed over in ``CALCULATOR_JOBS_DIR``.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+LISTEN_FD = "CALCULATOR_LISTEN_FD"
+PARENT_PID = "CALCULATOR_PARENT_PID"
+JOBS_DIR = "CALCULATOR_JOBS_DIR"
+
+
+def inherited_socket(sock: socket.socket) -> socket.socket:
+    """Get the listening socket handed over by a previous server process.
+
+    A server with several sockets takes each from the first inherited socket
+    of the same family and type, in the order they were handed over.
+
+    Args:
+        sock (socket.socket): The socket the server would bind otherwise.
+
+    Returns:
+        socket.socket: The inherited socket, or None if there is none of the
+        same family and type as ``sock``.
+    """
+    fds = os.environ.get(LISTEN_FD, "").split(",")
+
+    for fd in filter(None, fds):
+        inherited = socket.socket(fileno=int(fd))
+
+        if inherited.family == sock.family and inherited.type == sock.type:
+            fds.remove(fd)
+            os.environ[LISTEN_FD] = ",".join(fds)
+            return inherited
+
+        inherited.detach()
+
+    return None
+
+
+def inherited_spool() -> str:
+    """Get the bulk job spool directory handed over by a previous process.
+
+    Returns:
+        str: The directory, or None if there is none.
+    """
+    return os.environ.pop(JOBS_DIR, None)
+
+
+def spawn_successor(sockets: list, spool: str = None) -> subprocess.Popen:
+    """Start a new server process serving from the same sockets.
+
+    Args:
+        sockets (list): The bound server sockets.
+        spool (str): The bulk job spool directory to hand over. Defaults to
+            None.
+
+    Returns:
+        subprocess.Popen: The new process.
+    """
+    fds = [sock.fileno() for sock in sockets]
+
+    env = dict(os.environ)
+    env[LISTEN_FD] = ",".join(str(fd) for fd in fds)
+    env[PARENT_PID] = str(os.getpid())
+
+    if spool is not None:
+        env[JOBS_DIR] = spool
+
+    return subprocess.Popen([sys.executable] + sys.argv, env=env, pass_fds=fds)
+
+
+def notify_parent():
+    """Tell the server process that started this one to drain."""
+    pid = os.environ.pop(PARENT_PID, None)
+
+    if pid is not None:
+        os.kill(int(pid), signal.SIGTERM)
@@ -0,0 +1,175 @@
+"""Memory profiling of a running server with tracemalloc snapshots."""
+
+import collections
+import threading
+import time
+import tracemalloc
+
+# Allocations of the profiler itself and of imports are left out of reports
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class MemoryProfiler:
+    """Takes tracemalloc snapshots on demand and reports where memory goes.
+
+    Tracing is off until started, as it slows every allocation down. The last
+    two snapshots are kept, so that one taken after a soak run can be diffed
+    with one taken minutes before to find what keeps growing.
+
+    Args:
+        frames (int): Frames of the stack kept per allocation. Defaults to 1.
+        limit (int): Allocation sites reported. Defaults to 20.
+    """
+
+    def __init__(self, frames: int = 1, limit: int = 20):
+        self.frames = frames
+        self.limit = limit
+
+        # (when it was taken, snapshot), oldest first
+        self.snapshots = collections.deque(maxlen=2)
+
+        # Threads of a ThreadedServer share the profiler
+        self.lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        """Whether allocations are traced."""
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        """Start tracing allocations."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        """Stop tracing allocations and forget the snapshots."""
+        with self.lock:
+            tracemalloc.stop()
+            self.snapshots.clear()
+
+    def snapshot(self):
+        """Take a snapshot of the memory allocated since tracing started.
+
+        Raises:
+            RuntimeError: If allocations are not traced.
+        """
+        snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+        with self.lock:
+            self.snapshots.append((time.time(), snapshot))
+
+    def top(self) -> list:
+        """Get the sites holding the most memory in the last snapshot.
+
+        Returns:
+            list: Up to ``limit`` sites, with their size in bytes and number of
+            blocks, largest first.
+        """
+        with self.lock:
+            if not self.snapshots:
+                return []
+
+            _, snapshot = self.snapshots[-1]
+
+        return [
+            {
+                "site": str(stat.traceback),
+                "size": stat.size,
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[: self.limit]
+        ]
+
+    def diff(self) -> dict:
+        """Compare the last two snapshots.
+
+        Returns:
+            dict: The seconds between them and up to ``limit`` sites whose
+            memory changed most, or None with fewer than two snapshots.
+        """
+        with self.lock:
+            if len(self.snapshots) < 2:
+                return None
+
+            (before, old), (after, new) = self.snapshots
+
+        return {
+            "seconds": after - before,
+            "sites": [
+                {
+                    "site": str(stat.traceback),
+                    "size": stat.size,
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                }
+                for stat in new.compare_to(old, "lineno")[: self.limit]
+            ],
+        }
+
+    def report(self, tables: dict = None) -> dict:
+        """Summarize the memory of the process.
+
+        Args:
+            tables (dict): Entries of the caches and tables of the server.
+
+        Returns:
+            dict: Whether tracing is on, the traced memory, the top sites of the
+            last snapshot, the diff of the last two and the table sizes.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+
+        return {
+            "tracing": self.tracing,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": len(self.snapshots),
+            "top": self.top(),
+            "diff": self.diff(),
+            "tables": tables or {},
+        }
+
+
+def format_report(report: dict) -> str:
+    """Format a report for the terminal.
+
+    Args:
+        report (dict): A report of ``MemoryProfiler.report``.
+
+    Returns:
+        str: The traced memory, the top sites, the diff and the table sizes.
+    """
+    lines = [
+        "Traced memory: {} bytes, peak {} bytes".format(
+            report["traced_bytes"], report["peak_bytes"]
+        )
+    ]
+
+    if report["top"]:
+        lines.append("Top allocation sites:")
+        for site in report["top"]:
+            lines.append(
+                "  {:>12} B {:>8} blocks  {}".format(
+                    site["size"], site["count"], site["site"]
+                )
+            )
+
+    if report["diff"] is not None:
+        lines.append("Changes over {:.1f} s:".format(report["diff"]["seconds"]))
+        for site in report["diff"]["sites"]:
+            lines.append(
+                "  {:>+12} B {:>+8} blocks  {}".format(
+                    site["size_diff"], site["count_diff"], site["site"]
+                )
+            )
+
+    tables = report["tables"].items()
+    lines.append(
+        "Tables: " + ", ".join("{}={}".format(name, size) for name, size in tables)
+    )
+
+    return "\n".join(lines)
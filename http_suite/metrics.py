@@ -0,0 +1,378 @@
+"""Server metrics: counters, gauges and log-bucketed latency histograms."""
+
+import json
+import math
+
+
+class LogHistogram:
+    """Histogram with logarithmically spaced buckets and fixed memory.
+
+    Bucket ``i`` holds values up to ``min_value * 2 ** (i / precision)``, so the
+    relative error of any estimate is bounded by the bucket growth factor. The
+    number of buckets depends only on the configured range, never on the number
+    of recorded values, and two histograms with the same layout can be merged by
+    adding their counts.
+
+    Args:
+        min_value (float): Upper bound of the first bucket. Defaults to 1e-6.
+        max_value (float): Values above this land in the overflow bucket.
+            Defaults to 100.0.
+        precision (int): Number of buckets per doubling. Defaults to 2.
+    """
+
+    __slots__ = ("min_value", "max_value", "precision", "counts", "count", "sum")
+
+    def __init__(
+        self, min_value: float = 1e-6, max_value: float = 100.0, precision: int = 2
+    ):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.precision = precision
+
+        size = math.ceil(math.log2(max_value / min_value) * precision) + 1
+
+        # The last bucket collects everything above max_value
+        self.counts = [0] * (size + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def bucket_index(self, value: float) -> int:
+        """Get the index of the bucket a value belongs to.
+
+        Args:
+            value (float): The value to locate.
+
+        Returns:
+            int: The bucket index.
+        """
+        if value <= self.min_value:
+            return 0
+
+        index = math.ceil(math.log2(value / self.min_value) * self.precision)
+        return min(index, len(self.counts) - 1)
+
+    def upper_bound(self, index: int) -> float:
+        """Get the upper bound of a bucket.
+
+        Args:
+            index (int): The bucket index.
+
+        Returns:
+            float: The bucket's upper bound (infinity for the overflow bucket).
+        """
+        if index >= len(self.counts) - 1:
+            return math.inf
+
+        return self.min_value * 2 ** (index / self.precision)
+
+    def record(self, value: float):
+        """Record a value.
+
+        Args:
+            value (float): The value to record.
+        """
+        self.counts[self.bucket_index(value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "LogHistogram"):
+        """Add the counts of another histogram with the same layout.
+
+        Args:
+            other (LogHistogram): The histogram to merge into this one.
+
+        Raises:
+            ValueError: If the bucket layouts differ.
+        """
+        if (self.min_value, self.precision, len(self.counts)) != (
+            other.min_value,
+            other.precision,
+            len(other.counts),
+        ):
+            raise ValueError("Histogram layouts differ")
+
+        for i, value in enumerate(other.counts):
+            self.counts[i] += value
+
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket containing it.
+
+        Args:
+            q (float): The quantile, between 0.0 and 1.0.
+
+        Returns:
+            float: The estimated value, or 0.0 if the histogram is empty.
+        """
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+
+        for i, value in enumerate(self.counts):
+            cumulative += value
+
+            if cumulative >= rank and value:
+                return min(self.upper_bound(i), self.max_value)
+
+        return self.max_value
+
+    def buckets(self):
+        """Iterate over non-empty buckets as cumulative counts.
+
+        Yields:
+            tuple: The bucket upper bound and the cumulative count up to it.
+        """
+        cumulative = 0
+
+        for i, value in enumerate(self.counts):
+            cumulative += value
+
+            if value:
+                yield self.upper_bound(i), cumulative
+
+
+def format_labels(labels: tuple) -> str:
+    """Format a tuple of label pairs in Prometheus syntax.
+
+    Args:
+        labels (tuple): Sorted ``(name, value)`` pairs.
+
+    Returns:
+        str: The formatted labels, e.g. ``{status="200"}``, or an empty string.
+    """
+    if not labels:
+        return ""
+
+    pairs = []
+
+    for name, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append('{}="{}"'.format(name, value))
+
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    """Format a sample value in Prometheus syntax.
+
+    Args:
+        value (float): The value.
+
+    Returns:
+        str: The formatted value.
+    """
+    if value == math.inf:
+        return "+Inf"
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+
+class Metrics:
+    """Registry of counters, gauges and histograms exported by a server.
+
+    Updates are plain dictionary and integer operations with no locks, so
+    recording a sample never waits on a reader. Rendering works on a copy of
+    each table, so a slow metrics scrape never holds up request handling.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.descriptions = {}
+        self.values = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def describe(self, name: str, kind: str, description: str):
+        """Declare a metric's type and help text.
+
+        Args:
+            name (str): The metric name.
+            kind (str): One of "counter", "gauge" or "histogram".
+            description (str): The help text.
+        """
+        self.types[name] = kind
+        self.descriptions[name] = description
+
+    def register_collector(self, collector):
+        """Register a function that updates values right before rendering.
+
+        Collectors export state kept elsewhere, such as table sizes, without
+        touching the registry on every update.
+
+        Args:
+            collector (callable): Called with this registry before rendering.
+        """
+        self.collectors.append(collector)
+
+    def collect(self):
+        """Run the registered collectors."""
+        for collector in self.collectors:
+            collector(self)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Increment a counter or gauge.
+
+        Args:
+            name (str): The metric name.
+            amount (float): The amount to add. Defaults to 1.
+            **labels: The metric labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, name: str, amount: float = 1, **labels):
+        """Decrement a gauge.
+
+        Args:
+            name (str): The metric name.
+            amount (float): The amount to subtract. Defaults to 1.
+            **labels: The metric labels.
+        """
+        self.inc(name, -amount, **labels)
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge to a value.
+
+        Args:
+            name (str): The metric name.
+            value (float): The new value.
+            **labels: The metric labels.
+        """
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name: str, **labels) -> float:
+        """Get the current value of a counter or gauge.
+
+        Args:
+            name (str): The metric name.
+            **labels: The metric labels.
+
+        Returns:
+            float: The value, or 0 if it was never recorded.
+        """
+        return self.values.get((name, tuple(sorted(labels.items()))), 0)
+
+    def observe(self, name: str, value: float, **labels):
+        """Record a value in a histogram.
+
+        Args:
+            name (str): The metric name.
+            value (float): The value to record.
+            **labels: The metric labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+
+        if histogram is None:
+            histogram = self.histograms[key] = LogHistogram()
+
+        histogram.record(value)
+
+    def merge(self, other: "Metrics"):
+        """Add the samples of another registry into this one.
+
+        Args:
+            other (Metrics): The registry to merge.
+        """
+        self.types.update(other.types)
+        self.descriptions.update(other.descriptions)
+
+        # Counters and gauges are both additive across registries
+        for key, value in list(other.values.items()):
+            self.values[key] = self.values.get(key, 0) + value
+
+        for key, histogram in list(other.histograms.items()):
+            if key not in self.histograms:
+                self.histograms[key] = LogHistogram(
+                    histogram.min_value, histogram.max_value, histogram.precision
+                )
+            self.histograms[key].merge(histogram)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        self.collect()
+
+        values = sorted(list(self.values.items()))
+        histograms = sorted(list(self.histograms.items()), key=lambda item: item[0])
+
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+
+            if name in self.descriptions:
+                lines.append("# HELP {} {}".format(name, self.descriptions[name]))
+            lines.append("# TYPE {} {}".format(name, self.types.get(name, kind)))
+
+        for (name, labels), value in values:
+            header(name, "untyped")
+            lines.append(
+                "{}{} {}".format(name, format_labels(labels), format_value(value))
+            )
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+
+            for bound, cumulative in histogram.buckets():
+                if bound == math.inf:
+                    continue
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        name,
+                        format_labels(labels + (("le", format_value(bound)),)),
+                        cumulative,
+                    )
+                )
+
+            lines.append(
+                "{}_bucket{} {}".format(
+                    name, format_labels(labels + (("le", "+Inf"),)), histogram.count
+                )
+            )
+            lines.append(
+                "{}_sum{} {}".format(name, format_labels(labels), repr(histogram.sum))
+            )
+            lines.append(
+                "{}_count{} {}".format(name, format_labels(labels), histogram.count)
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> str:
+        """Render a JSON summary with counters and latency percentiles.
+
+        Returns:
+            str: The JSON summary.
+        """
+        self.collect()
+
+        summary = {}
+
+        for (name, labels), value in sorted(list(self.values.items())):
+            summary[name + format_labels(labels)] = value
+
+        for (name, labels), histogram in list(self.histograms.items()):
+            summary[name + format_labels(labels)] = {
+                "count": histogram.count,
+                "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                "p50": histogram.quantile(0.50),
+                "p90": histogram.quantile(0.90),
+                "p99": histogram.quantile(0.99),
+                "max": histogram.quantile(1.0),
+            }
+
+        return json.dumps(summary, indent=2, sort_keys=True)
@@ -0,0 +1,250 @@
+"""Calculator server listening on several transports from one event loop."""
+
+import errno
+import selectors
+import socket
+
+from .address import remove_stale_socket
+from .admission import AdmissionController
+from .cache import ResultCache
+from .capture import Capture
+from .http import COMPRESS_MIN_SIZE
+from .lifecycle import inherited_socket
+from .ratelimit import RateLimiter
+from .server import TCPServer, UDPReliableServer
+from .tracing import Tracer
+
+# Datagrams read from a socket before other sockets are served
+DATAGRAM_BATCH = 64
+
+
+class MultiServer(TCPServer):
+    """Server answering TCP, UDP and Unix domain socket clients in one process.
+
+    TCP connections and UDP datagrams on ``host`` and ``port``, and TCP
+    connections on the Unix domain socket ``unix``, are all served by the
+    event loop of the TCP server. Every transport goes through the same
+    request pipeline, so they share one result cache, one set of metrics,
+    one bulk job pool and the same admission control and rate limits.
+
+    Args:
+        host (str): The host address of the TCP and UDP sockets. Defaults to
+            "127.0.0.1".
+        port (int): The port number of the TCP and UDP sockets. Defaults to
+            50123.
+        buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
+        debug (bool): Print every request and response. Defaults to True.
+        transport: Factory of the server's sockets. Defaults to ``socket``.
+        admission (AdmissionController): Load shedding policy. Defaults to None.
+        rate_limit (RateLimiter): Per-client rate limit. Defaults to None.
+        cache (ResultCache): Cache of results. Defaults to None.
+        capture (Capture): Journal of the requests received. Defaults to None.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest response body compressed, or None
+            to never compress. Defaults to 1024.
+        udp (bool): Also serve UDP clients. Defaults to True.
+        unix (str): Path of a Unix domain socket also served. Defaults to None.
+        header_timeout (float): Seconds to receive a request header. Defaults
+            to 10.0.
+        body_timeout (float): Seconds to receive a request body. Defaults to
+            30.0.
+        idle_timeout (float): Seconds a connection may wait for its next
+            request. Defaults to 60.0.
+        write_timeout (float): Seconds a client may go without reading.
+            Defaults to 30.0.
+        drain_timeout (float): Seconds to finish the requests in flight when
+            draining. Defaults to 30.0.
+    """
+
+    name = "Multi-protocol server"
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        buffer_size: int = 1024,
+        debug: bool = True,
+        transport=socket,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        cache: ResultCache = None,
+        capture: Capture = None,
+        tracer: Tracer = None,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
+        udp: bool = True,
+        unix: str = None,
+        header_timeout: float = 10.0,
+        body_timeout: float = 30.0,
+        idle_timeout: float = 60.0,
+        write_timeout: float = 30.0,
+        drain_timeout: float = 30.0,
+    ):
+        super().__init__(
+            host=host,
+            port=port,
+            buffer_size=buffer_size,
+            debug=debug,
+            transport=transport,
+            admission=admission,
+            rate_limit=rate_limit,
+            cache=cache,
+            capture=capture,
+            tracer=tracer,
+            compress_min_size=compress_min_size,
+            header_timeout=header_timeout,
+            body_timeout=body_timeout,
+            idle_timeout=idle_timeout,
+            write_timeout=write_timeout,
+            drain_timeout=drain_timeout,
+        )
+
+        # Datagram sockets are served by UDP servers sharing our pipeline
+        self.endpoints = []
+
+        if udp:
+            endpoint = UDPReliableServer(
+                host=host,
+                port=port,
+                buffer_size=buffer_size,
+                debug=debug,
+                transport=transport,
+                admission=admission,
+                rate_limit=rate_limit,
+                cache=cache,
+                capture=capture,
+                tracer=tracer,
+                compress_min_size=compress_min_size,
+            )
+            endpoint.metrics = self.metrics
+            endpoint.jobs = self.jobs
+            endpoint.routes["/memory"] = self.serve_memory
+            self.endpoints.append(endpoint)
+
+            self.metrics.describe(
+                "calculator_datagram_errors_total",
+                "counter",
+                "Datagrams that could not be sent or received, by error.",
+            )
+
+        self.unix = unix
+        self.unix_socket = None
+
+        if unix is not None:
+            self.unix_socket = transport.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            inherited = inherited_socket(self.unix_socket)
+
+            if inherited is not None:
+                self.unix_socket.close()
+                self.unix_socket = inherited
+            else:
+                remove_stale_socket(unix)
+                self.unix_socket.bind(unix)
+
+    def listeners(self) -> list:
+        """Gets the sockets handed over to a new process on restart.
+
+        Returns:
+            list: The TCP socket, then the UDP and Unix domain sockets.
+        """
+        sockets = [self.server_socket]
+        sockets += [endpoint.server_socket for endpoint in self.endpoints]
+
+        if self.unix_socket is not None:
+            sockets.append(self.unix_socket)
+
+        return sockets
+
+    def memory_tables(self) -> dict:
+        """Gets the number of entries of the server's caches and tables.
+
+        Returns:
+            dict: The entries of every table, with those of the UDP endpoints.
+        """
+        tables = super().memory_tables()
+
+        if self.endpoints:
+            tables["reassembler"] = sum(len(e.reassembler) for e in self.endpoints)
+            tables["sent_messages"] = sum(len(e.sent_messages) for e in self.endpoints)
+
+        return tables
+
+    def listen(self):
+        """Starts accepting connections and datagrams in the event loop."""
+        super().listen()
+
+        if self.unix_socket is not None:
+            self.unix_socket.listen()
+            self.unix_socket.setblocking(False)
+            self.selector.register(self.unix_socket, selectors.EVENT_READ)
+
+        for endpoint in self.endpoints:
+            endpoint.server_socket.setblocking(False)
+            self.selector.register(
+                endpoint.server_socket, selectors.EVENT_READ, endpoint
+            )
+
+    def stop_listening(self):
+        """Stops accepting connections and answers the datagrams queued.
+
+        Queued datagrams are left to the new process after a restart.
+        """
+        super().stop_listening()
+
+        if self.unix_socket is not None:
+            self.selector.unregister(self.unix_socket)
+
+        for endpoint in self.endpoints:
+            self.selector.unregister(endpoint.server_socket)
+
+            if not self.handed_off:
+                while self.receive_datagrams(endpoint):
+                    pass
+
+    def receive_datagrams(self, endpoint: UDPReliableServer) -> bool:
+        """Answers the datagrams queued on a socket, a batch at a time.
+
+        Args:
+            endpoint (UDPReliableServer): The server of the socket.
+
+        Returns:
+            bool: True if more datagrams may be queued.
+        """
+        for _ in range(DATAGRAM_BATCH):
+            try:
+                datagram = endpoint.receive()
+                endpoint.handle_datagram(*datagram)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError as exc:
+                # Only this datagram is lost: the client retries the request
+                self.metrics.inc(
+                    "calculator_datagram_errors_total",
+                    error=errno.errorcode.get(exc.errno, "unknown"),
+                )
+
+        return True
+
+    def handle_event(self, key: selectors.SelectorKey, events: int):
+        """Handles a ready connection, listening socket or datagram socket.
+
+        Args:
+            key (selectors.SelectorKey): The key of the socket.
+            events (int): The events it is ready for.
+        """
+        if isinstance(key.data, UDPReliableServer):
+            self.receive_datagrams(key.data)
+        else:
+            super().handle_event(key, events)
+
+    def close(self):
+        """Closes every connection and socket."""
+        super().close()
+
+        for endpoint in self.endpoints:
+            endpoint.server_socket.close()
+
+        if self.unix_socket is not None:
+            self.unix_socket.close()
+
+            if not self.handed_off:
+                remove_stale_socket(self.unix)
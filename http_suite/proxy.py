@@ -0,0 +1,798 @@
+"""Load-balancing proxy in front of several calculator servers."""
+
+import bisect
+import collections
+import errno
+import hashlib
+import math
+import os
+import selectors
+import socket
+import threading
+import time
+
+from . import binary
+from .address import address_family, socket_address
+from .admission import AdmissionController, ServiceUnavailable
+from .bcolors import bcolors
+from .calc import Calculator
+from .http import FileResponse, HTTPParser, StreamResponse
+from .ratelimit import RateLimiter
+from .server import TCPServer, _Connection
+
+# Request paths whose expressions are evaluated together
+BATCH_PATHS = ("/batch", "/batch/stream")
+
+
+def ring_hash(key: str) -> int:
+    """Hash a key onto the ring, identically in every process.
+
+    Args:
+        key (str): The key.
+
+    Returns:
+        int: A 64-bit hash.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring.
+
+    Every node is placed at ``replicas`` points of the ring, and a key belongs
+    to the first node after its hash. Adding or removing a node only moves the
+    keys of that node.
+
+    Args:
+        nodes (list): The nodes, identified by ``str(node)``. Defaults to none.
+        replicas (int): Points per node. Defaults to 100.
+    """
+
+    def __init__(self, nodes: list = (), replicas: int = 100):
+        self.replicas = replicas
+        self.hashes = []
+        self.owners = {}
+
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        """Place a node on the ring.
+
+        Args:
+            node: The node.
+        """
+        for replica in range(self.replicas):
+            point = ring_hash("{}#{}".format(node, replica))
+            bisect.insort(self.hashes, point)
+            self.owners[point] = node
+
+    def remove(self, node):
+        """Take a node off the ring.
+
+        Args:
+            node: The node.
+        """
+        for replica in range(self.replicas):
+            point = ring_hash("{}#{}".format(node, replica))
+            self.hashes.remove(point)
+            del self.owners[point]
+
+    def candidates(self, key: str):
+        """Iterate over the nodes in the order a key falls back to them.
+
+        Args:
+            key (str): The key.
+
+        Yields:
+            The distinct nodes met clockwise from the key's hash.
+        """
+        start = bisect.bisect(self.hashes, ring_hash(key))
+        seen = set()
+
+        for i in range(len(self.hashes)):
+            node = self.owners[self.hashes[(start + i) % len(self.hashes)]]
+
+            if node not in seen:
+                seen.add(node)
+                yield node
+
+    def lookup(self, key: str):
+        """Get the node a key belongs to.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            The node, or None if the ring is empty.
+        """
+        return next(self.candidates(key), None)
+
+
+class Backend:
+    """A calculator server behind the proxy, with its pool of connections.
+
+    Args:
+        host (str): The server's host address or Unix domain socket path.
+        port (int): The server's port number.
+        max_connections (int): Maximum connections opened to the server.
+            Defaults to 32.
+        timeout (float): Timeout of connecting and of health checks, in
+            seconds. Defaults to 1.0.
+    """
+
+    def __init__(
+        self, host: str, port: int, max_connections: int = 32, timeout: float = 1.0
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        self.healthy = True
+        self.outstanding = 0
+        self.connections = 0
+        self.idle = []
+        # Connections opened without waiting, until they are writable
+        self.connecting = set()
+        # Requests waiting for a connection once all are busy
+        self.queue = collections.deque()
+
+    def __str__(self) -> str:
+        return "{}:{}".format(self.host, self.port)
+
+    def connect(self, blocking: bool = True) -> socket.socket:
+        """Open a new connection to the server.
+
+        Args:
+            blocking (bool): Wait up to ``timeout`` for the connection. A
+                non-blocking socket is returned while still connecting, and
+                is writable once connected. Defaults to True.
+
+        Returns:
+            socket.socket: The socket.
+
+        Raises:
+            OSError: If the server cannot be reached.
+        """
+        sock = socket.socket(address_family(self.host), socket.SOCK_STREAM)
+        address = socket_address(self.host, self.port)
+
+        try:
+            if blocking:
+                sock.settimeout(self.timeout)
+                sock.connect(address)
+            else:
+                sock.setblocking(False)
+                error = sock.connect_ex(address)
+
+                if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    raise OSError(error, os.strerror(error))
+
+        except OSError:
+            sock.close()
+            raise
+
+        return sock
+
+    def acquire(self) -> socket.socket:
+        """Take an idle connection, or start opening one if the pool is not full.
+
+        Returns:
+            socket.socket: The connection, in ``connecting`` if it is new, or
+            None if all are busy.
+
+        Raises:
+            OSError: If a new connection cannot be opened.
+        """
+        if self.idle:
+            return self.idle.pop()
+
+        if self.connections >= self.max_connections:
+            return None
+
+        sock = self.connect(blocking=False)
+        self.connecting.add(sock)
+        self.connections += 1
+
+        return sock
+
+    def release(self, sock: socket.socket):
+        """Return a connection to the pool.
+
+        Args:
+            sock (socket.socket): The connection.
+        """
+        self.idle.append(sock)
+
+    def discard(self, sock: socket.socket):
+        """Close a broken connection.
+
+        Args:
+            sock (socket.socket): The connection.
+        """
+        sock.close()
+        self.connecting.discard(sock)
+        self.connections -= 1
+
+    def check(self) -> bool:
+        """Check whether the server answers ``GET /stats``.
+
+        Returns:
+            bool: True if it answered with 200 OK in time.
+        """
+        try:
+            sock = self.connect()
+        except OSError:
+            return False
+
+        parser = HTTPParser()
+        response = b""
+
+        try:
+            sock.sendall(b"GET /stats HTTP/1.1\r\n\r\n")
+
+            while parser.message_length(response) is None:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    return False
+                response += chunk
+
+        except (OSError, ValueError):
+            return False
+
+        finally:
+            sock.close()
+
+        return response.startswith(b"HTTP/1.1 200")
+
+
+class _Exchange:
+    """A client request forwarded to a backend."""
+
+    __slots__ = (
+        "connection",
+        "request",
+        "key",
+        "backend",
+        "sock",
+        "outgoing",
+        "buffer",
+        "tried",
+        "reused",
+        "timer",
+        "started",
+        "response",
+    )
+
+    def __init__(self, connection: _Connection, request: bytes, key: str = None):
+        self.connection = connection
+        self.request = request
+        self.key = key
+        self.backend = None
+        self.sock = None
+        self.outgoing = None
+        self.buffer = b""
+        self.tried = []
+        # Whether the connection came from the pool rather than being opened
+        self.reused = False
+        self.timer = None
+        self.started = time.perf_counter()
+        self.response = None
+
+
+class TCPProxy(TCPServer):
+    """Proxy spreading HTTP requests over a pool of calculator servers.
+
+    Requests are routed by consistent hashing of their normalized expression,
+    so every expression is evaluated, and cached, by the same server. When
+    that server is unhealthy or has more than ``load_factor`` times the average
+    number of outstanding requests, the request goes to the server with the
+    fewest outstanding requests instead. Servers are health-checked every
+    ``health_interval`` seconds, and marked unhealthy as soon as they refuse a
+    connection. Connections to servers are pooled and reused.
+
+    Batches go to the server with the fewest outstanding requests. Requests
+    are answered in order on each client connection. The proxy serves
+    ``/metrics`` and ``/stats`` itself and forwards every other path. A bulk
+    job is only known to the server that started it, so ``/jobs`` is meant
+    for a proxy with a single server. Binary clients are not proxied.
+
+    Args:
+        backends (list): The ``(host, port)`` of every server.
+        host (str): The proxy's host address or Unix domain socket path.
+            Defaults to "127.0.0.1".
+        port (int): The proxy's port number. Defaults to 50123.
+        buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
+        debug (bool): Print every request and response. Defaults to True.
+        admission (AdmissionController): Load shedding policy. Defaults to None.
+        rate_limit (RateLimiter): Per-client rate limit. Defaults to None.
+        replicas (int): Ring points per server. Defaults to 100.
+        load_factor (float): Outstanding requests allowed on a server, relative
+            to the average, before falling back. Defaults to 1.25.
+        max_connections (int): Connections per server. Defaults to 32.
+        health_interval (float): Seconds between health checks. Defaults to 1.0.
+        backend_timeout (float): Seconds a server may take to answer before the
+            request is retried. Defaults to 10.0.
+        retries (int): Other attempts for a request whose server failed.
+            Defaults to 2.
+    """
+
+    def __init__(
+        self,
+        backends: list,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        buffer_size: int = 1024,
+        debug: bool = True,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        replicas: int = 100,
+        load_factor: float = 1.25,
+        max_connections: int = 32,
+        health_interval: float = 1.0,
+        backend_timeout: float = 10.0,
+        retries: int = 2,
+    ):
+        super().__init__(
+            host=host,
+            port=port,
+            buffer_size=buffer_size,
+            debug=debug,
+            admission=admission,
+            rate_limit=rate_limit,
+        )
+
+        self.backends = [
+            Backend(backend_host, backend_port, max_connections)
+            for backend_host, backend_port in backends
+        ]
+        self.ring = HashRing(self.backends, replicas)
+        self.load_factor = load_factor
+        self.health_interval = health_interval
+        self.retries = retries
+
+        self.timeouts["backend"] = backend_timeout
+
+        # Exchanges of every client connection, in request order
+        self.waiting = {}
+
+        # Every other path, batches included, is answered by the servers
+        self.routes = {"/metrics": self.serve_metrics, "/stats": self.serve_stats}
+
+        self.metrics.describe(
+            "calculator_proxy_forwarded_total", "counter", "Requests sent by server."
+        )
+        self.metrics.describe(
+            "calculator_proxy_fallbacks_total",
+            "counter",
+            "Requests not sent to their server on the hash ring.",
+        )
+        self.metrics.describe(
+            "calculator_proxy_errors_total", "counter", "Failed exchanges by server."
+        )
+        self.metrics.describe(
+            "calculator_proxy_outstanding", "gauge", "Requests in flight by server."
+        )
+        self.metrics.describe(
+            "calculator_proxy_healthy", "gauge", "1 if the server is healthy."
+        )
+        self.metrics.register_collector(self.collect_backends)
+
+    def collect_backends(self, metrics):
+        """Sets the gauges of every backend.
+
+        Args:
+            metrics (Metrics): The proxy's metrics.
+        """
+        for backend in self.backends:
+            name = str(backend)
+            metrics.set(
+                "calculator_proxy_outstanding", backend.outstanding, backend=name
+            )
+            metrics.set("calculator_proxy_healthy", int(backend.healthy), backend=name)
+
+    def check_backends(self):
+        """Health-checks every backend until the proxy drains."""
+        while not self.draining:
+            for backend in self.backends:
+                healthy = backend.check()
+
+                if healthy != backend.healthy and self.debug:
+                    print(
+                        "{}{}Backend {} is {}.{}".format(
+                            bcolors.BOLD,
+                            bcolors.OKGREEN if healthy else bcolors.FAIL,
+                            backend,
+                            "up" if healthy else "down",
+                            bcolors.ENDC,
+                        )
+                    )
+                backend.healthy = healthy
+
+            time.sleep(self.health_interval)
+
+    def start(self):
+        """Starts the health checks along with the proxy."""
+        super().start()
+
+        threading.Thread(target=self.check_backends, daemon=True).start()
+
+    def process_tcp_frame(self, frame: tuple, address, arrival: float) -> bytes:
+        """Rejects a binary frame, since binary clients are not proxied.
+
+        Args:
+            frame (tuple): The opcode, request ID and payload.
+            address: The client's address.
+            arrival (float): When the frame was received.
+
+        Returns:
+            bytes: A ServiceUnavailable error frame.
+        """
+        return binary.encode_error(frame[1], ServiceUnavailable())
+
+    def handle_message(self, connection: _Connection, message: str, arrival: float):
+        """Forwards an HTTP request, or answers it if the proxy serves it.
+
+        Args:
+            connection (_Connection): The client connection.
+            message (str): The HTTP request message.
+            arrival (float): When the request was received.
+        """
+        request = self.parser.read_request(message)
+        expression = None
+
+        # Batches hold many expressions: they go to the least loaded server
+        if (
+            request is not None
+            and request.file not in BATCH_PATHS
+            and "expression" in request.params
+        ):
+            expression = Calculator().normalize(request.params["expression"][0])
+
+        exchange = _Exchange(connection, message.encode(), expression)
+        self.waiting.setdefault(connection, collections.deque()).append(exchange)
+
+        if not self.allow(connection.address):
+            self.complete(exchange, self.rate_limited_response)
+        elif not self.admit(arrival):
+            self.complete(exchange, self.overload_response)
+        elif request is not None and request.file in self.routes:
+            response = self.process_request(message)
+
+            if not isinstance(response, (FileResponse, StreamResponse)):
+                response = response.encode()
+
+            self.complete(exchange, response)
+        else:
+            self.forward(exchange)
+
+    def choose(self, exchange: _Exchange) -> Backend:
+        """Chooses the backend of a request.
+
+        Args:
+            exchange (_Exchange): The request.
+
+        Returns:
+            Backend: The backend, or None if no healthy backend is left.
+        """
+        healthy = [
+            backend
+            for backend in self.backends
+            if backend.healthy and backend not in exchange.tried
+        ]
+
+        if not healthy:
+            return None
+
+        if exchange.key is not None:
+            total = sum(backend.outstanding for backend in healthy)
+            bound = math.ceil(self.load_factor * (total + 1) / len(healthy))
+
+            for backend in self.ring.candidates(exchange.key):
+                if backend in healthy:
+                    if backend.outstanding < bound:
+                        return backend
+                    break
+
+            self.metrics.inc("calculator_proxy_fallbacks_total")
+
+        return min(healthy, key=lambda backend: backend.outstanding)
+
+    def forward(self, exchange: _Exchange):
+        """Sends a request to its backend, or queues it for a connection.
+
+        Args:
+            exchange (_Exchange): The request.
+        """
+        backend = self.choose(exchange)
+
+        if backend is None:
+            self.complete(exchange, self.overload_response)
+            return
+
+        exchange.backend = backend
+        exchange.tried.append(backend)
+        backend.outstanding += 1
+
+        try:
+            sock = backend.acquire()
+        except OSError:
+            # Refused connections mean the backend is down, not just busy
+            backend.healthy = False
+            self.fail(exchange)
+            return
+
+        if sock is None:
+            backend.queue.append(exchange)
+        else:
+            self.dispatch(exchange, sock)
+
+    def dispatch(self, exchange: _Exchange, sock: socket.socket):
+        """Starts sending a request on a backend connection.
+
+        The request is written as the connection accepts it, so a slow backend
+        never blocks the proxy. A new connection gets ``timeout`` seconds to
+        connect, then the request ``backend_timeout`` seconds to be answered.
+
+        Args:
+            exchange (_Exchange): The request.
+            sock (socket.socket): The backend connection.
+        """
+        backend = exchange.backend
+        connecting = sock in backend.connecting
+
+        exchange.sock = sock
+        exchange.reused = not connecting
+        exchange.outgoing = memoryview(exchange.request)
+        exchange.buffer = b""
+
+        self.selector.register(sock, selectors.EVENT_WRITE, exchange)
+        exchange.timer = self.timers.schedule(
+            backend.timeout if connecting else self.timeouts["backend"], exchange
+        )
+
+        self.metrics.inc("calculator_proxy_forwarded_total", backend=str(backend))
+
+        if not connecting:
+            self.send_request(exchange)
+
+    def send_request(self, exchange: _Exchange):
+        """Writes as much of a request as its backend connection accepts.
+
+        Args:
+            exchange (_Exchange): The request.
+        """
+        backend = exchange.backend
+        sock = exchange.sock
+
+        if sock in backend.connecting:
+            error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+
+            if error:
+                # Refused connections mean the backend is down, not just busy
+                backend.healthy = False
+                self.fail(exchange)
+                return
+
+            backend.connecting.discard(sock)
+            self.timers.cancel(exchange.timer)
+            exchange.timer = self.timers.schedule(self.timeouts["backend"], exchange)
+
+        try:
+            sent = sock.send(exchange.outgoing)
+        except BlockingIOError:
+            return
+        except OSError:
+            if exchange.reused:
+                self.reconnect(exchange)
+            else:
+                self.fail(exchange)
+            return
+
+        exchange.outgoing = exchange.outgoing[sent:]
+
+        if not exchange.outgoing:
+            self.selector.modify(sock, selectors.EVENT_READ, exchange)
+
+    def handle_event(self, key: selectors.SelectorKey, events: int):
+        """Handles a ready client connection, or backend connection.
+
+        Args:
+            key (selectors.SelectorKey): The key of the socket.
+            events (int): The events it is ready for.
+        """
+        if not isinstance(key.data, _Exchange):
+            super().handle_event(key, events)
+        elif events & selectors.EVENT_WRITE:
+            self.send_request(key.data)
+        else:
+            self.receive_response(key.data)
+
+    def receive_response(self, exchange: _Exchange):
+        """Reads a backend response and relays it once complete.
+
+        Args:
+            exchange (_Exchange): The request being answered.
+        """
+        try:
+            data = exchange.sock.recv(65536)
+        except OSError:
+            data = b""
+
+        if not data:
+            if exchange.reused and not exchange.buffer:
+                self.reconnect(exchange)
+            else:
+                self.fail(exchange)
+            return
+
+        exchange.buffer += data
+
+        try:
+            length = self.parser.message_length(exchange.buffer)
+        except ValueError:
+            # A response that cannot be framed leaves the connection unusable
+            self.fail(exchange)
+            return
+
+        if length is None:
+            return
+
+        backend = exchange.backend
+        self.release(exchange)
+        backend.release(exchange.sock)
+        self.dispatch_queued(backend)
+
+        self.complete(exchange, exchange.buffer[:length])
+
+    def release(self, exchange: _Exchange):
+        """Detaches a request from its backend connection.
+
+        Args:
+            exchange (_Exchange): The request.
+        """
+        if exchange.sock is not None:
+            self.selector.unregister(exchange.sock)
+
+        if exchange.timer is not None:
+            self.timers.cancel(exchange.timer)
+            exchange.timer = None
+
+        exchange.backend.outstanding -= 1
+
+    def dispatch_queued(self, backend: Backend):
+        """Sends the next queued request of a backend on a free connection.
+
+        Args:
+            backend (Backend): The backend.
+        """
+        while backend.queue and backend.idle:
+            self.dispatch(backend.queue.popleft(), backend.idle.pop())
+
+    def reconnect(self, exchange: _Exchange):
+        """Resends a request on a new connection to the same backend.
+
+        A pooled connection the backend closed while idle fails on the first
+        request sent on it. This says nothing of the backend's health, so the
+        request is not counted as tried. The other idle connections are at
+        least as old, so they are closed too.
+
+        Args:
+            exchange (_Exchange): The request.
+        """
+        backend = exchange.backend
+        self.release(exchange)
+        backend.discard(exchange.sock)
+        exchange.sock = None
+
+        while backend.idle:
+            backend.discard(backend.idle.pop())
+
+        backend.outstanding += 1
+
+        try:
+            sock = backend.acquire()
+        except OSError:
+            # Refused connections mean the backend is down, not just busy
+            backend.healthy = False
+            self.fail(exchange)
+            return
+
+        self.dispatch(exchange, sock)
+
+    def fail(self, exchange: _Exchange):
+        """Retries a request whose backend failed, or answers it with a 503.
+
+        Args:
+            exchange (_Exchange): The request.
+        """
+        backend = exchange.backend
+        self.metrics.inc("calculator_proxy_errors_total", backend=str(backend))
+
+        if exchange.sock is not None:
+            self.release(exchange)
+            backend.discard(exchange.sock)
+            exchange.sock = None
+        else:
+            backend.outstanding -= 1
+
+        if self.debug:
+            print(
+                "{}{}Request to backend {} failed.{}".format(
+                    bcolors.BOLD, bcolors.FAIL, backend, bcolors.ENDC
+                )
+            )
+
+        if len(exchange.tried) <= self.retries:
+            self.forward(exchange)
+        else:
+            self.complete(exchange, self.overload_response)
+
+    def complete(self, exchange: _Exchange, response: bytes):
+        """Relays the response of a request, keeping responses in order.
+
+        Args:
+            exchange (_Exchange): The request.
+            response (bytes or FileResponse): The HTTP response.
+        """
+        exchange.response = response
+        connection = exchange.connection
+
+        if exchange.backend is not None:
+            self.metrics.inc("calculator_requests_total", status=int(response[9:12]))
+            self.metrics.observe(
+                "calculator_request_duration_seconds",
+                time.perf_counter() - exchange.started,
+            )
+
+        exchanges = self.waiting.get(connection)
+        if exchanges is None:
+            return
+
+        while exchanges and exchanges[0].response is not None:
+            self.queue(connection, exchanges.popleft().response)
+
+        # Responses to requests of this read are sent once all are queued
+        if exchange.backend is not None:
+            self.send(connection)
+
+    def expire(self, item):
+        """Retries a request its backend did not answer in time, or closes a
+        connection that missed its deadline.
+
+        Args:
+            item: The expired request or connection.
+        """
+        if isinstance(item, _Exchange):
+            item.timer = None
+
+            if item.sock in item.backend.connecting:
+                item.backend.healthy = False
+
+            self.fail(item)
+        else:
+            super().expire(item)
+
+    def phase(self, connection: _Connection) -> str:
+        """Gets the phase of a connection, "backend" while responses are due.
+
+        Args:
+            connection (_Connection): The connection.
+
+        Returns:
+            str: The phase.
+        """
+        if not connection.outgoing and self.waiting.get(connection):
+            return "backend"
+
+        return super().phase(connection)
+
+    def disconnect(self, connection: _Connection):
+        """Closes a client connection and drops the responses still due.
+
+        Args:
+            connection (_Connection): The connection.
+        """
+        self.waiting.pop(connection, None)
+        super().disconnect(connection)
@@ -0,0 +1,108 @@
+"""Per-client rate limiting with token buckets."""
+
+import collections
+import threading
+import time
+
+
+class RateLimited(SystemError):
+    """Exception raised when a client sends requests faster than allowed."""
+
+
+def client_key(address):
+    """Get the key identifying a client from its address.
+
+    Clients are identified by host only, so a client cannot escape its limit
+    by sending from many ports.
+
+    Args:
+        address: A ``(host, port)`` pair or a Unix domain socket path.
+
+    Returns:
+        The host, or the path for Unix domain sockets.
+    """
+    return address[0] if isinstance(address, tuple) else address
+
+
+class _Bucket:
+    """Token bucket of one client, refilled lazily when it is next used."""
+
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token-bucket rate limiter keyed by client.
+
+    Each client may send ``burst`` requests at once and ``rate`` requests per
+    second after that. Buckets are only refilled when a request arrives, so
+    idle clients cost nothing but their entry, and the least recently seen
+    clients are forgotten beyond ``max_clients``. A forgotten client starts
+    again with a full bucket.
+
+    Args:
+        rate (float): Requests per second allowed per client. Defaults to 100.0.
+        burst (float): Size of the bucket. Defaults to 200.0.
+        max_clients (int): Maximum clients tracked. Defaults to 65536.
+        clock (callable): Time source. Defaults to ``time.monotonic``.
+    """
+
+    def __init__(
+        self,
+        rate: float = 100.0,
+        burst: float = 200.0,
+        max_clients: int = 65536,
+        clock=time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+
+        self.buckets = collections.OrderedDict()
+        self.limited = 0
+        self.evicted = 0
+        # Servers running one loop per thread share the limiter
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+    def allow(self, key, cost: float = 1.0) -> bool:
+        """Take tokens from a client's bucket.
+
+        Args:
+            key: The client key, see ``client_key``.
+            cost (float): Tokens the request costs. Defaults to 1.0.
+
+        Returns:
+            bool: True if the request is allowed, False if the client is over
+            its rate.
+        """
+        with self.lock:
+            now = self.clock()
+            bucket = self.buckets.get(key)
+
+            if bucket is None:
+                bucket = self.buckets[key] = _Bucket(self.burst, now)
+
+                if len(self.buckets) > self.max_clients:
+                    self.buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self.buckets.move_to_end(key)
+                bucket.tokens = min(
+                    self.burst, bucket.tokens + (now - bucket.updated) * self.rate
+                )
+                bucket.updated = now
+
+            if bucket.tokens < cost:
+                self.limited += 1
+                return False
+
+            bucket.tokens -= cost
+
+            return True
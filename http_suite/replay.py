@@ -0,0 +1,344 @@
+"""Replay of captured traffic against a server, with latency reports."""
+
+import collections
+import selectors
+import socket
+import time
+
+from . import binary
+from .address import address_family, socket_address
+from .capture import TCP, read_journal
+from .http import HTTPParser
+from .metrics import LogHistogram
+
+# Quantiles compared between replays
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class ReplayResult:
+    """Latencies and outcome of a replay.
+
+    Attributes:
+        latencies (LogHistogram): Seconds from when each request was due to be
+            sent until its whole response arrived.
+        statuses (collections.Counter): HTTP responses by status code.
+        sent (int): Requests sent.
+        answered (int): Requests answered in full.
+        elapsed (float): Seconds the replay took.
+    """
+
+    def __init__(self):
+        self.latencies = LogHistogram(precision=8)
+        self.statuses = collections.Counter()
+        self.sent = 0
+        self.answered = 0
+        self.elapsed = 0.0
+
+    @property
+    def lost(self) -> int:
+        """Requests without a complete response before the timeout."""
+        return self.sent - self.answered
+
+    def summary(self) -> dict:
+        """Summarize the replay.
+
+        Returns:
+            dict: The counts, the throughput and the latency quantiles.
+        """
+        count = self.latencies.count
+
+        summary = {
+            "sent": self.sent,
+            "answered": self.answered,
+            "lost": self.lost,
+            "requests_per_second": self.answered / self.elapsed if self.elapsed else 0,
+            "mean": self.latencies.sum / count if count else 0.0,
+        }
+
+        for q in QUANTILES:
+            summary["p{:g}".format(q * 100)] = self.latencies.quantile(q)
+
+        return summary
+
+
+class _Source:
+    """Connection or UDP socket replaying the requests of one captured source."""
+
+    __slots__ = ("sock", "transport", "buffer", "outgoing", "waiting")
+
+    def __init__(self, sock: socket.socket, transport: int):
+        self.sock = sock
+        self.transport = transport
+        self.buffer = bytearray()
+        self.outgoing = bytearray()
+        # Requests sent, as [due time, responses still expected]
+        self.waiting = collections.deque()
+
+
+class Replayer:
+    """Sends the requests of a capture journal to a server and times them.
+
+    Every source of the journal is replayed on its own connection, or its own
+    UDP socket, so requests reach the server in the captured interleaving.
+    Requests are sent at their captured times scaled by ``speed``, whether or
+    not earlier ones were answered, and their latency counts from when they
+    were due: a server falling behind cannot hide its delay by slowing the
+    replay down. Responses are matched to requests in order.
+
+    Args:
+        path (str): The journal file.
+        host (str): The server's host address. Defaults to "127.0.0.1".
+        port (int): The server's port number. Defaults to 50123.
+        speed (float): How many times faster than captured to send, or None
+            to send as fast as possible. Defaults to 1.0.
+        timeout (float): Seconds to wait for the last responses. Defaults to
+            5.0.
+        buffer_size (int): The size of the buffer for receiving data. Defaults
+            to 65536.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        speed: float = 1.0,
+        timeout: float = 5.0,
+        buffer_size: int = 65536,
+    ):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.timeout = timeout
+        self.buffer_size = buffer_size
+
+        self.parser = HTTPParser()
+
+    def open(self, transport: int) -> _Source:
+        """Open a connection or socket to the server for a source.
+
+        Args:
+            transport (int): ``TCP`` or ``UDP``.
+
+        Returns:
+            _Source: The source, with a non-blocking socket.
+        """
+        kind = socket.SOCK_STREAM if transport == TCP else socket.SOCK_DGRAM
+        sock = socket.socket(address_family(self.host), kind)
+        sock.connect(socket_address(self.host, self.port))
+        sock.setblocking(False)
+
+        return _Source(sock, transport)
+
+    def send(self, selector: selectors.BaseSelector, source: _Source):
+        """Write what the socket accepts of the requests queued on a source.
+
+        Args:
+            selector (selectors.BaseSelector): The replay's selector.
+            source (_Source): The source.
+        """
+        try:
+            sent = source.sock.send(source.outgoing)
+            del source.outgoing[:sent]
+        except BlockingIOError:
+            pass
+        except OSError:
+            # Reset by the server: what is left of the requests is lost
+            source.outgoing.clear()
+
+        events = selectors.EVENT_READ
+
+        if source.outgoing:
+            events |= selectors.EVENT_WRITE
+
+        selector.modify(source.sock, events, source)
+
+    def responses(self, source: _Source) -> list:
+        """Take the complete responses received on a source.
+
+        Args:
+            source (_Source): The source.
+
+        Returns:
+            list: The status of every response, None for binary frames.
+        """
+        statuses = []
+
+        if source.buffer[:1] == binary.MAGIC:
+            frames, source.buffer = binary.split_frames(source.buffer)
+            return [None] * len(frames)
+
+        length = self.parser.message_length(source.buffer)
+
+        while length:
+            statuses.append(int(source.buffer[9:12]))
+            del source.buffer[:length]
+
+            if source.transport != TCP:
+                break
+
+            length = self.parser.message_length(source.buffer)
+
+        return statuses
+
+    def receive(
+        self, selector: selectors.BaseSelector, source: _Source, result: ReplayResult
+    ):
+        """Read from a source and time the requests answered in full.
+
+        Args:
+            selector (selectors.BaseSelector): The replay's selector.
+            source (_Source): The readable source.
+            result (ReplayResult): The replay's result.
+        """
+        try:
+            data = source.sock.recv(self.buffer_size)
+        except (BlockingIOError, ConnectionRefusedError):
+            return
+        except OSError:
+            data = b""
+
+        # Closed by the server: later requests of the source reconnect
+        if not data and source.transport == TCP:
+            selector.unregister(source.sock)
+            source.sock.close()
+            return
+
+        if source.transport == TCP:
+            source.buffer += data
+        else:
+            # A datagram is a whole response
+            source.buffer = bytearray(data)
+
+        now = time.perf_counter()
+
+        for status in self.responses(source):
+            if status is not None:
+                result.statuses[status] += 1
+
+            if not source.waiting:
+                continue
+
+            request = source.waiting[0]
+            request[1] -= 1
+
+            if request[1] == 0:
+                source.waiting.popleft()
+                result.latencies.record(now - request[0])
+                result.answered += 1
+
+    def poll(
+        self, selector: selectors.BaseSelector, timeout: float, result: ReplayResult
+    ):
+        """Send and receive on the sources that are ready.
+
+        Args:
+            selector (selectors.BaseSelector): The replay's selector.
+            timeout (float): Seconds to wait for a source to be ready.
+            result (ReplayResult): The replay's result.
+        """
+        for key, events in selector.select(max(timeout, 0)):
+            if events & selectors.EVENT_WRITE:
+                self.send(selector, key.data)
+            if events & selectors.EVENT_READ:
+                self.receive(selector, key.data, result)
+
+    def run(self) -> ReplayResult:
+        """Replay the journal.
+
+        Returns:
+            ReplayResult: The latencies and outcome of the replay.
+        """
+        result = ReplayResult()
+        selector = selectors.DefaultSelector()
+        sources = {}
+        first = None
+        start = time.perf_counter()
+
+        for record in read_journal(self.path):
+            if first is None:
+                first = record.offset
+
+            due = start
+
+            if self.speed:
+                due += (record.offset - first) / self.speed
+
+                while time.perf_counter() < due:
+                    self.poll(selector, due - time.perf_counter(), result)
+            else:
+                due = time.perf_counter()
+
+            key = (record.transport, record.source)
+            source = sources.get(key)
+
+            if source is None or source.sock.fileno() == -1:
+                source = sources[key] = self.open(record.transport)
+                selector.register(source.sock, selectors.EVENT_READ, source)
+
+            expected = 1
+            if record.payload[:1] == binary.MAGIC:
+                expected = len(binary.split_frames(record.payload)[0])
+
+            source.waiting.append([due, expected])
+            result.sent += 1
+
+            if record.transport == TCP:
+                source.outgoing += record.payload
+                self.send(selector, source)
+            else:
+                try:
+                    source.sock.send(record.payload)
+                except (BlockingIOError, ConnectionRefusedError):
+                    pass
+
+            self.poll(selector, 0, result)
+
+        deadline = time.perf_counter() + self.timeout
+
+        while result.answered < result.sent and time.perf_counter() < deadline:
+            self.poll(selector, deadline - time.perf_counter(), result)
+
+        result.elapsed = time.perf_counter() - start
+
+        for source in sources.values():
+            if source.sock.fileno() != -1:
+                selector.unregister(source.sock)
+                source.sock.close()
+
+        selector.close()
+
+        return result
+
+
+def compare(baseline: ReplayResult, candidate: ReplayResult) -> str:
+    """Report how the latencies of two replays of a journal differ.
+
+    Args:
+        baseline (ReplayResult): The reference replay.
+        candidate (ReplayResult): The replay compared with it.
+
+    Returns:
+        str: One line per measure, with both values and the relative change.
+    """
+    before = baseline.summary()
+    after = candidate.summary()
+    lines = []
+
+    for name in before:
+        change = ""
+
+        if before[name]:
+            change = "{:+.1f}%".format(after[name] / before[name] * 100 - 100)
+
+        if isinstance(before[name], float) and name != "requests_per_second":
+            values = "{:.3f} ms -> {:.3f} ms".format(
+                before[name] * 1000, after[name] * 1000
+            )
+        else:
+            values = "{:g} -> {:g}".format(before[name], after[name])
+
+        lines.append("{:<20} {:<32} {}".format(name, values, change).rstrip())
+
+    return "\n".join(lines)
@@ -1,150 +1,1594 @@
 """TCP/UDP Calculator Servers."""
 
-import random
+import collections
+import errno
+import itertools
+import json
+import os
+import selectors
+import signal
 import socket
+import struct
 import sys
+import threading
+import time
 
+from . import binary, fragment
+from .address import address_family, is_unix_path, remove_stale_socket, socket_address
+from .admission import AdmissionController, ServiceUnavailable
 from .bcolors import bcolors
-from .calc import Calculator
-from .http import HTTPParser, HTTPResponse
+from .cache import ResultCache
+from .capture import TCP, UDP, Capture
+from .calc import Calculator, InvalidOperation, OperationIncomplete
+from .http import (
+    COMPRESS_MIN_SIZE,
+    LAST_CHUNK,
+    FileResponse,
+    HTTPParser,
+    HTTPResponse,
+    Request,
+    StreamResponse,
+    compress_message,
+    decode_message,
+    negotiate_encoding,
+)
+from .gather import IOV_MAX, advance, send_buffers, set_cork, set_nodelay
+from .impairment import ImpairedSocket, Impairment
+from .jobs import JobManager
+from .lifecycle import (
+    inherited_socket,
+    inherited_spool,
+    notify_parent,
+    spawn_successor,
+)
+from .memory import MemoryProfiler, format_report
+from .metrics import Metrics
+from .ratelimit import RateLimited, RateLimiter, client_key
+from .timerwheel import TimerWheel
+from .tracing import Tracer
+
+# How often a server waiting for requests checks whether it must drain
+POLL_INTERVAL = 0.5
+
+# Chunks a streamed response may produce before other connections are served
+STREAM_CHUNKS = 16
+
+# The socket module does not export SO_TIMESTAMP on Linux, where it is 29
+SO_TIMESTAMP = getattr(
+    socket, "SO_TIMESTAMP", 29 if sys.platform.startswith("linux") else None
+)
+
+# struct timeval of SO_TIMESTAMP control messages
+TIMEVAL = struct.Struct("@ll")
+
+# Largest UDP payload: larger responses need a fragmented request
+MAX_DATAGRAM = 65507
 
 
 class Server:
     """Base class for UDP/TCP servers using sockets.
 
-    Attributes:
-        host (str): The server's host address.
-        port (int): The server's port number.
-        buffer_size (int): The size of the buffer for receiving data.
-    """
+    A host containing a slash is a Unix domain socket path, which serves
+    co-located clients without going through the TCP/IP stack.
+
+    Attributes:
+        host (str): The server's host address or Unix domain socket path.
+        port (int): The server's port number.
+        buffer_size (int): The size of the buffer for receiving data.
+        debug (bool): Print every request and response.
+        transport: Factory of the server's socket with a ``socket(family, type)``
+            method, such as the ``socket`` module, or a ``SimNetwork`` for UDP
+            servers.
+        admission (AdmissionController): Sheds requests with a 503 response
+            when they queue for too long or too many are in flight.
+        rate_limit (RateLimiter): Answers clients sending too fast with a 429
+            response.
+        cache (ResultCache): Results of the expressions evaluated, shared by
+            every transport of the server. A ``SharedResultCache`` also shares
+            them with the other server processes of the host.
+        capture (Capture): Journal recording every request received, to be
+            replayed later.
+        tracer (Tracer): Writes the phases of sampled requests to a trace
+            file.
+        compress_min_size (int): Smallest response body compressed for the
+            clients accepting gzip or deflate, in bytes. None never compresses.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        buffer_size: int = 1024,
+        debug: bool = True,
+        transport=socket,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        cache: ResultCache = None,
+        capture: Capture = None,
+        tracer: Tracer = None,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
+    ):
+        self.host = host
+        self.port = port
+        self.buffer_size = buffer_size
+        self.debug = debug
+        self.transport = transport
+        self.admission = admission
+        self.rate_limit = rate_limit
+        self.cache = cache
+        self.capture = capture
+        self.tracer = tracer
+        self.compress_min_size = compress_min_size
+
+        # Trace of the request being handled, if it is sampled
+        self.trace = None
+
+        self.metrics = Metrics()
+        self.metrics.describe(
+            "calculator_requests_total", "counter", "Requests by response status."
+        )
+        self.metrics.describe(
+            "calculator_rejected_total",
+            "counter",
+            "Requests answered with 406 by exception type.",
+        )
+        self.metrics.describe(
+            "calculator_bytes_received_total", "counter", "Bytes received."
+        )
+        self.metrics.describe("calculator_bytes_sent_total", "counter", "Bytes sent.")
+        self.metrics.describe(
+            "calculator_active_connections", "gauge", "Open client connections."
+        )
+        self.metrics.describe(
+            "calculator_request_duration_seconds",
+            "histogram",
+            "Time spent processing a request.",
+        )
+
+        self.metrics.describe(
+            "calculator_shed_total", "counter", "Requests shed by admission control."
+        )
+
+        self.metrics.describe(
+            "calculator_rate_limited_total",
+            "counter",
+            "Requests answered with 429 because the client sent too fast.",
+        )
+
+        if cache is not None:
+            self.metrics.describe(
+                "calculator_cache_hits_total", "counter", "Results found in the cache."
+            )
+            self.metrics.describe(
+                "calculator_cache_misses_total", "counter", "Results not cached."
+            )
+            self.metrics.describe(
+                "calculator_cache_entries", "gauge", "Results in the cache."
+            )
+            self.metrics.register_collector(self.collect_cache)
+
+        # Built once, so rejecting a request costs no formatting
+        self.overload_response = (
+            HTTPResponse().build_response(status=503, data="-1").encode()
+        )
+        self.rate_limited_response = (
+            HTTPResponse().build_response(status=429, data="-1").encode()
+        )
+
+        # Shares evaluations between threads serving identical expressions at
+        # once; set by ``ThreadedServer``, as a single loop never has any
+        self.inflight = None
+
+        # Bulk jobs, evaluated by worker processes started on the first one
+        self.jobs = JobManager()
+
+        # Traces allocations once started through /memory or SIGUSR1
+        self.profiler = MemoryProfiler()
+
+        spool = inherited_spool()
+        if spool is not None:
+            self.jobs.adopt(spool)
+
+        # Request paths served by something other than the calculator
+        self.routes = {
+            "/metrics": self.serve_metrics,
+            "/stats": self.serve_stats,
+            "/batch": self.serve_batch,
+            "/batch/stream": self.serve_batch_stream,
+            "/jobs": self.serve_jobs,
+            "/jobs/result": self.serve_job_result,
+            "/memory": self.serve_memory,
+        }
+
+        # Set by SIGTERM: stop taking requests, finish those in flight, exit
+        self.draining = False
+        # Set once a new process serves from our socket, which it now owns
+        self.handed_off = False
+
+        inherited = None
+        if isinstance(self.server_socket, socket.socket):
+            inherited = inherited_socket(self.server_socket)
+
+        self.inherited = inherited is not None
+
+        if self.inherited:
+            self.server_socket.close()
+            self.server_socket = inherited
+        else:
+            if is_unix_path(host):
+                remove_stale_socket(host)
+
+            self.server_socket.bind(socket_address(host, port))
+
+    def collect_cache(self, metrics: Metrics):
+        """Sets the cache metrics.
+
+        Args:
+            metrics (Metrics): The server's metrics.
+        """
+        metrics.set("calculator_cache_hits_total", self.cache.hits)
+        metrics.set("calculator_cache_misses_total", self.cache.misses)
+        metrics.set("calculator_cache_entries", len(self.cache))
+
+    def allow(self, address) -> bool:
+        """Checks a client against the rate limit.
+
+        Args:
+            address: The client's address.
+
+        Returns:
+            bool: True to serve the request, False to answer with a 429.
+        """
+        if self.rate_limit is None or self.rate_limit.allow(client_key(address)):
+            return True
+
+        self.metrics.inc("calculator_rate_limited_total")
+        self.metrics.inc("calculator_requests_total", status=429)
+
+        return False
+
+    def admit(self, arrival: float = None) -> bool:
+        """Decides whether to serve a request or shed it.
+
+        Args:
+            arrival (float): When the request arrived, as ``time.time()``.
+                Defaults to now.
+
+        Returns:
+            bool: True to serve the request, False to answer with a 503.
+        """
+        if self.admission is None:
+            return True
+
+        reason = self.admission.admit(arrival)
+
+        if reason is None:
+            return True
+
+        self.metrics.inc("calculator_shed_total", reason=reason)
+        self.metrics.inc("calculator_requests_total", status=503)
+
+        return False
+
+    def respond(self, status: int, data: str = None, content_type: str = None) -> str:
+        """Builds an HTTP response and counts it by status.
+
+        Args:
+            status (int): The HTTP status code.
+            data (str): The response body data.
+            content_type (str): The body's media type. Defaults to "text/plain".
+
+        Returns:
+            str: The HTTP response message.
+        """
+        self.metrics.inc("calculator_requests_total", status=status)
+
+        if self.trace is not None:
+            self.trace.args["status"] = status
+
+        return HTTPResponse().build_response(
+            status=status, data=data, content_type=content_type
+        )
+
+    def serve_metrics(self, request: Request) -> str:
+        """Serves the metrics in the Prometheus text format.
+
+        Args:
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        return self.respond(
+            200, self.metrics.render(), content_type="text/plain; version=0.0.4"
+        )
+
+    def serve_stats(self, request: Request) -> str:
+        """Serves a JSON summary of the metrics with latency percentiles.
+
+        Args:
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        return self.respond(200, self.metrics.stats(), content_type="application/json")
+
+    def process_request(self, message: str) -> str:
+        """Processes an HTTP request and returns an HTTP response.
+
+        Args:
+            message (str): The HTTP request message.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        start = time.perf_counter()
+        response = None
+
+        self.trace_phase("receive")
+
+        if self.admission is not None:
+            self.admission.begin()
+
+        try:
+            response = self.handle_request(message)
+            return response
+        finally:
+            if self.admission is not None:
+                self.admission.end()
+
+            # Streamed responses are observed once their evaluation ends
+            if not isinstance(response, StreamResponse):
+                self.metrics.observe(
+                    "calculator_request_duration_seconds", time.perf_counter() - start
+                )
+
+    def handle_request(self, message: str) -> str:
+        """Routes an HTTP request and evaluates its expression.
+
+        Args:
+            message (str): The HTTP request message.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        parser = HTTPParser()
+
+        request = parser.read_request(message)
+
+        if self.trace is not None:
+            self.trace.mark("parse")
+            if request is not None:
+                self.trace.name = "{} {}".format(request.method, request.file)
+
+        if request is not None and request.file in self.routes:
+            response = self.routes[request.file](request)
+            self.trace_phase("evaluate")
+            return self.encode_response(request, response)
+
+        # Invalid request (no expression sent)
+        if request is None or "expression" not in request.params:
+
+            if self.debug:
+                print("Request is invalid. Missing parameters.")
+            self.metrics.inc("calculator_rejected_total", reason="MissingParameters")
+            return self.respond(406, "-1")
+
+        status, data = self.evaluate_expression(request.params["expression"][0])
+        self.trace_phase("evaluate")
+
+        return self.encode_response(request, self.respond(status, data))
+
+    def encode_response(self, request: Request, response):
+        """Compresses a response in a content coding the client accepts.
+
+        Bodies smaller than ``compress_min_size`` are sent as they are, and so
+        are files, which are sent straight from disk. Streamed bodies are
+        compressed chunk by chunk whatever their size.
+
+        Args:
+            request (Request): The parsed HTTP request.
+            response (str, FileResponse or StreamResponse): The response.
+
+        Returns:
+            The response, compressed if the client accepts it.
+        """
+        if self.compress_min_size is None or isinstance(response, FileResponse):
+            return response
+
+        accept = request.header("Accept-Encoding")
+        encoding = negotiate_encoding(accept) if accept else None
+
+        if encoding is None:
+            return response
+
+        if isinstance(response, StreamResponse):
+            response.compress(encoding)
+            return response
+
+        return compress_message(response, encoding, self.compress_min_size)
+
+    def decode_request(self, data: bytes) -> str:
+        """Decodes a received HTTP request, decompressing its body if needed.
+
+        Args:
+            data (bytes): The request.
+
+        Returns:
+            str: The request, or None if its body cannot be decompressed.
+        """
+        try:
+            return decode_message(data)
+        except (ValueError, UnicodeDecodeError):
+            if self.debug:
+                print("Request is invalid. Cannot decode its body.")
+            self.metrics.inc("calculator_rejected_total", reason="ContentEncoding")
+            return None
+
+    def start_trace(self, start: float):
+        """Starts tracing the request about to be handled if it is sampled.
+
+        Args:
+            start (float): When the request was received, as ``time.time()``.
+        """
+        self.trace = self.tracer.start("request", start)
+
+    def trace_phase(self, phase: str):
+        """Ends a phase of the request being handled, if it is traced.
+
+        Args:
+            phase (str): The phase, e.g. "evaluate".
+        """
+        if self.trace is not None:
+            self.trace.mark(phase)
+
+    def finish_trace(self, phase: str):
+        """Ends the last phase and the trace of the request being handled.
+
+        Args:
+            phase (str): The last phase, e.g. "send".
+        """
+        if self.trace is not None:
+            self.trace.mark(phase)
+            self.trace.finish()
+            self.trace = None
+
+    def evaluate_expression(self, expression: str) -> tuple:
+        """Evaluates an expression, counting and reporting errors.
+
+        Args:
+            expression (str): The expression, e.g. "+ 1 2".
+
+        Returns:
+            tuple: The HTTP status (200 or 406) and the result ("-1" on errors).
+        """
+        calc = Calculator()
+
+        if self.debug:
+            print(
+                "{}Expression received:{} {}".format(
+                    bcolors.OKBLUE, bcolors.ENDC, expression
+                )
+            )
+
+        # Evaluate the expression, unless its result is cached
+        try:
+            key = calc.normalize(expression)
+            result = None if self.cache is None else self.cache.get(key)
+
+            if result is None:
+                if self.inflight is None:
+                    result = calc.evaluate(key)
+                else:
+                    result = self.inflight.do(key, calc.evaluate, key)
+
+                if self.cache is not None:
+                    self.cache.put(key, result)
+            if self.debug:
+                print(
+                    "{}Expression valid{}, result = {}".format(
+                        bcolors.OKGREEN, bcolors.ENDC, result
+                    )
+                )
+
+            return 200, result
+
+        # Send error message if not valid
+        except Exception as exc:
+            if self.debug:
+                print(
+                    "{}An exception occurred:{} {} ({})".format(
+                        bcolors.FAIL, bcolors.ENDC, str(exc), type(exc).__name__
+                    )
+                )
+            self.metrics.inc("calculator_rejected_total", reason=type(exc).__name__)
+
+            return 406, "-1"
+
+    def serve_batch(self, request: Request) -> str:
+        """Evaluates every expression of a request.
+
+        The response body has one line per expression, in order, with its status
+        and result, e.g. "200 3" or "406 -1".
+
+        Args:
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        lines = [
+            "{} {}".format(*self.evaluate_expression(expression))
+            for expression in request.params.get("expression", [])
+        ]
+
+        return self.respond(200, "\n".join(lines))
+
+    def serve_batch_stream(self, request: Request) -> StreamResponse:
+        """Evaluates every expression of a request, streaming the results.
+
+        The body has the lines of ``POST /batch``, sent with chunked transfer
+        encoding as the expressions are evaluated.
+
+        Args:
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            StreamResponse: The HTTP response, evaluating while it is sent.
+        """
+        return HTTPResponse().build_stream_response(
+            self.evaluate_stream(request.params.get("expression", []))
+        )
+
+    def evaluate_stream(self, expressions: list):
+        """Evaluates expressions one by one, as a streamed response asks for them.
+
+        The batch counts as in flight until its last line is produced. It is
+        counted as a 200 and its evaluation time observed once complete, so a
+        stream abandoned by its client is only observed. Time spent waiting
+        for the client to read is not part of the duration.
+
+        Args:
+            expressions (list): The expressions, e.g. ["+ 1 2", "* 3 4"].
+
+        Yields:
+            str: The line of every expression, e.g. "200 3\n".
+        """
+        elapsed = 0.0
+
+        if self.admission is not None:
+            self.admission.begin()
+
+        try:
+            for expression in expressions:
+                start = time.perf_counter()
+                line = "{} {}\n".format(*self.evaluate_expression(expression))
+                elapsed += time.perf_counter() - start
+
+                yield line
+
+            self.metrics.inc("calculator_requests_total", status=200)
+        finally:
+            if self.admission is not None:
+                self.admission.end()
+
+            self.metrics.observe("calculator_request_duration_seconds", elapsed)
+
+    def serve_jobs(self, request: Request) -> str:
+        """Starts a bulk job, or reports the status of one.
+
+        ``POST /jobs`` takes an expression file, one expression per line, as
+        its body and answers with 202 and the job status. ``GET /jobs`` with
+        an ``id`` parameter answers with the status of that job.
+
+        Args:
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        if request.method == "POST":
+            job = self.jobs.submit(request.body)
+
+            if self.debug:
+                print(
+                    "{}Job {} started:{} {} expressions".format(
+                        bcolors.OKBLUE, job.id, bcolors.ENDC, job.expressions
+                    )
+                )
+
+            return self.respond(
+                202, json.dumps(job.progress()), content_type="application/json"
+            )
+
+        job = self.jobs.get(request.params.get("id", [None])[0])
+
+        if job is None:
+            return self.respond(404, "-1")
+
+        return self.respond(
+            200, json.dumps(job.progress()), content_type="application/json"
+        )
+
+    def serve_job_result(self, request: Request):
+        """Answers with the results of a finished job.
+
+        The results have one line per expression, as for ``POST /batch``. They
+        are read from the job's result files while being sent.
+        UDP servers answer with 406 instead when the results do not fit in one
+        datagram and the request was not fragmented.
+
+        Args:
+            request (Request): The parsed HTTP request, with the ``id`` parameter.
+
+        Returns:
+            FileResponse: The results, or an HTTP response message with 404 for
+            an unknown job, 202 for a job still running and 406 for a failed one.
+        """
+        job = self.jobs.get(request.params.get("id", [None])[0])
+
+        if job is None:
+            return self.respond(404, "-1")
+
+        status = job.status
+
+        if status == "failed":
+            return self.respond(406, "-1")
+
+        if status != "done":
+            return self.respond(
+                202, json.dumps(job.progress()), content_type="application/json"
+            )
+
+        self.metrics.inc("calculator_requests_total", status=200)
+
+        return HTTPResponse().build_file_response(job.results)
+
+    def memory_tables(self) -> dict:
+        """Gets the number of entries of the server's caches and tables.
+
+        Returns:
+            dict: The entries of every table, by name.
+        """
+        tables = {"jobs": len(self.jobs)}
+
+        if self.cache is not None:
+            tables["cache"] = len(self.cache)
+
+        if self.rate_limit is not None:
+            tables["rate_limit"] = len(self.rate_limit)
+
+        if self.inflight is not None:
+            tables["inflight"] = len(self.inflight.calls)
+
+        return tables
+
+    def serve_memory(self, request: Request, tables: dict = None) -> str:
+        """Serves a JSON report of where the process's memory goes.
+
+        The ``action`` parameter starts or stops tracing allocations, or takes
+        a snapshot, before reporting. The report holds the top allocation sites
+        of the last snapshot, the diff of the last two and the table sizes.
+
+        Args:
+            request (Request): The parsed HTTP request, with an optional
+                ``action`` parameter: "start", "stop" or "snapshot".
+            tables (dict): Table sizes to report. Defaults to the server's.
+
+        Returns:
+            str: The HTTP response message, 406 for an unknown action or a
+            snapshot while allocations are not traced.
+        """
+        action = request.params.get("action", [None])[0]
+
+        if action == "start":
+            self.profiler.start()
+        elif action == "stop":
+            self.profiler.stop()
+        elif action == "snapshot" and self.profiler.tracing:
+            self.profiler.snapshot()
+        elif action is not None:
+            return self.respond(406, "-1")
+
+        report = self.profiler.report(
+            self.memory_tables() if tables is None else tables
+        )
+
+        return self.respond(200, json.dumps(report), content_type="application/json")
+
+    def snapshot_memory(self, *args, tables: dict = None):
+        """Starts tracing allocations, then prints a report on every call.
+
+        Installed as the SIGUSR1 handler by ``run``: the first signal starts
+        tracing, and every later one takes a snapshot and prints where memory
+        goes and what changed since the previous signal.
+
+        Args:
+            tables (dict): Table sizes to report. Defaults to the server's.
+        """
+        if not self.profiler.tracing:
+            self.profiler.start()
+            print(
+                "{}{}Tracing memory allocations.{}".format(
+                    bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                )
+            )
+            return
+
+        self.profiler.snapshot()
+        report = self.profiler.report(
+            self.memory_tables() if tables is None else tables
+        )
+
+        print("----------------")
+        print(format_report(report))
+
+    def process_binary(self, opcode: int, request_id: int, payload: bytes) -> bytes:
+        """Evaluates a binary request frame and returns the response frame.
+
+        Args:
+            opcode (int): The request opcode.
+            request_id (int): The request ID, echoed in the response.
+            payload (bytes): The varint-encoded operands.
+
+        Returns:
+            bytes: The response frame.
+        """
+        start = time.perf_counter()
+        calc = Calculator()
+
+        if self.admission is not None:
+            self.admission.begin()
+
+        try:
+            if opcode not in binary.OPERATIONS:
+                raise InvalidOperation("Operation not supported")
+
+            try:
+                a, b = binary.decode_operands(payload)
+            except binary.IncompleteFrame:
+                raise OperationIncomplete("Not enough arguments")
+
+            op = binary.OPERATIONS[opcode]
+            result = self.apply(calc, op, a, b)
+
+            self.metrics.inc("calculator_requests_total", status=200)
+            return binary.encode_result(request_id, result)
+
+        except Exception as exc:
+            if self.debug:
+                print(
+                    "{}An exception occurred:{} {} ({})".format(
+                        bcolors.FAIL, bcolors.ENDC, str(exc), type(exc).__name__
+                    )
+                )
+            self.metrics.inc("calculator_requests_total", status=406)
+            self.metrics.inc("calculator_rejected_total", reason=type(exc).__name__)
+
+            return binary.encode_error(request_id, exc)
+
+        finally:
+            if self.admission is not None:
+                self.admission.end()
+
+            self.metrics.observe(
+                "calculator_request_duration_seconds", time.perf_counter() - start
+            )
+
+    def apply(self, calc: Calculator, op: str, a: int, b: int):
+        """Applies an operation, sharing cached results with HTTP requests.
+
+        Args:
+            calc (Calculator): The calculator.
+            op (str): The operation, e.g. "+".
+            a (int): The first operand.
+            b (int): The second operand.
+
+        Returns:
+            int or float: The result.
+        """
+        if self.cache is None:
+            return calc.apply(op, a, b)
+
+        key = "{} {} {}".format(op, a, b)
+        result = self.cache.get(key)
+
+        if result is None:
+            result = calc.apply(op, a, b)
+            self.cache.put(key, str(result))
+            return result
+
+        return float(result) if "." in result or "e" in result else int(result)
+
+    def drain(self, *args):
+        """Stops taking new requests and exits once those in flight are done.
+
+        Installed as the SIGTERM handler by ``run``.
+        """
+        if not self.draining:
+            print(
+                "{}{}Draining server.{}".format(
+                    bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                )
+            )
+        self.draining = True
+
+    def restart(self, *args):
+        """Starts a new server process on the same socket.
+
+        The new process drains this one once it is serving, so the socket keeps
+        accepting requests throughout. Installed as the SIGHUP handler by
+        ``run``.
+        """
+        if self.handed_off:
+            return
+
+        print(
+            "{}{}Restarting server.{}".format(
+                bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+            )
+        )
+        # The new process starts warm from the results cached so far
+        if self.cache is not None:
+            self.cache.save()
+
+        spawn_successor(self.listeners(), self.jobs.directory)
+        self.handed_off = True
+
+    def listeners(self) -> list:
+        """Gets the sockets handed over to a new process on restart.
+
+        Returns:
+            list: The server sockets.
+        """
+        return [self.server_socket]
+
+    def start(self):
+        """Installs the signal handlers and takes over from a previous process.
+
+        Signal handlers can only be installed from the main thread, so servers
+        run in other threads are drained by calling ``drain`` instead.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.drain)
+
+            if hasattr(signal, "SIGHUP"):
+                signal.signal(signal.SIGHUP, self.restart)
+
+            if hasattr(signal, "SIGUSR1"):
+                signal.signal(signal.SIGUSR1, self.snapshot_memory)
+
+        if self.inherited:
+            notify_parent()
+
+    def close(self):
+        """Closes the server socket and removes its Unix domain socket file.
+
+        The file is left in place once the socket was handed over to a new
+        process, and so are the bulk jobs, which the new process resumes. The
+        result cache is saved to its snapshot file, if it has one, and the
+        capture journal and the trace file are written out.
+        """
+        self.server_socket.close()
+        self.jobs.close(keep=self.handed_off)
+
+        if self.cache is not None:
+            self.cache.close()
+
+        if self.capture is not None:
+            self.capture.close()
+
+        if self.tracer is not None:
+            self.tracer.close()
+
+        if is_unix_path(self.host) and not self.handed_off:
+            remove_stale_socket(self.host)
+
+    def listen(self):
+        """Starts taking requests. Datagram sockets take them once bound."""
+
+    def serve(self):
+        """Serves requests until drained. Must be implemented by subclasses."""
+        raise NotImplementedError
+
+    def run(self):
+        """Runs the server. Must be implemented by subclasses."""
+        raise NotImplementedError
+
+
+class _FileRegion:
+    """Part of a file still to be sent on a connection."""
+
+    __slots__ = ("file", "offset", "remaining")
+
+    def __init__(self, path: str, size: int):
+        self.file = open(path, "rb")
+        self.offset = 0
+        self.remaining = size
+
+
+class _Connection:
+    """State of one client connection of the TCP server."""
+
+    __slots__ = (
+        "sock",
+        "address",
+        "buffer",
+        "binary",
+        "outgoing",
+        "phase",
+        "timer",
+        "closing",
+        "source",
+    )
+
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = bytearray()
+        # Binary framing is chosen by the first byte of the connection
+        self.binary = None
+        # Responses still to be sent, as bytes and file regions
+        self.outgoing = collections.deque()
+        self.phase = None
+        self.timer = None
+        self.closing = False
+        # ID of the connection in the capture journal
+        self.source = None
+
+
+class TCPServer(Server):
+    """Reliable TCP server implementation.
+
+    Connections are served concurrently by a single event loop. Their deadlines
+    are kept on a timer wheel, so that silent or slow clients are disconnected
+    without holding the server.
+
+    Attributes:
+        host (str): The server's host address or Unix domain socket path.
+            Defaults to "127.0.0.1".
+        port (int): The server's port number. Defaults to 50123.
+        buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
+        debug (bool): Print every request and response. Defaults to True.
+        transport: Factory of the server's socket. Defaults to ``socket``.
+        admission (AdmissionController): Load shedding policy. Defaults to None.
+        rate_limit (RateLimiter): Per-client rate limit. Defaults to None.
+        cache (ResultCache): Cache of results. Defaults to None.
+        capture (Capture): Journal of the requests received. Defaults to None.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest response body compressed, or None
+            to never compress. Defaults to 1024.
+        header_timeout (float): Seconds to receive a request header, from its
+            first byte or from the connection. Defaults to 10.0.
+        body_timeout (float): Seconds to receive a request body once its header
+            is complete. Defaults to 30.0.
+        idle_timeout (float): Seconds a connection may wait for its next
+            request. Defaults to 60.0.
+        write_timeout (float): Seconds a client may go without reading any of
+            its pending response. Defaults to 30.0.
+        drain_timeout (float): Seconds to finish the requests in flight when
+            draining, before closing their connections anyway. Defaults to 30.0.
+    """
+
+    name = "TCP server"
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        buffer_size: int = 1024,
+        debug: bool = True,
+        transport=socket,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        cache: ResultCache = None,
+        capture: Capture = None,
+        tracer: Tracer = None,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
+        header_timeout: float = 10.0,
+        body_timeout: float = 30.0,
+        idle_timeout: float = 60.0,
+        write_timeout: float = 30.0,
+        drain_timeout: float = 30.0,
+    ):
+        self.server_socket = transport.socket(address_family(host), socket.SOCK_STREAM)
+        super().__init__(
+            host,
+            port,
+            buffer_size,
+            debug,
+            transport,
+            admission,
+            rate_limit,
+            cache,
+            capture,
+            tracer,
+            compress_min_size,
+        )
+
+        self.timeouts = {
+            "header": header_timeout,
+            "body": body_timeout,
+            "idle": idle_timeout,
+            "write": write_timeout,
+        }
+        self.metrics.describe(
+            "calculator_timeouts_total", "counter", "Connections closed on timeout."
+        )
+
+        self.drain_timeout = drain_timeout
+
+        self.parser = HTTPParser()
+        self.selector = selectors.DefaultSelector()
+        self.timers = TimerWheel()
+        self.connections = set()
+
+        # When the selector last returned: requests read from the connections
+        # it reported have been waiting behind each other since then
+        self.polled = time.time()
+
+    def process_tcp_frame(self, frame: tuple, address, arrival: float) -> bytes:
+        """Answers a binary frame unless the client is limited or shed.
+
+        Args:
+            frame (tuple): The opcode, request ID and payload.
+            address: The client's address.
+            arrival (float): When the frame was received.
+
+        Returns:
+            bytes: The response frame.
+        """
+        if not self.allow(address):
+            return binary.encode_error(frame[1], RateLimited())
+
+        if not self.admit(arrival):
+            return binary.encode_error(frame[1], ServiceUnavailable())
+
+        return self.process_binary(*frame)
+
+    def process_tcp_message(self, message: str, address, arrival: float):
+        """Answers an HTTP request unless the client is limited or shed.
+
+        Args:
+            message (str): The HTTP request message.
+            address: The client's address.
+            arrival (float): When the request was received.
+
+        Returns:
+            bytes, FileResponse or StreamResponse: The HTTP response.
+        """
+        if self.debug:
+            print("----------------")
+            print(
+                "{}{}Received packet. Data:{}\n{}".format(
+                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, message
+                )
+            )
+
+        if not self.allow(address):
+            return self.rate_limited_response
+
+        if not self.admit(arrival):
+            return self.overload_response
+
+        response = self.process_request(message)
+
+        if self.debug:
+            print(
+                "\n{}{}Sending response. Data:{}\n{}".format(
+                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
+                )
+            )
+
+        if isinstance(response, (FileResponse, StreamResponse)):
+            self.trace_phase("build")
+            return response
+
+        response = response.encode()
+        self.trace_phase("build")
+
+        return response
+
+    def memory_tables(self) -> dict:
+        """Gets the number of entries of the server's caches and tables.
+
+        Returns:
+            dict: The entries of every table, with the open connections, their
+            timers and the bytes buffered for incomplete requests.
+        """
+        tables = super().memory_tables()
+        tables["connections"] = len(self.connections)
+        tables["timers"] = len(self.timers)
+        tables["buffered_bytes"] = sum(
+            len(connection.buffer) for connection in self.connections
+        )
+
+        return tables
+
+    def queue(self, connection: _Connection, response):
+        """Queues a response to be sent on a connection.
+
+        Args:
+            connection (_Connection): The connection.
+            response (bytes, FileResponse or StreamResponse): The response.
+        """
+        if isinstance(response, StreamResponse):
+            connection.outgoing.append(response.header.encode())
+            connection.outgoing.append(response)
+            return
+
+        if not isinstance(response, FileResponse):
+            connection.outgoing.append(response)
+            return
+
+        connection.outgoing.append(response.header.encode())
+
+        for path in response.paths:
+            size = os.path.getsize(path)
+            if size:
+                connection.outgoing.append(_FileRegion(path, size))
+
+    def handle_message(self, connection: _Connection, message: str, arrival: float):
+        """Queues the response to an HTTP request received on a connection.
+
+        Args:
+            connection (_Connection): The connection.
+            message (str): The HTTP request message.
+            arrival (float): When the request was received.
+        """
+        self.queue(
+            connection, self.process_tcp_message(message, connection.address, arrival)
+        )
+
+    def accept(self, listener: socket.socket):
+        """Accepts the pending connections and starts their header timeouts.
+
+        The whole backlog is accepted at once, so connections that queued
+        together are polled together and count as waiting for admission.
+
+        Args:
+            listener (socket.socket): The listening socket.
+        """
+        while True:
+            try:
+                client_socket, address = listener.accept()
+            except BlockingIOError:
+                return
+
+            client_socket.setblocking(False)
+            set_nodelay(client_socket)
+
+            connection = _Connection(client_socket, address)
+            self.connections.add(connection)
+
+            if self.capture is not None:
+                connection.source = self.capture.new_source()
+
+            self.selector.register(client_socket, selectors.EVENT_READ, connection)
+            self.metrics.inc("calculator_active_connections")
+
+            self.update_timer(connection)
+
+    def receive(self, connection: _Connection):
+        """Reads from a connection and queues the responses to what arrived.
+
+        Args:
+            connection (_Connection): The readable connection.
+        """
+        try:
+            data = connection.sock.recv(self.buffer_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        arrival = self.polled
+
+        if not data:
+            if self.debug:
+                print("----------------")
+                print(
+                    "{}{}Connection ended.{}".format(
+                        bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                    )
+                )
+            self.disconnect(connection)
+            return
+
+        self.metrics.inc("calculator_bytes_received_total", len(data))
+
+        if connection.binary is None:
+            connection.binary = data[:1] == binary.MAGIC
+
+        connection.buffer += data
+
+        # Traces of the requests answered, finished once their responses left
+        traces = []
+
+        if connection.binary:
+            received = connection.buffer
+
+            try:
+                frames, connection.buffer = binary.split_frames(connection.buffer)
+            except ValueError:
+                # Garbage instead of a frame: answer what came before and leave
+                frames, connection.buffer = [], bytearray()
+                connection.closing = True
+
+            if frames and self.capture is not None:
+                complete = bytes(received[: len(received) - len(connection.buffer)])
+                self.capture.record(TCP, connection.source, complete, arrival)
+
+            if frames:
+                connection.outgoing.append(
+                    b"".join(
+                        self.process_tcp_frame(frame, connection.address, arrival)
+                        for frame in frames
+                    )
+                )
+
+        else:
+            # Answer every complete request received so far
+            length = self.request_length(connection)
+
+            while length:
+                request = connection.buffer[:length]
+                message = self.decode_request(request)
+                del connection.buffer[:length]
+
+                if self.capture is not None:
+                    self.capture.record(TCP, connection.source, request, arrival)
+
+                if message is None:
+                    self.queue(connection, self.respond(406, "-1").encode())
+                    length = self.request_length(connection)
+                    continue
+
+                if self.tracer is not None:
+                    self.start_trace(arrival)
+
+                self.handle_message(connection, message, arrival)
+
+                if self.trace is not None:
+                    traces.append(self.trace)
+                    self.trace = None
+
+                length = self.request_length(connection)
+
+        self.send(connection)
+
+        for self.trace in traces:
+            self.finish_trace("send")
+
+    def request_length(self, connection: _Connection) -> int:
+        """Gets the length of the first complete request received on a connection.
+
+        A request whose length cannot be read is answered with a 406, and the
+        connection is closed once the responses before it are sent.
 
-    def __init__(
-        self, host: str = "127.0.0.1", port: int = 50123, buffer_size: int = 1024
-    ):
-        self.host = host
-        self.port = port
-        self.buffer_size = buffer_size
+        Args:
+            connection (_Connection): The connection.
 
-        self.server_socket.bind((host, port))
+        Returns:
+            int: The length of the request, or None if it is incomplete or
+            malformed.
+        """
+        try:
+            return self.parser.message_length(connection.buffer)
+        except ValueError:
+            if self.debug:
+                print("Request is invalid. Cannot read its length.")
+            self.metrics.inc("calculator_rejected_total", reason="Framing")
+            self.queue(connection, self.respond(406, "-1").encode())
+            connection.buffer = bytearray()
+            connection.closing = True
+            return None
 
-    def process_request(self, message: str) -> str:
-        """Processes an HTTP request and returns an HTTP response.
+    def send(self, connection: _Connection):
+        """Writes as much of the pending responses as the socket accepts.
 
         Args:
-            message (str): The HTTP request message.
+            connection (_Connection): The connection.
+        """
+        total = 0
+        outgoing = connection.outgoing
+        produced = 0
+
+        # Headers and the pieces of files or streams that follow them are
+        # written by separate calls: send them in full segments
+        corked = not all(isinstance(item, (bytes, memoryview)) for item in outgoing)
+
+        try:
+            if corked:
+                set_cork(connection.sock, True)
+
+            while outgoing:
+                chunk = outgoing[0]
+
+                if isinstance(chunk, StreamResponse):
+                    # Leave the loop to other connections between a few chunks
+                    if produced == STREAM_CHUNKS:
+                        break
+
+                    outgoing.appendleft(self.next_chunk(chunk))
+                    produced += 1
+
+                    if outgoing[0].endswith(LAST_CHUNK):
+                        del outgoing[1]
+
+                    continue
+
+                elif isinstance(chunk, _FileRegion):
+                    sent = self.send_file(connection.sock, chunk)
+
+                    if not chunk.remaining or not sent:
+                        chunk.file.close()
+                        outgoing.popleft()
+                else:
+                    # Write the responses queued back to back in one call
+                    buffers = list(
+                        itertools.takewhile(
+                            lambda item: isinstance(item, (bytes, memoryview)),
+                            itertools.islice(outgoing, IOV_MAX),
+                        )
+                    )
+                    sent = send_buffers(connection.sock, buffers)
+                    advance(outgoing, sent)
+
+                total += sent
+
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.disconnect(connection)
+            return
+
+        finally:
+            if corked and connection.sock.fileno() != -1:
+                set_cork(connection.sock, False)
+
+            self.metrics.inc("calculator_bytes_sent_total", total)
+
+        if not connection.outgoing and connection.closing:
+            self.disconnect(connection)
+            return
+
+        # Stop reading from clients that do not read their responses
+        events = selectors.EVENT_WRITE if connection.outgoing else selectors.EVENT_READ
+        self.selector.modify(connection.sock, events, connection)
+
+        self.update_timer(connection, restart=total > 0)
+
+    def next_chunk(self, stream: StreamResponse) -> bytes:
+        """Produces the next chunk of a streamed response.
+
+        Pieces are gathered until they fill ``buffer_size`` bytes, so a chunk
+        is sent as soon as that much is produced.
+
+        Args:
+            stream (StreamResponse): The response.
 
         Returns:
-            str: The HTTP response message.
+            bytes: The chunk, followed by the last chunk once the body ends.
         """
-        parser = HTTPParser()
-        response = HTTPResponse()
-        calc = Calculator()
+        data = bytearray()
 
-        request = parser.parse_request(message)
+        for piece in stream.pieces:
+            data += piece.encode()
 
-        # Invalid request (no expression sent)
-        if not request["params"] or "expression" not in request["params"]:
+            if len(data) >= self.buffer_size:
+                return stream.frame(bytes(data))
 
-            print("Request is invalid. Missing parameters.")
-            return response.build_response(status=406, data="-1")
+        return stream.frame(bytes(data), last=True)
 
-        expression = request["params"]["expression"][0]
-        print(
-            "{}Expression received:{} {}".format(
-                bcolors.OKBLUE, bcolors.ENDC, expression
-            )
-        )
+    def send_file(self, sock: socket.socket, region: _FileRegion) -> int:
+        """Sends part of a file region, without copying it if possible.
 
-        # Evaluate the expression
-        try:
-            result = calc.evaluate(expression)
-            print(
-                "{}Expression valid{}, result = {}".format(
-                    bcolors.OKGREEN, bcolors.ENDC, result
-                )
+        Args:
+            sock (socket.socket): The connection's socket.
+            region (_FileRegion): The region, advanced by what was sent.
+
+        Returns:
+            int: The number of bytes sent, 0 if the file ended early.
+
+        Raises:
+            BlockingIOError: If the socket cannot take more data.
+        """
+        if hasattr(os, "sendfile"):
+            sent = os.sendfile(
+                sock.fileno(), region.file.fileno(), region.offset, region.remaining
             )
+        else:
+            region.file.seek(region.offset)
+            sent = sock.send(region.file.read(min(region.remaining, 1 << 20)))
 
-            return response.build_response(status=200, data=result)
+        region.offset += sent
+        region.remaining -= sent
 
-        # Send error message if not valid
-        except Exception as exc:
+        return sent
+
+    def phase(self, connection: _Connection) -> str:
+        """Gets the phase of a connection, which sets its timeout.
+
+        Args:
+            connection (_Connection): The connection.
+
+        Returns:
+            str: "header", "body", "idle" or "write".
+        """
+        if connection.outgoing:
+            return "write"
+
+        if not connection.buffer:
+            return "header" if connection.binary is None else "idle"
+
+        if connection.binary or b"\r\n\r\n" in connection.buffer:
+            return "body"
+
+        return "header"
+
+    def update_timer(self, connection: _Connection, restart: bool = False):
+        """Moves a connection to the deadline of the phase it is in.
+
+        Header and body deadlines run from the start of the phase, so trickling
+        bytes does not extend them. The write deadline restarts whenever the
+        client reads part of its response.
+
+        Args:
+            connection (_Connection): The connection.
+            restart (bool): Restart the deadline of an unchanged phase.
+        """
+        phase = self.phase(connection)
+
+        if phase == connection.phase and not restart:
+            return
+
+        if connection.timer is not None:
+            self.timers.cancel(connection.timer)
+
+        connection.phase = phase
+        connection.timer = self.timers.schedule(self.timeouts[phase], connection)
+
+    def expire(self, connection: _Connection):
+        """Closes a connection that missed its deadline.
+
+        Args:
+            connection (_Connection): The connection.
+        """
+        self.metrics.inc("calculator_timeouts_total", phase=connection.phase)
+
+        if self.debug:
+            print("----------------")
             print(
-                "{}An exception occurred:{} {} ({})".format(
-                    bcolors.FAIL, bcolors.ENDC, str(exc), type(exc).__name__
+                "{}{}Connection timed out ({}).{}".format(
+                    bcolors.BOLD, bcolors.WARNING, connection.phase, bcolors.ENDC
                 )
             )
 
-            return response.build_response(status=406, data="-1")
+        self.disconnect(connection)
 
-        return ""
+    def disconnect(self, connection: _Connection):
+        """Closes a connection and forgets its state.
 
-    def run(self):
-        """Runs the server. Must be implemented by subclasses."""
-        raise NotImplementedError
+        Args:
+            connection (_Connection): The connection.
+        """
+        if connection not in self.connections:
+            return
 
+        self.connections.remove(connection)
+        self.selector.unregister(connection.sock)
+        connection.sock.close()
 
-class TCPServer(Server):
-    """Reliable TCP server implementation.
+        for chunk in connection.outgoing:
+            if isinstance(chunk, _FileRegion):
+                chunk.file.close()
+            elif isinstance(chunk, StreamResponse):
+                chunk.close()
 
-    Attributes:
-        host (str): The server's host address. Defaults to "127.0.0.1".
-        port (int): The server's port number. Defaults to 50123.
-        buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
-    """
+        if connection.timer is not None:
+            self.timers.cancel(connection.timer)
 
-    def __init__(
-        self, host: str = "127.0.0.1", port: int = 50123, buffer_size: int = 1024
-    ):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        super().__init__(host, port, buffer_size)
+        self.metrics.dec("calculator_active_connections")
+
+    def close(self):
+        """Closes every connection, then the server socket."""
+        for connection in list(self.connections):
+            self.disconnect(connection)
+
+        self.selector.close()
+        super().close()
+
+    def poll(self):
+        """Serves the connections that are ready and expires overdue ones."""
+        timeout = min(self.timers.timeout() or POLL_INTERVAL, POLL_INTERVAL)
+
+        ready = self.selector.select(timeout)
+        self.polled = time.time()
+
+        # Readable connections count as in flight until their turn comes
+        waiting = [
+            self.admission is not None
+            and isinstance(key.data, _Connection)
+            and events == selectors.EVENT_READ
+            for key, events in ready
+        ]
+
+        for _ in range(sum(waiting)):
+            self.admission.begin()
+
+        for (key, events), counted in zip(ready, waiting):
+            if counted:
+                self.admission.end()
+
+            self.handle_event(key, events)
+
+        for connection in self.timers.advance():
+            self.expire(connection)
+
+    def handle_event(self, key: selectors.SelectorKey, events: int):
+        """Handles a socket reported ready by the selector.
+
+        Args:
+            key (selectors.SelectorKey): The key of the socket.
+            events (int): The events it is ready for.
+        """
+        if key.data is None:
+            self.accept(key.fileobj)
+        elif events & selectors.EVENT_WRITE:
+            self.send(key.data)
+        else:
+            self.receive(key.data)
+
+    def listen(self):
+        """Starts accepting connections in the event loop."""
+        self.server_socket.listen()
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+
+    def stop_listening(self):
+        """Stops accepting connections, to drain."""
+        self.selector.unregister(self.server_socket)
+
+    def serve(self):
+        """Serves connections until drained, then finishes those in flight.
+
+        Stops accepting, and closes connections once between requests. New
+        connections are owed the request their client is sending.
+        """
+        while not self.draining:
+            self.poll()
+
+        self.stop_listening()
+        deadline = time.monotonic() + self.drain_timeout
+
+        while self.connections and time.monotonic() < deadline:
+            for connection in list(self.connections):
+                if connection.phase == "idle":
+                    self.disconnect(connection)
+
+            self.poll()
 
     def run(self):
-        """Runs the TCP server until interrupted by the user."""
+        """Runs the TCP server until interrupted by the user or drained."""
         print(
-            "{}{}TCP server started.{}".format(
-                bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
+            "{}{}{} started.{}".format(
+                bcolors.BOLD, bcolors.OKGREEN, self.name, bcolors.ENDC
             )
         )
         try:
-            while True:
-                self.server_socket.listen(1)
-                client_socket, address = self.server_socket.accept()
-
-                connected = True
-
-                while connected:
-                    data = client_socket.recv(self.buffer_size)
-
-                    if data:
-                        print("----------------")
-                        print(
-                            "{}{}Received packet. Data:{}\n{}".format(
-                                bcolors.BOLD,
-                                bcolors.OKBLUE,
-                                bcolors.ENDC,
-                                data.decode(),
-                            )
-                        )
-
-                        response = self.process_request(data.decode())
-
-                        print(
-                            "\n{}{}Sending response. Data:{}\n{}".format(
-                                bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
-                            )
-                        )
-
-                        client_socket.send(response.encode())
+            self.listen()
+            self.start()
+            self.serve()
 
-                    else:
-                        print("----------------")
-                        print(
-                            "{}{}Connection ended.{}".format(
-                                bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
-                            )
-                        )
-                        connected = False
-                        client_socket.close()
+            print(
+                "{}{}Server drained.{}".format(
+                    bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
+                )
+            )
+            self.close()
+            sys.exit(0)
 
         except KeyboardInterrupt:
             print("----------------")
@@ -153,7 +1597,7 @@ class TCPServer(Server):
                     bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
                 )
             )
-            self.server_socket.close()
+            self.close()
             sys.exit(0)
 
 
@@ -161,47 +1605,340 @@ class UDPReliableServer(Server):
     """Reliable UDP server implementation.
 
     Args:
-        host (str): The server's host address. Defaults to "127.0.0.1".
+        host (str): The server's host address or Unix domain socket path.
+            Defaults to "127.0.0.1".
         port (int): The server's port number. Defaults to 50123.
         buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
+        debug (bool): Print every request and response. Defaults to True.
+        transport: Factory of the server's socket. Defaults to ``socket``.
+        admission (AdmissionController): Load shedding policy. Defaults to None.
+        rate_limit (RateLimiter): Per-client rate limit. Defaults to None.
+        cache (ResultCache): Cache of results. Defaults to None.
+        capture (Capture): Journal of the requests received. Defaults to None.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest response body compressed, or None
+            to never compress. Defaults to 1024.
     """
 
+    name = "UDP server"
+
     def __init__(
-        self, host: str = "127.0.0.1", port: int = 50123, buffer_size: int = 1024
+        self,
+        host: str = "127.0.0.1",
+        port: int = 50123,
+        buffer_size: int = 1024,
+        debug: bool = True,
+        transport=socket,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        cache: ResultCache = None,
+        capture: Capture = None,
+        tracer: Tracer = None,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
     ):
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        super().__init__(host=host, port=port, buffer_size=buffer_size)
+        self.server_socket = transport.socket(address_family(host), socket.SOCK_DGRAM)
+        super().__init__(
+            host=host,
+            port=port,
+            buffer_size=buffer_size,
+            debug=debug,
+            transport=transport,
+            admission=admission,
+            rate_limit=rate_limit,
+            cache=cache,
+            capture=capture,
+            tracer=tracer,
+            compress_min_size=compress_min_size,
+        )
 
-    def run(self):
-        """Runs the UDP server until interrupted by the user."""
-        print(
-            "{}{}UDP server started.{}".format(
-                bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
-            )
+        # State of fragmented requests and responses, keyed by (addr, msg id)
+        self.reassembler = fragment.Reassembler()
+        self.sent_messages = fragment.SentMessages()
+
+        self.metrics.describe(
+            "calculator_datagram_errors_total",
+            "counter",
+            "Datagrams that could not be sent or received, by error.",
         )
-        try:
-            while True:
-                data, addr = self.server_socket.recvfrom(self.buffer_size)
 
-                print("Address:", addr)
+        # Kernel receive timestamps measure how long a datagram sat in the
+        # socket buffer, which is the queueing delay admission control needs
+        self.timestamps = (
+            admission is not None
+            and isinstance(self.server_socket, socket.socket)
+            and SO_TIMESTAMP is not None
+        )
+        if self.timestamps:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
 
-                if data:
-                    print("----------------")
-                    print(
-                        "{}{}Received packet. Data:{}\n{}".format(
-                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, data.decode()
-                        )
-                    )
+    def memory_tables(self) -> dict:
+        """Gets the number of entries of the server's caches and tables.
 
-                    response = self.process_request(data.decode())
+        Returns:
+            dict: The entries of every table, with the fragmented requests
+            being reassembled and the responses kept for retransmission.
+        """
+        tables = super().memory_tables()
+        tables["reassembler"] = len(self.reassembler)
+        tables["sent_messages"] = len(self.sent_messages)
 
-                    print(
-                        "\n{}{}Sending response. Data:{}\n{}".format(
-                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
-                        )
+        return tables
+
+    def receive(self) -> tuple:
+        """Receives a datagram along with its arrival time.
+
+        Returns:
+            tuple: The data, the sender's address and the kernel receive
+            timestamp, or None if timestamps are not enabled.
+        """
+        if not self.timestamps:
+            data, addr = self.server_socket.recvfrom(self.buffer_size)
+            return data, addr, None
+
+        data, ancdata, _, addr = self.server_socket.recvmsg(
+            self.buffer_size, socket.CMSG_SPACE(TIMEVAL.size)
+        )
+
+        arrival = None
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_TIMESTAMP:
+                seconds, microseconds = TIMEVAL.unpack(value[: TIMEVAL.size])
+                arrival = seconds + microseconds / 1e6
+
+        return data, addr, arrival
+
+    def handle_fragment(self, data: bytes, addr: tuple):
+        """Handles a request fragment or a NACK from a client.
+
+        A complete request is answered with a fragmented response that is kept
+        for retransmission. A NACK is answered with the response fragments it
+        lists, or with a NACK for the request fragments still missing.
+
+        Args:
+            data (bytes): The datagram.
+            addr (tuple): The sender's address.
+        """
+        kind, message_id, index, count, body = fragment.parse(data)
+        key = (addr, message_id)
+
+        if kind == fragment.DATA:
+            message = self.reassembler.add(key, index, count, body)
+
+            if message is None:
+                return
+
+            message = self.decode_request(message)
+
+            if message is None:
+                response = self.respond(406, "-1")
+            else:
+                response = self.process_request(message)
+
+            if self.debug:
+                print(
+                    "\n{}{}Sending fragmented response. Data:{}\n{}".format(
+                        bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
                     )
+                )
+
+            fragments = fragment.fragment(
+                response.encode(), message_id, self.buffer_size
+            )
+            self.sent_messages.add(key, fragments)
+
+        else:
+            fragments = self.sent_messages.get(key, body)
+
+            # The request itself is incomplete: ask for what is missing
+            if fragments is None:
+                count, missing = self.reassembler.progress(key)
+                fragments = [
+                    fragment.nack(message_id, count, missing, self.buffer_size)
+                ]
+
+        for datagram in fragments:
+            self.send_datagram(datagram, addr)
+
+    def reject_datagram(
+        self, data: bytes, addr: tuple, response: bytes, exc: Exception
+    ):
+        """Answers a rejected request datagram in its own protocol.
+
+        Fragments are dropped: the client retries them with a NACK anyway.
+
+        Args:
+            data (bytes): The request datagram.
+            addr (tuple): The sender's address.
+            response (bytes): The pre-built HTTP response.
+            exc (Exception): The error sent to binary clients.
+        """
+        if fragment.is_fragment(data):
+            return
+
+        if data[:1] == binary.MAGIC:
+            if len(data) < binary.HEADER.size:
+                return
+
+            request_id = binary.HEADER.unpack_from(data)[2]
+            response = binary.encode_error(request_id, exc)
+
+        self.send_datagram(response, addr)
+
+    def send_datagram(self, datagram: bytes, addr: tuple) -> bool:
+        """Sends a datagram, counting the bytes sent or the error.
+
+        Args:
+            datagram (bytes): The datagram.
+            addr (tuple): The destination address.
+
+        Returns:
+            bool: Whether the datagram was sent.
+        """
+        try:
+            sent = self.server_socket.sendto(datagram, addr)
+        except OSError as exc:
+            if self.debug:
+                print("Cannot send {} bytes: {}".format(len(datagram), exc))
+            self.metrics.inc(
+                "calculator_datagram_errors_total",
+                error=errno.errorcode.get(exc.errno, "unknown"),
+            )
+            return False
+
+        self.metrics.inc("calculator_bytes_sent_total", sent)
+        return True
+
+    def handle_datagram(self, data: bytes, addr: tuple, arrival: float = None):
+        """Answers a single request datagram.
+
+        Args:
+            data (bytes): The request datagram.
+            addr (tuple): The sender's address, where the response is sent.
+            arrival (float): When the datagram arrived. Defaults to now.
+        """
+        if not data:
+            return
+
+        self.metrics.inc("calculator_bytes_received_total", len(data))
+
+        # Fragments are answered by NACKs and retransmissions: not replayable
+        if self.capture is not None and not fragment.is_fragment(data):
+            self.capture.record(UDP, self.capture.source(addr), data, arrival)
+
+        # Unix datagram clients must bind a path to receive the response
+        if not addr:
+            if self.debug:
+                print("Request from an unbound Unix socket, cannot respond.")
+            return
 
-                    self.server_socket.sendto(response.encode(), (self.host, addr[1]))
+        if not self.allow(addr):
+            self.reject_datagram(data, addr, self.rate_limited_response, RateLimited())
+            return
+
+        if not self.admit(arrival):
+            self.reject_datagram(
+                data, addr, self.overload_response, ServiceUnavailable()
+            )
+            return
+
+        if fragment.is_fragment(data):
+            self.handle_fragment(data, addr)
+            return
+
+        if data[:1] == binary.MAGIC:
+            try:
+                frames, _ = binary.split_frames(data)
+            except ValueError:
+                return
+
+            response = b"".join(self.process_binary(*frame) for frame in frames)
+
+            self.send_datagram(response, addr)
+            return
+
+        message = self.decode_request(data)
+
+        if message is None:
+            self.send_datagram(self.respond(406, "-1").encode(), addr)
+            return
+
+        if self.debug:
+            print("----------------")
+            print("Address:", addr)
+            print(
+                "{}{}Received packet. Data:{}\n{}".format(
+                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, message
+                )
+            )
+
+        if self.tracer is not None:
+            self.start_trace(time.time() if arrival is None else arrival)
+
+        response = self.process_request(message)
+
+        # Job results are not read into memory for a datagram they cannot fit
+        if isinstance(response, FileResponse) and response.size > MAX_DATAGRAM:
+            response = self.respond(406, "-1")
+
+        if self.debug:
+            print(
+                "\n{}{}Sending response. Data:{}\n{}".format(
+                    bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
+                )
+            )
+
+        response = response.encode()
+        self.trace_phase("build")
+
+        # Responses too large for one datagram need a fragmented request
+        if not self.send_datagram(response, addr) and len(response) > MAX_DATAGRAM:
+            self.send_datagram(self.respond(406, "-1").encode(), addr)
+
+        self.finish_trace("send")
+
+    def serve(self):
+        """Answers datagrams until drained, then those already queued.
+
+        Queued datagrams are left to the new process after a restart.
+        """
+        self.server_socket.settimeout(POLL_INTERVAL)
+
+        while not self.draining:
+            try:
+                datagram = self.receive()
+            except socket.timeout:
+                continue
+
+            self.handle_datagram(*datagram)
+
+        self.server_socket.settimeout(0.0)
+
+        while not self.handed_off:
+            try:
+                datagram = self.receive()
+            except (socket.timeout, BlockingIOError):
+                break
+
+            self.handle_datagram(*datagram)
+
+    def run(self):
+        """Runs the UDP server until interrupted by the user or drained."""
+        print(
+            "{}{}{} started.{}".format(
+                bcolors.BOLD, bcolors.OKGREEN, self.name, bcolors.ENDC
+            )
+        )
+        try:
+            self.start()
+            self.serve()
+
+            print(
+                "{}{}Server drained.{}".format(
+                    bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
+                )
+            )
+            self.close()
+            sys.exit(0)
 
         except KeyboardInterrupt:
             print("----------------")
@@ -210,20 +1947,35 @@ class UDPReliableServer(Server):
                     bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
                 )
             )
-            self.server_socket.close()
+            self.close()
             sys.exit(0)
 
 
 class UDPUnreliableServer(UDPReliableServer):
     """Unreliable UDP server implementation.
 
-    This server drops received UDP packets with a certain probability.
+    This server drops received UDP packets with a certain probability. A custom
+    impairment adds burst loss, delay, reordering, duplication or a bandwidth
+    cap instead.
 
     Args:
-        host (str): The server's host address. Defaults to "127.0.0.1".
+        host (str): The server's host address or Unix domain socket path.
+            Defaults to "127.0.0.1".
         port (int): The server's port number. Defaults to 50123.
         buffer_size (int): The size of the buffer for receiving data. Defaults to 1024.
         prob_drop (float): The probability of dropping a packet. Defaults to 0.75.
+        impairment (Impairment): Impairment of received packets. Defaults to
+            independent drops with probability ``prob_drop``.
+        seed (int): Seed of the default impairment. Defaults to None.
+        debug (bool): Print every request and response. Defaults to True.
+        transport: Factory of the server's socket. Defaults to ``socket``.
+        admission (AdmissionController): Load shedding policy. Defaults to None.
+        rate_limit (RateLimiter): Per-client rate limit. Defaults to None.
+        cache (ResultCache): Cache of results. Defaults to None.
+        capture (Capture): Journal of the requests received. Defaults to None.
+        tracer (Tracer): Trace of sampled requests. Defaults to None.
+        compress_min_size (int): Smallest response body compressed, or None
+            to never compress. Defaults to 1024.
     """
 
     def __init__(
@@ -232,54 +1984,64 @@ class UDPUnreliableServer(UDPReliableServer):
         port: int = 50123,
         buffer_size: int = 1024,
         prob_drop=0.75,
+        impairment: Impairment = None,
+        seed: int = None,
+        debug: bool = True,
+        transport=socket,
+        admission: AdmissionController = None,
+        rate_limit: RateLimiter = None,
+        cache: ResultCache = None,
+        capture: Capture = None,
+        tracer: Tracer = None,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
     ):
         self.prob_drop = prob_drop
-        super().__init__(host=host, port=port, buffer_size=buffer_size)
 
-    def run(self):
-        """Runs the unreliable UDP server until interrupted by the user."""
-        print(
-            "{}{}UDP server started.{}".format(
-                bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
-            )
+        if impairment is None:
+            impairment = Impairment(loss=prob_drop, seed=seed)
+        self.impairment = impairment
+
+        super().__init__(
+            host=host,
+            port=port,
+            buffer_size=buffer_size,
+            debug=debug,
+            transport=transport,
+            admission=admission,
+            rate_limit=rate_limit,
+            cache=cache,
+            capture=capture,
+            tracer=tracer,
+            compress_min_size=compress_min_size,
         )
 
-        try:
-            while True:
-                data, addr = self.server_socket.recvfrom(self.buffer_size)
-
-                # Drop packet with a given probability
-                if random.random() >= self.prob_drop:
-                    print("----------------")
-                    print(
-                        "{}{}Received packet. Data:{}\n{}".format(
-                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, data.decode()
-                        )
-                    )
+        self.metrics.describe(
+            "calculator_packets_dropped_total", "counter", "Packets dropped on receipt."
+        )
+        # Impaired packets are delivered after the kernel received them, and
+        # only recvfrom applies the impairment, so kernel timestamps are off
+        if self.timestamps:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 0)
+            self.timestamps = False
 
-                    response = self.process_request(data.decode())
+        self.server_socket = ImpairedSocket(
+            self.server_socket, inbound=impairment, on_drop=self.report_drop
+        )
 
-                    print(
-                        "\n{}{}Sending response. Data:{}\n{}".format(
-                            bcolors.BOLD, bcolors.OKBLUE, bcolors.ENDC, response
-                        )
-                    )
+    def report_drop(self, data: bytes, addr: tuple):
+        """Reports a packet lost to the impairment.
 
-                    self.server_socket.sendto(response.encode(), (self.host, addr[1]))
-                else:
-                    print("----------------")
-                    print(
-                        "{}{}Packet received, but dropped.{}\n".format(
-                            bcolors.BOLD, bcolors.FAIL, bcolors.ENDC
-                        )
-                    )
+        Args:
+            data (bytes): The packet payload.
+            addr (tuple): The sender's address.
+        """
+        self.metrics.inc("calculator_bytes_received_total", len(data))
+        self.metrics.inc("calculator_packets_dropped_total")
 
-        except KeyboardInterrupt:
+        if self.debug:
             print("----------------")
             print(
-                "{}{}Server aborted.{}".format(
-                    bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                "{}{}Packet received, but dropped.{}\n".format(
+                    bcolors.BOLD, bcolors.FAIL, bcolors.ENDC
                 )
             )
-            self.server_socket.close()
-            sys.exit(0)
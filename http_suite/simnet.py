@@ -0,0 +1,354 @@
+"""In-process simulated network driven by a virtual clock."""
+
+import collections
+import socket
+
+from .impairment import DelayLine, ImpairedSocket, Impairment
+
+
+class VirtualClock:
+    """Clock that only moves when the simulation advances it.
+
+    Args:
+        start (float): The initial time in seconds. Defaults to 0.0.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class SimSocket:
+    """Datagram socket attached to a simulated network.
+
+    It implements the subset of the socket API used by the UDP servers and
+    clients. Blocking in ``recvfrom`` runs the simulation until a packet arrives
+    or the virtual timeout expires, so timeouts cost no real time.
+
+    Args:
+        network (SimNetwork): The network the socket belongs to.
+    """
+
+    def __init__(self, network: "SimNetwork"):
+        self.network = network
+        self.addr = None
+        self.timeout = None
+        self.inbox = collections.deque()
+
+        # Servers attached with SimNetwork.serve handle packets on arrival
+        self.handler = None
+        self.inbound = None
+        self.on_drop = None
+
+    def bind(self, addr: tuple):
+        """Bind the socket to an address.
+
+        Args:
+            addr (tuple): The ``(host, port)`` pair. Port 0 picks a free port.
+        """
+        self.addr = self.network.register(addr, self)
+
+    def getsockname(self) -> tuple:
+        """Get the socket's address.
+
+        Returns:
+            tuple: The ``(host, port)`` pair.
+        """
+        return self.addr
+
+    def settimeout(self, timeout: float):
+        """Set the virtual timeout of ``recvfrom``.
+
+        Args:
+            timeout (float): The timeout in seconds, or None to block.
+        """
+        self.timeout = timeout
+
+    def gettimeout(self) -> float:
+        """Get the virtual timeout of ``recvfrom``.
+
+        Returns:
+            float: The timeout in seconds, or None.
+        """
+        return self.timeout
+
+    def setsockopt(self, *args):
+        """Accept and ignore socket options."""
+
+    def close(self):
+        """Detach the socket from the network."""
+        self.network.unregister(self.addr)
+
+    def sendto(self, data: bytes, addr: tuple) -> int:
+        """Send a datagram.
+
+        Args:
+            data (bytes): The payload.
+            addr (tuple): The destination address.
+
+        Returns:
+            int: The number of bytes sent.
+        """
+        if self.addr is None:
+            self.bind(("0.0.0.0", 0))
+
+        self.network.transmit(bytes(data), self.addr, addr)
+
+        return len(data)
+
+    def recvfrom(self, buffer_size: int):
+        """Receive a datagram, advancing the virtual clock while waiting.
+
+        Args:
+            buffer_size (int): The maximum payload size to return.
+
+        Returns:
+            tuple: The payload and the sender's address.
+
+        Raises:
+            socket.timeout: If nothing arrives before the virtual timeout.
+            RuntimeError: If the socket blocks without a timeout and no event
+                left in the simulation can deliver a packet.
+        """
+        if not self.inbox:
+            deadline = None
+            if self.timeout is not None:
+                deadline = self.network.clock() + self.timeout
+
+            self.network.run(until=lambda: self.inbox, deadline=deadline)
+
+        if not self.inbox:
+            if self.timeout is None:
+                raise RuntimeError("Simulated network is idle, no packet can arrive")
+            raise socket.timeout("timed out")
+
+        data, addr = self.inbox.popleft()
+
+        return data[:buffer_size], addr
+
+    def deliver(self, data: bytes, addr: tuple):
+        """Accept a packet from the network, applying the inbound impairment.
+
+        Args:
+            data (bytes): The payload.
+            addr (tuple): The sender's address.
+        """
+        if self.inbound is None:
+            self.receive(data, addr)
+            return
+
+        times = self.inbound.schedule(len(data), self.network.clock())
+
+        if not times and self.on_drop is not None:
+            self.on_drop(data, addr)
+
+        for at in times:
+            self.network.schedule(at, self.receive, data, addr)
+
+    def receive(self, data: bytes, addr: tuple):
+        """Queue a packet or hand it to the attached server.
+
+        Args:
+            data (bytes): The payload.
+            addr (tuple): The sender's address.
+        """
+        if self.handler is not None:
+            self.handler(data, addr)
+        else:
+            self.inbox.append((data, addr))
+
+
+class SimNetwork:
+    """Discrete-event simulation of a datagram network.
+
+    Pass the network as the ``transport`` of servers and clients in place of
+    the ``socket`` module. Packets are events on a virtual timeline; the whole
+    simulation runs in one thread and is reproducible from its seed.
+
+    Args:
+        latency (float): One-way delay of every packet in seconds.
+            Defaults to 0.0005.
+        impairment (Impairment): Impairment of every packet on the network.
+            Defaults to None.
+        seed (int): Seed of the default impairment when ``loss`` is set.
+            Defaults to None.
+        loss (float): Independent loss probability of every packet, used when
+            no impairment is given. Defaults to 0.0.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0005,
+        impairment: Impairment = None,
+        seed: int = None,
+        loss: float = 0.0,
+    ):
+        if impairment is None and loss:
+            impairment = Impairment(loss=loss, seed=seed)
+
+        self.latency = latency
+        self.impairment = impairment
+        self.clock = VirtualClock()
+        self.events = DelayLine()
+        self.sockets = {}
+        self.next_port = 40000
+
+        self.sent = 0
+        self.undeliverable = 0
+
+    def socket(
+        self, family: int = socket.AF_INET, type: int = socket.SOCK_DGRAM, proto=0
+    ) -> SimSocket:
+        """Create a socket on the network.
+
+        Args:
+            family (int): The address family. Only AF_INET is simulated.
+            type (int): The socket type. Only SOCK_DGRAM is simulated.
+            proto (int): Ignored.
+
+        Returns:
+            SimSocket: The new socket.
+
+        Raises:
+            OSError: For stream or non-IPv4 sockets.
+        """
+        if family != socket.AF_INET or type != socket.SOCK_DGRAM:
+            raise OSError("SimNetwork only simulates AF_INET datagram sockets")
+
+        return SimSocket(self)
+
+    def register(self, addr: tuple, sock: SimSocket) -> tuple:
+        """Assign an address to a socket.
+
+        Args:
+            addr (tuple): The requested ``(host, port)`` pair.
+            sock (SimSocket): The socket.
+
+        Returns:
+            tuple: The assigned address.
+
+        Raises:
+            OSError: If the address is already in use.
+        """
+        host, port = addr
+
+        if port == 0:
+            while (host, self.next_port) in self.sockets:
+                self.next_port += 1
+            port = self.next_port
+
+        if (host, port) in self.sockets:
+            raise OSError("Address already in use: {}".format((host, port)))
+
+        self.sockets[(host, port)] = sock
+
+        return (host, port)
+
+    def unregister(self, addr: tuple):
+        """Release a socket's address.
+
+        Args:
+            addr (tuple): The address.
+        """
+        self.sockets.pop(addr, None)
+
+    def serve(self, server):
+        """Attach a UDP server so that it answers packets as they arrive.
+
+        The server's ``run`` loop is not used; each arriving packet calls
+        ``server.handle_datagram`` at its virtual arrival time.
+
+        Args:
+            server (UDPReliableServer): A server created with this network as
+                its transport.
+        """
+        sock = server.server_socket
+
+        # Apply the server's own impairment with the virtual clock
+        if isinstance(sock, ImpairedSocket):
+            sock.sock.inbound = sock.inbound
+            sock.sock.on_drop = sock.on_drop
+            sock = sock.sock
+
+        sock.handler = server.handle_datagram
+
+    def schedule(self, at: float, callback, *args):
+        """Schedule a callback on the virtual timeline.
+
+        Args:
+            at (float): The virtual time to run it at.
+            callback (callable): The function to call.
+            *args: Its arguments.
+        """
+        self.events.push(at, (callback, args))
+
+    def transmit(self, data: bytes, src: tuple, dst: tuple):
+        """Put a packet on the network.
+
+        Args:
+            data (bytes): The payload.
+            src (tuple): The sender's address.
+            dst (tuple): The destination address.
+        """
+        self.sent += 1
+        now = self.clock()
+
+        times = [now]
+        if self.impairment is not None:
+            times = self.impairment.schedule(len(data), now)
+
+        for at in times:
+            self.schedule(at + self.latency, self.arrive, data, src, dst)
+
+    def arrive(self, data: bytes, src: tuple, dst: tuple):
+        """Hand a packet to the socket bound to its destination.
+
+        Args:
+            data (bytes): The payload.
+            src (tuple): The sender's address.
+            dst (tuple): The destination address.
+        """
+        sock = self.sockets.get(dst)
+
+        if sock is None:
+            self.undeliverable += 1
+            return
+
+        sock.deliver(data, src)
+
+    def step(self, deadline: float = None) -> bool:
+        """Run the next event if it is due before the deadline.
+
+        Args:
+            deadline (float): The latest virtual time to run up to.
+
+        Returns:
+            bool: True if an event ran.
+        """
+        at = self.events.next_time()
+
+        if at is None or (deadline is not None and at > deadline):
+            return False
+
+        self.clock.now = max(self.clock.now, at)
+        callback, args = self.events.pop_due(at)
+        callback(*args)
+
+        return True
+
+    def run(self, until=None, deadline: float = None):
+        """Run events until a condition holds, the deadline passes or none are left.
+
+        The clock ends at the deadline if the condition was not met in time.
+
+        Args:
+            until (callable): Stop as soon as this returns a true value.
+            deadline (float): The latest virtual time to run up to.
+        """
+        while not (until is not None and until()):
+            if not self.step(deadline):
+                if deadline is not None:
+                    self.clock.now = max(self.clock.now, deadline)
+                break
@@ -0,0 +1,76 @@
+"""Coalescing of identical calls that are in flight at the same time."""
+
+import threading
+
+
+class _Call:
+    """A call in flight and its outcome."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time.
+
+    The first caller for a key runs the function; callers arriving with the same
+    key while it runs wait for it and receive the same result, or the same
+    exception. Once the call returns the key is forgotten, so later callers run
+    the function again.
+
+    Attributes:
+        collapsed (int): Number of callers that waited instead of running.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.collapsed = 0
+
+    def do(self, key, function, *args):
+        """Run a function unless an identical call is already running.
+
+        Args:
+            key: The key identifying identical calls.
+            function (callable): The function to run.
+            *args: Its arguments.
+
+        Returns:
+            The function's result.
+
+        Raises:
+            Exception: Whatever the function raised.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+
+            if call is None:
+                call = self.calls[key] = _Call()
+                leader = True
+            else:
+                self.collapsed += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = function(*args)
+        except Exception as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+        return call.result
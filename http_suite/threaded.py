@@ -0,0 +1,329 @@
+"""Calculator servers running one event loop per thread."""
+
+import functools
+import os
+import signal
+import socket
+import sys
+import threading
+
+from .address import is_unix_path
+from .bcolors import bcolors
+from .http import Request
+from .lifecycle import notify_parent, spawn_successor
+from .metrics import Metrics
+from .server import POLL_INTERVAL, Server, TCPServer
+from .singleflight import SingleFlight
+
+
+class _SharedSocket(socket.socket):
+    """Duplicate of a bound server socket, served by another thread."""
+
+    def bind(self, address):
+        """Do nothing: the socket it duplicates is bound already."""
+
+
+class _ReusePortTransport:
+    """Creates server sockets that share their port with those of other threads.
+
+    The kernel spreads connections and datagrams over the sockets bound to a
+    port with ``SO_REUSEPORT``, keeping each client on the same socket.
+    """
+
+    def socket(self, family: int, kind: int) -> socket.socket:
+        sock = socket.socket(family, kind)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        return sock
+
+
+class _SharedTransport:
+    """Hands out duplicates of one bound server socket.
+
+    Args:
+        sock (socket.socket): The bound socket.
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def socket(self, family: int, kind: int) -> socket.socket:
+        return _SharedSocket(family, kind, fileno=os.dup(self.sock.fileno()))
+
+
+class ThreadedServer:
+    """Runs a server with one event loop per thread.
+
+    Every thread serves its own copy of the server, with its own parser,
+    calculators, connections and metrics, so the threads share no state on
+    the request path but the result cache, admission control and rate
+    limits. The copies listen on sockets bound with ``SO_REUSEPORT``, where
+    available, or on duplicates of one socket, which the threads then take
+    turns to accept from or read.
+
+    On a free-threaded build of CPython the threads evaluate in parallel,
+    and identical expressions evaluated at the same time share one
+    evaluation. On a build with the GIL they still run correctly, one at a
+    time. Metrics are merged from the threads when they are served.
+
+    Args:
+        server_class (type): ``TCPServer``, ``UDPReliableServer`` or a
+            subclass. Defaults to ``TCPServer``.
+        threads (int): Number of threads. Defaults to the number of CPUs.
+        reuse_port (bool): Bind one socket per thread with ``SO_REUSEPORT``
+            where available. Defaults to True.
+        **options: Arguments of every copy of the server but ``transport``,
+            e.g. ``port`` or ``cache``. The server listens on an IP address.
+
+    Raises:
+        ValueError: If ``host`` is a Unix domain socket path.
+    """
+
+    def __init__(
+        self,
+        server_class: type = TCPServer,
+        threads: int = None,
+        reuse_port: bool = True,
+        **options,
+    ):
+        if is_unix_path(options.get("host", "")):
+            raise ValueError("Threaded servers listen on IP addresses only")
+
+        self.threads = threads or os.cpu_count() or 1
+        self.reuse_port = reuse_port and hasattr(socket, "SO_REUSEPORT")
+        self.cache = options.get("cache")
+
+        transport = _ReusePortTransport() if self.reuse_port else None
+        first = server_class(**options, transport=transport or socket)
+        self.workers = [first]
+
+        for _ in range(self.threads - 1):
+            worker = server_class(
+                **options, transport=transport or _SharedTransport(first.server_socket)
+            )
+
+            # Bulk jobs are polled through any thread
+            worker.jobs = first.jobs
+            worker.profiler = first.profiler
+
+            # Fragments of a request may be read by any thread
+            if not self.reuse_port and hasattr(first, "reassembler"):
+                worker.reassembler = first.reassembler
+                worker.sent_messages = first.sent_messages
+
+            self.workers.append(worker)
+
+        self.inflight = SingleFlight()
+
+        for worker in self.workers:
+            worker.inflight = self.inflight
+            worker.routes["/metrics"] = functools.partial(self.serve_metrics, worker)
+            worker.routes["/stats"] = functools.partial(self.serve_stats, worker)
+            worker.routes["/memory"] = functools.partial(self.serve_memory, worker)
+
+        self.name = "Threaded {}".format(first.name)
+        self.draining = False
+        self.handed_off = False
+
+    @property
+    def metrics(self) -> Metrics:
+        """Metrics of every thread, merged.
+
+        Returns:
+            Metrics: A new registry with the samples of all threads.
+        """
+        metrics = Metrics()
+
+        for worker in self.workers:
+            metrics.merge(worker.metrics)
+
+        metrics.describe(
+            "calculator_singleflight_collapsed_total",
+            "counter",
+            "Requests that waited for an identical expression in flight.",
+        )
+        metrics.set("calculator_singleflight_collapsed_total", self.inflight.collapsed)
+
+        # Every thread reports the whole shared cache: count it once
+        if self.cache is not None:
+            self.workers[0].collect_cache(metrics)
+
+        return metrics
+
+    def serve_metrics(self, worker: Server, request: Request) -> str:
+        """Serves the merged metrics in the Prometheus text format.
+
+        Args:
+            worker (Server): The server of the thread answering.
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        return worker.respond(
+            200, self.metrics.render(), content_type="text/plain; version=0.0.4"
+        )
+
+    def serve_stats(self, worker: Server, request: Request) -> str:
+        """Serves a JSON summary of the merged metrics.
+
+        Args:
+            worker (Server): The server of the thread answering.
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        return worker.respond(
+            200, self.metrics.stats(), content_type="application/json"
+        )
+
+    def memory_tables(self) -> dict:
+        """Gets the number of entries of the caches and tables of every thread.
+
+        Returns:
+            dict: The entries of every table, summed over the threads but for
+            the tables they share.
+        """
+        shared = {"jobs", "cache", "rate_limit", "inflight"}
+
+        if not self.reuse_port:
+            shared |= {"reassembler", "sent_messages"}
+
+        tables = self.workers[0].memory_tables()
+
+        for worker in self.workers[1:]:
+            for name, size in worker.memory_tables().items():
+                if name not in shared:
+                    tables[name] += size
+
+        return tables
+
+    def serve_memory(self, worker: Server, request: Request) -> str:
+        """Serves a JSON report of the memory of the process.
+
+        Args:
+            worker (Server): The server of the thread answering.
+            request (Request): The parsed HTTP request.
+
+        Returns:
+            str: The HTTP response message.
+        """
+        return worker.serve_memory(request, tables=self.memory_tables())
+
+    def snapshot_memory(self, *args):
+        """Starts tracing allocations, then prints a report on every call.
+
+        Installed as the SIGUSR1 handler by ``run``.
+        """
+        self.workers[0].snapshot_memory(tables=self.memory_tables())
+
+    def listeners(self) -> list:
+        """Gets the sockets handed over to a new process on restart.
+
+        Returns:
+            list: The sockets of every thread, or the one socket they share.
+        """
+        if not self.reuse_port:
+            return self.workers[0].listeners()
+
+        return [sock for worker in self.workers for sock in worker.listeners()]
+
+    def drain(self, *args):
+        """Drains every thread. Installed as the SIGTERM handler by ``run``."""
+        if not self.draining:
+            print(
+                "{}{}Draining server.{}".format(
+                    bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                )
+            )
+        self.draining = True
+
+        for worker in self.workers:
+            worker.draining = True
+
+    def restart(self, *args):
+        """Starts a new server process on the same sockets.
+
+        The new process should run as many threads, so that every socket
+        bound with ``SO_REUSEPORT`` is served. Installed as the SIGHUP handler
+        by ``run``.
+        """
+        if self.handed_off:
+            return
+
+        print(
+            "{}{}Restarting server.{}".format(
+                bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+            )
+        )
+
+        if self.cache is not None:
+            self.cache.save()
+
+        spawn_successor(self.listeners(), self.workers[0].jobs.directory)
+        self.handed_off = True
+
+        for worker in self.workers:
+            worker.handed_off = True
+
+    def close(self):
+        """Closes the server of every thread."""
+        for worker in self.workers:
+            worker.close()
+
+    def run(self):
+        """Runs the threads until interrupted by the user or drained."""
+        print(
+            "{}{}{} started with {} threads.{}".format(
+                bcolors.BOLD, bcolors.OKGREEN, self.name, self.threads, bcolors.ENDC
+            )
+        )
+        threads = [
+            threading.Thread(target=worker.serve, daemon=True)
+            for worker in self.workers
+        ]
+
+        try:
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGTERM, self.drain)
+
+                if hasattr(signal, "SIGHUP"):
+                    signal.signal(signal.SIGHUP, self.restart)
+
+                if hasattr(signal, "SIGUSR1"):
+                    signal.signal(signal.SIGUSR1, self.snapshot_memory)
+
+            for worker, thread in zip(self.workers, threads):
+                worker.listen()
+                thread.start()
+
+            if self.workers[0].inherited:
+                notify_parent()
+
+            # Wait with a timeout, so signals are handled in the meantime
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(POLL_INTERVAL)
+
+            print(
+                "{}{}Server drained.{}".format(
+                    bcolors.BOLD, bcolors.OKGREEN, bcolors.ENDC
+                )
+            )
+            self.close()
+            sys.exit(0)
+
+        except KeyboardInterrupt:
+            print("----------------")
+            print(
+                "{}{}Server aborted.{}".format(
+                    bcolors.BOLD, bcolors.WARNING, bcolors.ENDC
+                )
+            )
+            self.drain()
+
+            for thread in threads:
+                thread.join(POLL_INTERVAL)
+
+            self.close()
+            sys.exit(0)
@@ -0,0 +1,111 @@
+"""Hashed timer wheel for large numbers of coarse deadlines."""
+
+import math
+import time
+
+
+class Timer:
+    """A deadline scheduled on a timer wheel.
+
+    Attributes:
+        tick (int): The wheel tick at which the timer expires.
+        item: The object returned when the timer expires.
+    """
+
+    __slots__ = ("tick", "item")
+
+    def __init__(self, tick: int, item):
+        self.tick = tick
+        self.item = item
+
+
+class TimerWheel:
+    """Hashed timer wheel.
+
+    Time is cut into ticks of ``tick`` seconds and timers are hashed into
+    ``slots`` buckets by their expiry tick. Scheduling and cancelling are O(1),
+    and advancing the wheel by one tick only looks at one bucket, whatever the
+    number of timers. Timers further away than one revolution share a bucket
+    with nearer ones and are simply skipped until their tick comes.
+
+    Args:
+        tick (float): Resolution of the wheel in seconds. Defaults to 0.1.
+        slots (int): Number of buckets. Defaults to 1024.
+        clock (callable): Time source. Defaults to ``time.monotonic``.
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 1024, clock=time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.slots = [set() for _ in range(slots)]
+
+        self.current = int(clock() / tick)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def schedule(self, delay: float, item) -> Timer:
+        """Schedule a timer.
+
+        Args:
+            delay (float): Seconds until the timer expires, rounded up to the
+                next tick.
+            item: The object returned by ``advance`` when the timer expires.
+
+        Returns:
+            Timer: The timer, to cancel it.
+        """
+        tick = max(self.current + 1, math.ceil((self.clock() + delay) / self.tick))
+        timer = Timer(tick, item)
+
+        self.slots[tick % len(self.slots)].add(timer)
+        self.count += 1
+
+        return timer
+
+    def cancel(self, timer: Timer):
+        """Cancel a timer. Cancelling an expired timer does nothing.
+
+        Args:
+            timer (Timer): The timer.
+        """
+        bucket = self.slots[timer.tick % len(self.slots)]
+
+        if timer in bucket:
+            bucket.remove(timer)
+            self.count -= 1
+
+    def advance(self) -> list:
+        """Expire the timers due by now.
+
+        Returns:
+            list: The items of the expired timers.
+        """
+        target = int(self.clock() / self.tick)
+        expired = []
+
+        # After a long pause, one pass over every bucket is enough
+        if target - self.current > len(self.slots):
+            self.current = target - len(self.slots)
+
+        while self.current < target and self.count:
+            self.current += 1
+            bucket = self.slots[self.current % len(self.slots)]
+
+            for timer in [timer for timer in bucket if timer.tick <= target]:
+                bucket.remove(timer)
+                expired.append(timer.item)
+
+        self.count -= len(expired)
+        self.current = target
+
+        return expired
+
+    def timeout(self) -> float:
+        """Get how long to wait before the wheel needs to advance.
+
+        Returns:
+            float: One tick while timers are pending, otherwise None.
+        """
+        return self.tick if self.count else None
@@ -0,0 +1,186 @@
+"""Sampled request tracing, exported in the Chrome Trace Event format."""
+
+import collections
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+
+class Trace:
+    """Spans of one sampled request, marked as its phases end.
+
+    Phases follow each other, so marking one ends the span that started when
+    the previous one ended. Times are wall-clock seconds, so the spans of a
+    client and a server line up on the same timeline.
+
+    Args:
+        tracer (Tracer): The tracer writing the trace.
+        name (str): Name of the request span.
+        start (float): When the request started, as ``time.time()``.
+
+    Attributes:
+        args (dict): Details shown with the request span, e.g. its status.
+    """
+
+    __slots__ = ("tracer", "id", "name", "start", "last", "spans", "args")
+
+    def __init__(self, tracer: "Tracer", name: str, start: float):
+        self.tracer = tracer
+        self.id = next(tracer.ids)
+        self.name = name
+        self.start = start
+        self.last = start
+        self.spans = []
+        self.args = {}
+
+    def mark(self, phase: str):
+        """End a phase now.
+
+        Args:
+            phase (str): The phase, e.g. "parse".
+        """
+        now = time.time()
+        self.spans.append((phase, self.last, now))
+        self.last = now
+
+    def finish(self):
+        """End the request and hand its spans to the writer."""
+        self.tracer.pending.append(self)
+
+
+class Tracer:
+    """Samples requests and writes their spans to a trace file.
+
+    The file holds Chrome Trace Event JSON, opened by Perfetto or
+    ``chrome://tracing``: every request is a track of its own, with a span for
+    the request and one for each of its phases. Finished traces are written
+    by a background thread every ``flush_interval`` seconds, so requests never
+    wait on the file. Requests not sampled cost one random number, and a
+    server or client without a tracer does no tracing work at all.
+
+    Args:
+        path (str): The trace file, overwritten.
+        sample_rate (float): Share of the requests traced, between 0.0 and 1.0.
+            Defaults to 0.01.
+        name (str): Name of the process on the timeline. Defaults to
+            "calculator".
+        flush_interval (float): Seconds between writes. Defaults to 1.0.
+        seed (int): Seed of the sampling. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: float = 0.01,
+        name: str = "calculator",
+        flush_interval: float = 1.0,
+        seed: int = None,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.random = random.Random(seed)
+
+        self.ids = itertools.count(1)
+        self.pid = os.getpid()
+        self.written = 0
+
+        # Appending to a deque is safe from any thread without a lock
+        self.pending = collections.deque()
+
+        self.file = open(path, "w")
+        self.file.write("[\n")
+        self.write_event(
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": name}}
+        )
+
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    def start(self, name: str, start: float = None) -> Trace:
+        """Start tracing a request if it is sampled.
+
+        Args:
+            name (str): Name of the request span.
+            start (float): When the request started, as ``time.time()``.
+                Defaults to now.
+
+        Returns:
+            Trace: The trace, or None if the request is not sampled.
+        """
+        if self.sample_rate <= 0 or self.random.random() >= self.sample_rate:
+            return None
+
+        return Trace(self, name, time.time() if start is None else start)
+
+    def write_event(self, event: dict):
+        """Write an event to the file.
+
+        Args:
+            event (dict): The trace event.
+        """
+        if self.written:
+            self.file.write(",\n")
+
+        self.file.write(json.dumps(event, separators=(",", ":")))
+        self.written += 1
+
+    def write(self, trace: Trace):
+        """Write the spans of a trace as complete events.
+
+        Args:
+            trace (Trace): The finished trace.
+        """
+        self.write_event(
+            {
+                "name": trace.name,
+                "cat": "request",
+                "ph": "X",
+                "pid": self.pid,
+                "tid": trace.id,
+                "ts": trace.start * 1e6,
+                "dur": (trace.last - trace.start) * 1e6,
+                "args": trace.args,
+            }
+        )
+
+        for phase, start, end in trace.spans:
+            self.write_event(
+                {
+                    "name": phase,
+                    "cat": "phase",
+                    "ph": "X",
+                    "pid": self.pid,
+                    "tid": trace.id,
+                    "ts": start * 1e6,
+                    "dur": (end - start) * 1e6,
+                }
+            )
+
+    def flush(self):
+        """Write the finished traces."""
+        while self.pending:
+            self.write(self.pending.popleft())
+
+        self.file.flush()
+
+    def run(self):
+        """Write finished traces in the background until closed."""
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        """Write the remaining traces and end the file."""
+        if self.closed.is_set():
+            return
+
+        self.closed.set()
+        self.writer.join()
+
+        self.flush()
+        self.file.write("\n]\n")
+        self.file.close()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import threading
+import time
+
+from http_suite.address import address_family, is_unix_path, socket_address
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.server import TCPServer, UDPReliableServer
+
+for host in ("127.0.0.1", "/tmp/calculator.sock", "./calculator.sock"):
+    print(
+        "{}: Unix path {}, family {!r}, address {!r}".format(
+            host, is_unix_path(host), address_family(host), socket_address(host, 50123)
+        )
+    )
+
+directory = tempfile.mkdtemp()
+tcp_path = os.path.join(directory, "tcp.sock")
+udp_path = os.path.join(directory, "udp.sock")
+
+tcp_server = TCPServer(host=tcp_path, debug=False)
+threading.Thread(target=tcp_server.run, daemon=True).start()
+udp_server = UDPReliableServer(host=udp_path, debug=False)
+threading.Thread(target=udp_server.run, daemon=True).start()
+time.sleep(0.5)
+
+tc = TCPClient()
+tc.connect(host=tcp_path)
+tc.http_send(method="POST", params={"expression": "* 12345 6789"})
+print("TCP over a Unix socket:", tc.result())
+
+# UDP clients bind a path of their own, where responses are sent
+udp = UDPReliableClient(server_addr=os.path.join(directory, "client.sock"))
+udp.http_send(host=udp_path, method="POST", params={"expression": "+ 1 2"})
+print("UDP over a Unix socket:", udp.result())
+
+start = time.perf_counter()
+for i in range(1000):
+    tc.http_send(method="POST", params={"expression": "+ {} 1".format(i)})
+    tc.result()
+print("1000 requests over a Unix socket:", time.perf_counter() - start)
@@ -0,0 +1,54 @@
+import socket
+import threading
+import time
+
+from http_suite.admission import AdmissionController
+from http_suite.http import HTTPRequest
+from http_suite.server import UDPUnreliableServer
+from http_suite.simnet import VirtualClock
+
+clock = VirtualClock()
+admission = AdmissionController(target=0.005, interval=0.1, clock=clock)
+
+# A short burst is served, however long it waits
+clock.now = 0.05
+print("Burst, waited 50ms:", admission.admit(arrival=0.0))
+
+# Once the delay stayed above the target for an interval, stale requests go
+clock.now = 0.2
+print("Standing queue, waited 20ms:", admission.admit(arrival=0.18))
+print("Standing queue, waited 1ms:", admission.admit(arrival=0.199))
+
+limited = AdmissionController(max_inflight=1)
+limited.begin()
+print("Second request in flight:", limited.admit())
+limited.end()
+print("After the first finished:", limited.admit())
+
+# Admission control on a server whose socket drops every packet
+server = UDPUnreliableServer(
+    port=50143, prob_drop=1.0, debug=False, admission=AdmissionController()
+)
+thread = threading.Thread(target=server.run, daemon=True)
+thread.start()
+time.sleep(0.2)
+
+request = HTTPRequest(host="127.0.0.1").build_request(params={"expression": "+ 1 2"})
+client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+client.settimeout(0.5)
+
+for _ in range(5):
+    client.sendto(request.encode(), ("127.0.0.1", 50143))
+
+try:
+    client.recvfrom(1024)
+    print("A dropped request was answered")
+except socket.timeout:
+    print("No request answered")
+
+time.sleep(0.2)
+print("Dropped:", server.metrics.get("calculator_packets_dropped_total"))
+
+server.drain()
+thread.join(timeout=2)
+print("Drained:", not thread.is_alive())
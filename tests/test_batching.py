@@ -0,0 +1,43 @@
+import threading
+import time
+
+from http_suite.batching import BatchingClient
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.server import UDPReliableServer
+
+tc = TCPClient()
+tc.connect(host="127.0.0.1", port=50123)
+
+batching = BatchingClient(tc, linger=0.01, max_batch=32)
+
+futures = [batching.evaluate("+ {} 1".format(i)) for i in range(100)]
+futures.append(batching.evaluate("/ 1 0"))
+
+for future in futures[-3:]:
+    print(future.result())
+
+batching.close()
+print(
+    "Sent {} expressions in {} requests".format(batching.expressions, batching.batches)
+)
+
+# Batch responses outgrow a datagram: UDP clients must be fragmented
+server = UDPReliableServer(port=50187, debug=False)
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+try:
+    BatchingClient(UDPReliableClient(server_port=50188), port=50187)
+except ValueError as exc:
+    print("Rejected:", exc)
+
+udp = UDPReliableClient(server_port=50189, fragmented=True)
+batching = BatchingClient(udp, max_batch=64, port=50187)
+
+futures = [batching.evaluate("* {} 1000000".format(i)) for i in range(256)]
+print("UDP:", futures[-1].result())
+
+batching.close()
+print(
+    "Sent {} expressions in {} requests".format(batching.expressions, batching.batches)
+)
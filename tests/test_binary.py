@@ -0,0 +1,30 @@
+from http_suite import binary
+from http_suite.http import HTTPRequest
+
+for value in [0, 1, -1, 63, -64, 300, 10**30, -(10**30)]:
+    encoded = binary.encode_varint(value)
+    print(value, "->", encoded.hex(), "->", binary.decode_varint(encoded)[0])
+
+request = binary.encode_request(1, "*", 5, 6)
+http_request = HTTPRequest().build_request(params={"expression": "* 5 6"})
+print(
+    "Binary request: {} bytes, HTTP request: {} bytes".format(
+        len(request), len(http_request)
+    )
+)
+
+# Frames arriving split across reads
+stream = request + binary.encode_request(2, "/", 8, 3)
+frames, rest = binary.split_frames(stream[:15])
+print("Partial read:", frames, rest)
+frames, rest = binary.split_frames(stream)
+print("Full read:", frames, rest)
+
+responses = (
+    binary.encode_result(1, 30)
+    + binary.encode_result(2, 8 / 3)
+    + binary.encode_error(3, ZeroDivisionError())
+)
+
+for opcode, request_id, payload in binary.split_frames(responses)[0]:
+    print("Response", request_id, binary.decode_response(opcode, payload))
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from http_suite.cache import CacheSnapshot, ResultCache, SharedResultCache
+from http_suite.client import TCPClient
+from http_suite.server import TCPServer
+
+path = os.path.join(tempfile.mkdtemp(), "calculator.cache")
+
+
+def fill(start: int, stop: int):
+    cache = SharedResultCache(path, buckets=64)
+
+    for i in range(start, stop):
+        cache.put("* {} 3".format(i), str(i * 3))
+
+    cache.close()
+
+
+if __name__ == "__main__":
+    cache = ResultCache(capacity=2)
+    cache.put("+ 1 2", "3")
+    cache.put("+ 2 3", "5")
+    cache.get("+ 1 2")
+    cache.put("+ 3 4", "7")
+    print("LRU keeps:", list(cache.entries), "hits:", cache.hits)
+
+    # A restarted cache starts warm from the snapshot of the previous one
+    snapshot = os.path.join(tempfile.mkdtemp(), "calculator.snapshot")
+    cache = ResultCache(snapshot=snapshot)
+    for i in range(100000):
+        cache.put("* {} 3".format(i), str(i * 3))
+    cache.close()
+
+    start = time.perf_counter()
+    cache = ResultCache(snapshot=snapshot)
+    print("Warm start:", time.perf_counter() - start, "s,", len(cache.warm), "saved")
+    print("From snapshot:", cache.get("* 99999 3"), cache.get("* 1 3"), cache.hits)
+    print("In memory:", len(cache))
+
+    with open(snapshot, "r+b") as damaged:
+        damaged.write(b"CALCSNP0")
+    try:
+        CacheSnapshot(snapshot)
+    except ValueError as error:
+        print("Rejected:", error)
+
+    shared = SharedResultCache(path, buckets=64)
+
+    # Four processes write the same table concurrently
+    workers = [
+        multiprocessing.Process(target=fill, args=(i * 100, i * 100 + 300))
+        for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    found = [shared.get("* {} 3".format(i)) for i in range(600)]
+    wrong = [i for i, result in enumerate(found) if result not in (None, str(i * 3))]
+    print("Entries:", len(shared), "of", shared.capacity, "wrong:", wrong)
+
+    # Two servers share their results through the file
+    servers = [
+        TCPServer(port=port, debug=False, cache=SharedResultCache(path, buckets=64))
+        for port in (50146, 50147)
+    ]
+    for server in servers:
+        threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+
+    for server in servers:
+        client = TCPClient()
+        client.connect(host="127.0.0.1", port=server.port)
+        client.http_send(method="POST", params={"expression": "* 12345 6789"})
+        print("Port", server.port, client.result(), "hits:", server.cache.hits)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.http import (
+    HTTPResponse,
+    compress_message,
+    decode_message,
+    negotiate_encoding,
+)
+from http_suite.server import TCPServer, UDPReliableServer
+
+print("Negotiated:", negotiate_encoding("deflate, gzip;q=0.5"))
+print("Negotiated:", negotiate_encoding("br, *;q=0.1"))
+print("Negotiated:", negotiate_encoding("identity"))
+
+response = HTTPResponse().build_response(data="1234567890" * 500)
+compressed = compress_message(response, "gzip")
+print("Response of {} bytes sent in {}".format(len(response), len(compressed.encode())))
+print("Decoded back:", decode_message(compressed.encode()) == response)
+
+server = TCPServer(port=50174, debug=False)
+threading.Thread(target=server.run, daemon=True).start()
+udp_server = UDPReliableServer(port=50175, buffer_size=65536, debug=False)
+threading.Thread(target=udp_server.run, daemon=True).start()
+time.sleep(0.5)
+
+expressions = ["* {} {}".format(i, i * 7) for i in range(2000)]
+big = "* {} {}".format("7" * 600, "3" * 600)
+
+for compress_min_size in (None, 1024):
+    tc = TCPClient(compress_min_size=compress_min_size)
+    tc.connect(host="127.0.0.1", port=50174)
+
+    received = server.metrics.get("calculator_bytes_received_total")
+    sent = server.metrics.get("calculator_bytes_sent_total")
+
+    tc.http_send(method="POST", file="/batch", params={"expression": expressions})
+    lines = tc.result().split("\n")
+
+    streamed = list(tc.stream_batch(expressions))
+
+    tc.http_send(method="POST", params={"expression": big})
+    product = tc.result()
+
+    print(
+        "Compression {}: {} results, {} streamed, {}-digit product".format(
+            "on " if compress_min_size else "off",
+            len(lines),
+            len(streamed),
+            len(product),
+        )
+    )
+    print(
+        "  Bytes received by the server: {}, sent: {}".format(
+            server.metrics.get("calculator_bytes_received_total") - received,
+            server.metrics.get("calculator_bytes_sent_total") - sent,
+        )
+    )
+    assert lines[-1] == "200 " + streamed[-1]
+
+udp = UDPReliableClient(
+    buffer_size=65536,
+    server_port=50176,
+    server_addr="127.0.0.1",
+    compress_min_size=1024,
+)
+udp.http_send(port=50175, method="POST", params={"expression": big})
+print("UDP product:", udp.result()[:20] + "...")
@@ -0,0 +1,29 @@
+import random
+
+from http_suite import fragment
+
+message = ("+ {} 1".format("9" * 4000)).encode()
+fragments = fragment.fragment(message, message_id=7, size=1024)
+print("Fragments:", len(fragments), [len(datagram) for datagram in fragments])
+
+# Deliver out of order, losing one fragment
+shuffled = list(fragments)
+random.Random(1).shuffle(shuffled)
+lost = shuffled.pop()
+
+reassembler = fragment.Reassembler()
+
+for datagram in shuffled:
+    kind, message_id, index, count, body = fragment.parse(datagram)
+    reassembler.add(message_id, index, count, body)
+
+count, missing = reassembler.progress(7)
+print("Missing:", missing)
+
+# The receiver asks for the missing fragment only
+request = fragment.nack(7, count, missing, size=1024)
+print("NACK:", fragment.parse(request))
+
+kind, message_id, index, count, body = fragment.parse(lost)
+result = reassembler.add(message_id, index, count, body)
+print("Reassembled:", result == message)
@@ -0,0 +1,35 @@
+import collections
+import socket
+import threading
+import time
+
+from http_suite.client import TCPClient
+from http_suite.gather import advance, send_buffers
+from http_suite.server import TCPServer
+
+# A partial write leaves a view of the rest of a buffer, without copying it
+queue = collections.deque([b"HTTP/1.1 200 OK\r\n", b"Content-Length: 1\r\n\r\n", b"3"])
+advance(queue, 20)
+print("Left after writing 20 bytes:", [bytes(buffer) for buffer in queue])
+
+left, right = socket.socketpair()
+advance(queue, send_buffers(left, list(queue)))
+print("Written in one call:", right.recv(1024), "left:", list(queue))
+
+server = TCPServer(port=50161, debug=False)
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+client = TCPClient(buffer_size=65536)
+client.connect(host="127.0.0.1", port=50161)
+expressions = ["+ {} 1".format(i) for i in range(2000)]
+
+start = time.perf_counter()
+for expression in expressions[:1000]:
+    client.http_send(method="POST", params={"expression": expression})
+    client.result()
+print("One by one:", time.perf_counter() - start)
+
+start = time.perf_counter()
+results = client.pipeline(expressions[1000:])
+print("Pipelined:", time.perf_counter() - start, results[:3], results[-1])
@@ -1,4 +1,10 @@
+import socket
+import threading
+import time
+import tracemalloc
+
 from http_suite.http import HTTPParser, HTTPRequest, HTTPResponse
+from http_suite.server import TCPServer
 
 http_parser = HTTPParser()
 
@@ -46,3 +52,51 @@ print(response3, "\n")
 print("Status:", parsed_response3["status"])
 print("Header Fields:", parsed_response3["fields"])
 print("Data:", parsed_response3["data"])
+
+# Compact request and response objects parse their headers only when read
+request = http_parser.read_request(request1)
+print()
+print("Request object:", request.method, request.file, request.params)
+print("Header Fields:", request.fields, "| as dict:", request["params"])
+
+response = http_parser.read_response(response2)
+print("Response object:", response.status, response.data, response.fields)
+
+for label, parse in (
+    ("parse_request", http_parser.parse_request),
+    ("read_request", http_parser.read_request),
+):
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [parse(request1) for _ in range(10000)]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        "{:<14} {:.2f} us and {} bytes per request".format(
+            label, elapsed / len(kept) * 1e6, size // len(kept)
+        )
+    )
+
+# A request whose length cannot be read is rejected and its connection closed
+for length in (b"abc", b"-5"):
+    malformed = b"POST / HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n"
+    try:
+        http_parser.message_length(malformed)
+    except ValueError as exc:
+        print("Rejected:", exc)
+
+server = TCPServer(port=50181, debug=False)
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+sock = socket.create_connection(("127.0.0.1", 50181))
+sock.sendall(b"POST / HTTP/1.1\r\nContent-Length: abc\r\n\r\n+ 1 2")
+answer = b""
+while True:
+    data = sock.recv(4096)
+    if not data:
+        break
+    answer += data
+print("Server answered:", answer.split(b"\r\n")[0], "and closed the connection")
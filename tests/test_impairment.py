@@ -0,0 +1,49 @@
+import socket
+
+from http_suite.impairment import (
+    GilbertElliott,
+    ImpairedSocket,
+    Impairment,
+    constant_delay,
+    normal_delay,
+)
+
+# Same seed, same losses
+first = Impairment(loss=0.3, seed=42)
+second = Impairment(loss=0.3, seed=42)
+
+print("Run 1:", [bool(first.schedule(100, t)) for t in range(20)])
+print("Run 2:", [bool(second.schedule(100, t)) for t in range(20)])
+
+# Bursty loss: losses come in runs
+bursty = Impairment(burst=GilbertElliott(p_good_bad=0.05, p_bad_good=0.3), seed=7)
+print(
+    "Burst loss:",
+    "".join("." if bursty.schedule(100, 0.0) else "x" for _ in range(80)),
+)
+
+# Delay, jitter and duplication
+delayed = Impairment(delay=normal_delay(0.050, 0.010), duplicate=0.2, seed=1)
+for i in range(5):
+    print("Packet {} delivered at:".format(i), delayed.schedule(100, i * 0.01))
+
+# 1 KB packets on a 10 KB/s link are serialized 0.1 s apart
+capped = Impairment(delay=constant_delay(0.020), bandwidth=10240, seed=1)
+print("Bandwidth cap:", [round(capped.schedule(1024, 0.0)[0], 3) for _ in range(4)])
+
+# A zero timeout still reads the datagrams the kernel has queued
+receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+receiver.bind(("127.0.0.1", 0))
+sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+for i in range(3):
+    sender.sendto(b"packet %d" % i, receiver.getsockname())
+
+impaired = ImpairedSocket(receiver, inbound=Impairment(seed=1))
+impaired.settimeout(0.0)
+drained = []
+while True:
+    try:
+        drained.append(impaired.recvfrom(1024)[0])
+    except socket.timeout:
+        break
+print("Drained without waiting:", drained)
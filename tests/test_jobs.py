@@ -0,0 +1,61 @@
+import threading
+import time
+
+from http_suite.client import UDPReliableClient, UDPUnreliableClient
+from http_suite.http import HTTPParser
+from http_suite.jobs import JobManager
+from http_suite.server import UDPReliableServer
+
+if __name__ == "__main__":
+    jobs = JobManager(workers=2, chunk_size=1000)
+
+    expressions = "\n".join("* {} 3".format(i) for i in range(5000))
+    job = jobs.submit(expressions)
+    print(job.progress())
+
+    while job.status not in ("done", "failed"):
+        time.sleep(0.1)
+
+    print(job.progress())
+
+    with open(job.results[-1]) as results:
+        print(results.read().splitlines()[-3:])
+
+    print("Result size:", job.size())
+
+    # Hand the spool over to a new manager while a job is still queued
+    job = jobs.submit(expressions)
+    jobs.close(keep=True)
+
+    successor = JobManager(workers=2, chunk_size=1000)
+    successor.adopt(jobs.directory)
+
+    job = successor.get(job.id)
+    print("Resumed:", job.progress())
+
+    while job.status not in ("done", "failed"):
+        time.sleep(0.1)
+
+    print("Resumed:", job.progress())
+    print("Result size:", job.size())
+    successor.close()
+
+    # Over UDP, results larger than a datagram need a fragmented request
+    server = UDPReliableServer(port=50182, buffer_size=8192, debug=False)
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+
+    job = server.jobs.submit("\n".join("* {} 3".format(i) for i in range(20000)))
+    while job.status not in ("done", "failed"):
+        time.sleep(0.1)
+    print("UDP job result size:", job.size())
+
+    client = UDPReliableClient(buffer_size=8192, server_port=50183)
+    client.http_send(port=50182, file="/jobs/result", params={"id": job.id})
+    response = HTTPParser().read_response(client.receive().decode())
+    print("Single datagram:", response.status)
+
+    # Fragments lost on the way are asked for again
+    client = UDPUnreliableClient(buffer_size=8192, server_port=50184, fragmented=True)
+    results = client.http_req(port=50182, file="/jobs/result", params={"id": job.id})
+    print("Fragmented:", len(results.splitlines()), "results")
@@ -0,0 +1,56 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from http_suite.client import TCPClient
+from http_suite.server import TCPServer
+
+
+def serving(server: subprocess.Popen) -> int:
+    """Wait for a server process of this script to serve, and get its PID."""
+    for line in server.stdout:
+        if line.startswith("Serving from"):
+            return int(line.split()[-1])
+
+
+def evaluate(expression: str) -> str:
+    """Evaluate an expression on a new connection."""
+    tc = TCPClient()
+    tc.connect(host="127.0.0.1", port=50190)
+    tc.http_send(method="POST", params={"expression": expression})
+    return tc.result()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve"]:
+        # SIGHUP starts this same command line again, on the inherited socket
+        ts = TCPServer(port=50190, debug=False)
+        print("Serving from process", os.getpid(), flush=True)
+        ts.run()
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, "serve"], stdout=subprocess.PIPE, text=True
+    )
+    first = serving(server)
+    print("Process {}: {}".format(first, evaluate("+ 1 2")))
+
+    # The new process drains the old one once it serves from the same socket
+    os.kill(first, signal.SIGHUP)
+    second = serving(server)
+    print("Old process exited with:", server.wait(timeout=10))
+    print("Process {}: {}".format(second, evaluate("* 6 7")))
+
+    os.kill(second, signal.SIGTERM)
+    deadline = time.monotonic() + 5
+    exited = False
+
+    while not exited and time.monotonic() < deadline:
+        try:
+            os.kill(second, 0)
+            time.sleep(0.1)
+        except ProcessLookupError:
+            exited = True
+
+    print("New process drained on SIGTERM:", exited)
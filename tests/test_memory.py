@@ -0,0 +1,49 @@
+import json
+import threading
+import time
+
+from http_suite.cache import ResultCache
+from http_suite.client import TCPClient
+from http_suite.http import HTTPParser
+from http_suite.memory import format_report
+from http_suite.server import TCPServer
+
+server = TCPServer(port=50170, debug=False, cache=ResultCache())
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+tc = TCPClient()
+tc.connect(host="127.0.0.1", port=50170)
+
+
+def memory(action: str = None) -> dict:
+    """Ask the server for its memory report."""
+    tc.http_send(
+        file="/memory",
+        method="GET",
+        params={"action": action} if action else None,
+    )
+    response = HTTPParser().read_response(tc.receive().decode())
+    return json.loads(response.data) if response.status == 200 else response.status
+
+
+print("Before tracing:", memory()["tracing"])
+print("Snapshot while not tracing:", memory("snapshot"))
+memory("start")
+
+# Every new expression grows the result cache between the two snapshots
+for i in range(2000):
+    tc.http_send(method="POST", params={"expression": "* {} {}".format(i, i)})
+    tc.result()
+memory("snapshot")
+
+for i in range(2000, 6000):
+    tc.http_send(method="POST", params={"expression": "* {} {}".format(i, i)})
+    tc.result()
+report = memory("snapshot")
+
+report["top"] = report["top"][:5]
+report["diff"]["sites"] = report["diff"]["sites"][:5]
+print(format_report(report))
+
+print("After stopping:", memory("stop")["tracing"])
@@ -0,0 +1,25 @@
+from http_suite.metrics import LogHistogram, Metrics
+
+histogram = LogHistogram()
+
+for value in [0.0001, 0.0002, 0.0004, 0.0008, 0.5]:
+    histogram.record(value)
+
+print("Count:", histogram.count)
+print("p50:", histogram.quantile(0.5))
+print("p99:", histogram.quantile(0.99))
+
+other = LogHistogram()
+other.record(0.003)
+histogram.merge(other)
+print("Merged count:", histogram.count)
+
+metrics = Metrics()
+metrics.describe("requests_total", "counter", "Requests by status.")
+metrics.inc("requests_total", status=200)
+metrics.inc("requests_total", status=200)
+metrics.inc("requests_total", status=406)
+metrics.observe("latency_seconds", 0.002)
+
+print(metrics.render())
+print(metrics.stats())
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import threading
+import time
+
+from http_suite.cache import ResultCache
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.multi import MultiServer
+
+path = os.path.join(tempfile.mkdtemp(), "calculator.sock")
+
+server = MultiServer(port=50144, unix=path, debug=False, cache=ResultCache())
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+tcp = TCPClient()
+tcp.connect(host="127.0.0.1", port=50144)
+tcp.http_send(method="POST", params={"expression": "* 12345 6789"})
+print("TCP:", tcp.result())
+
+udp = UDPReliableClient(server_port=50145, server_addr="127.0.0.1")
+udp.http_send(
+    host="127.0.0.1",
+    port=50144,
+    method="POST",
+    params={"expression": "*  12345   6789"},
+)
+print("UDP:", udp.result())
+
+unix = TCPClient()
+unix.connect(host=path)
+unix.http_send(method="POST", params={"expression": "* 12345 6789"})
+print("Unix:", unix.result())
+
+print("Cache hits:", server.cache.hits, "misses:", server.cache.misses)
+
+# Results too large for a datagram are refused without stopping the server
+job = server.jobs.submit("\n".join("* {} 3".format(i) for i in range(20000)))
+while job.status not in ("done", "failed"):
+    time.sleep(0.1)
+
+udp.http_send(port=50144, file="/jobs/result", params={"id": job.id})
+print("UDP job result:", udp.receive().split(b"\r\n")[0])
+udp.http_send(port=50144, method="POST", params={"expression": "+ 1 2"})
+print("UDP after it:", udp.result())
+
+print(server.metrics.stats())
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from http_suite.client import TCPClient
+from http_suite.proxy import HashRing, TCPProxy
+from http_suite.server import TCPServer
+
+ring = HashRing(["server-a", "server-b", "server-c"])
+
+expressions = ["+ {} 1".format(i) for i in range(1000)]
+before = {expression: ring.lookup(expression) for expression in expressions}
+
+for node in ["server-a", "server-b", "server-c"]:
+    print(node, sum(owner == node for owner in before.values()))
+
+ring.add("server-d")
+moved = sum(ring.lookup(expression) != before[expression] for expression in expressions)
+print("Moved after adding a server:", moved)
+
+print("Fallback order of '+ 1 2':", list(ring.candidates("+ 1 2")))
+
+# The server closes pooled connections left idle: the proxy opens new ones
+server = TCPServer(port=50185, debug=False, idle_timeout=0.5)
+threading.Thread(target=server.run, daemon=True).start()
+proxy = TCPProxy([("127.0.0.1", 50185)], port=50186, debug=False)
+threading.Thread(target=proxy.run, daemon=True).start()
+time.sleep(0.5)
+
+client = TCPClient()
+client.connect(host="127.0.0.1", port=50186)
+for _ in range(2):
+    client.http_send(method="POST", params={"expression": "* 12 12"})
+    print("Through the proxy:", client.result())
+    time.sleep(1.5)
+errors = proxy.metrics.get("calculator_proxy_errors_total", backend="127.0.0.1:50185")
+print("Backend errors:", errors)
+
+client.http_send(
+    method="POST", file="/batch", params={"expression": ["+ 1 2", "* 2 3"]}
+)
+print("Batch through the proxy:", client.result().split("\n"))
+client.http_send(method="GET", file="/memory")
+print("Memory report from the server:", client.result()[:40] + "...")
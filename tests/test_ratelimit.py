@@ -0,0 +1,16 @@
+from http_suite.ratelimit import RateLimiter
+from http_suite.simnet import VirtualClock
+
+clock = VirtualClock()
+limiter = RateLimiter(rate=10.0, burst=5, max_clients=2, clock=clock)
+
+allowed = sum(limiter.allow("10.0.0.1") for _ in range(8))
+print("Burst of 8, allowed:", allowed)
+
+clock.now = 0.3
+print("After 0.3s, allowed:", sum(limiter.allow("10.0.0.1") for _ in range(8)))
+
+limiter.allow("10.0.0.2")
+limiter.allow("10.0.0.3")
+print("Clients tracked:", len(limiter), "evicted:", limiter.evicted)
+print("Limited requests:", limiter.limited)
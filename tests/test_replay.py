@@ -0,0 +1,50 @@
+import os
+import tempfile
+import threading
+import time
+
+from http_suite.cache import ResultCache
+from http_suite.capture import Capture, read_journal
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.multi import MultiServer
+from http_suite.replay import Replayer, compare
+from http_suite.server import TCPServer
+
+path = os.path.join(tempfile.mkdtemp(), "traffic.journal")
+
+# Capture TCP, binary and UDP traffic
+server = MultiServer(port=50162, debug=False, capture=Capture(path))
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+tcp = TCPClient()
+tcp.connect(host="127.0.0.1", port=50162)
+tcp.pipeline(["* {} {}".format(i, i) for i in range(200)])
+
+frames = TCPClient()
+frames.connect(host="127.0.0.1", port=50162)
+frames.binary_evaluate("+ 1 2")
+
+udp = UDPReliableClient(server_port=50163, server_addr="127.0.0.1")
+for i in range(20):
+    udp.http_send(
+        host="127.0.0.1", port=50162, method="POST", params={"expression": "- 1 2"}
+    )
+    udp.result()
+    time.sleep(0.01)
+
+server.capture.close()
+records = list(read_journal(path))
+print("Captured:", len(records), "from sources", sorted({r.source for r in records}))
+
+# Replay against two server variants, at ten times the captured speed
+baseline = MultiServer(port=50164, debug=False)
+candidate = MultiServer(port=50165, debug=False, cache=ResultCache())
+for variant in (baseline, candidate):
+    threading.Thread(target=variant.run, daemon=True).start()
+time.sleep(0.5)
+
+first = Replayer(path, port=50164, speed=10.0).run()
+second = Replayer(path, port=50165, speed=None).run()
+print("Baseline:", first.summary(), dict(first.statuses))
+print(compare(first, second))
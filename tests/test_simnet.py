@@ -0,0 +1,38 @@
+import time
+
+from http_suite.client import TimeoutException, UDPUnreliableClient
+from http_suite.server import UDPUnreliableServer
+from http_suite.simnet import SimNetwork
+
+
+def simulate(seed: int, requests: int) -> tuple:
+    network = SimNetwork(latency=0.001)
+
+    server = UDPUnreliableServer(
+        prob_drop=0.3, seed=seed, debug=False, transport=network
+    )
+    network.serve(server)
+
+    client = UDPUnreliableClient(transport=network, max_timeout=2.0)
+
+    answered = 0
+    timeouts = 0
+
+    for i in range(requests):
+        try:
+            client.http_req(method="POST", params={"expression": "+ {} 1".format(i)})
+            answered += 1
+        except TimeoutException:
+            timeouts += 1
+
+    return answered, timeouts, network.clock()
+
+
+start = time.perf_counter()
+answered, timeouts, virtual = simulate(seed=1, requests=10000)
+elapsed = time.perf_counter() - start
+
+print("Answered:", answered)
+print("Timed out:", timeouts)
+print("Virtual time: {:.1f}s, real time: {:.2f}s".format(virtual, elapsed))
+print("Reproducible:", simulate(seed=7, requests=500) == simulate(seed=7, requests=500))
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from http_suite.singleflight import SingleFlight
+
+flight = SingleFlight()
+runs = []
+
+
+def evaluate(expression: str) -> str:
+    runs.append(expression)
+    time.sleep(0.2)
+
+    if expression == "/ 1 0":
+        raise ZeroDivisionError(expression)
+
+    return "3"
+
+
+def call(expression: str, results: list):
+    try:
+        results.append(flight.do(expression, evaluate, expression))
+    except ZeroDivisionError as exc:
+        results.append(type(exc).__name__)
+
+
+# Identical calls made while the first runs share its result, or its exception
+for expression in ("+ 1 2", "/ 1 0"):
+    results = []
+    threads = [
+        threading.Thread(target=call, args=(expression, results)) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print("{}: {}".format(expression, results))
+
+print("Runs:", runs, "collapsed:", flight.collapsed)
+
+# Once the call returned, the next one runs again
+print("Later call:", flight.do("+ 1 2", evaluate, "+ 1 2"), "runs:", len(runs))
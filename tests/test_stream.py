@@ -0,0 +1,51 @@
+import socket
+import threading
+import time
+
+from http_suite.client import TCPClient
+from http_suite.http import ChunkedDecoder, HTTPParser, HTTPResponse
+from http_suite.server import TCPServer
+
+http_parser = HTTPParser()
+
+stream = HTTPResponse().build_stream_response(iter(["200 3\n", "406 -1\n"]))
+body = stream.encode()
+
+print("Streamed response:")
+print(body, "\n")
+print("Message length:", http_parser.message_length(body), "of", len(body))
+
+decoder = ChunkedDecoder()
+print("Decoded body:", decoder.feed(body[body.index(b"\r\n\r\n") + 4 :]))
+print("Done:", decoder.done)
+
+# Chunk sizes that are not hexadecimal are rejected instead of parsed
+for chunk in (b"zz\r\n+ 1 2\r\n0\r\n\r\n", b"-5\r\n+ 1 2\r\n0\r\n\r\n"):
+    try:
+        ChunkedDecoder().feed(chunk)
+    except ValueError as exc:
+        print("Rejected:", exc)
+
+server = TCPServer(port=50142, debug=False)
+threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+client = TCPClient(buffer_size=65536)
+client.connect(host="127.0.0.1", port=50142)
+
+expressions = ["* {} 3".format(i) for i in range(10000)] + ["/ 1 0"]
+
+start = time.perf_counter()
+results = client.stream_batch(expressions)
+print("First result:", next(results), "after", time.perf_counter() - start)
+
+results = list(results)
+print("Results:", len(results) + 1, "last:", results[-2:])
+
+
+sock = socket.create_connection(("127.0.0.1", 50142))
+sock.sendall(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n")
+print("Malformed chunks answered:", sock.recv(4096).split(b"\r\n")[0])
+print("Connection closed:", sock.recv(4096) == b"")
+
+print(server.metrics.stats())
@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.server import TCPServer, UDPReliableServer
+from http_suite.threaded import ThreadedServer
+
+# Multiplying large operands keeps the server busy evaluating, not parsing
+EXPRESSION = "* {} {}".format("7" * 1500, "3" * 1500)
+REQUESTS = 200
+
+
+def send(port: int):
+    client = TCPClient(buffer_size=65536)
+    client.connect(host="127.0.0.1", port=port)
+
+    for i in range(REQUESTS):
+        # Distinct expressions, so neither the cache nor single-flight helps
+        client.http_send(method="POST", params={"expression": EXPRESSION + str(i)})
+        client.result()
+
+
+def benchmark(threads: int, port: int, clients: int) -> float:
+    server = ThreadedServer(TCPServer, threads=threads, port=port, debug=False)
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+
+    start = time.perf_counter()
+    senders = [
+        multiprocessing.Process(target=send, args=(port,)) for _ in range(clients)
+    ]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    elapsed = time.perf_counter() - start
+
+    server.drain()
+    time.sleep(1)
+
+    return clients * REQUESTS / elapsed
+
+
+if __name__ == "__main__":
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    cores = os.cpu_count()
+    print("Python", sys.version.split()[0], "GIL enabled:", gil, "CPUs:", cores)
+
+    # Threads share UDP requests too
+    server = ThreadedServer(UDPReliableServer, threads=2, port=50157, debug=False)
+    threading.Thread(target=server.run, daemon=True).start()
+    time.sleep(0.5)
+
+    client = UDPReliableClient(server_port=50160, server_addr="127.0.0.1")
+    client.http_send(
+        host="127.0.0.1", port=50157, method="POST", params={"expression": "+ 1 2"}
+    )
+    print("UDP:", client.result())
+
+    server.drain()
+    time.sleep(1)
+
+    # Run with the standard and the free-threaded interpreter to compare them
+    for threads, port in ((1, 50158), (max(cores, 2), 50159)):
+        rate = benchmark(threads, port, clients=max(cores, 2))
+        print("{} threads: {:.0f} requests/s".format(threads, rate))
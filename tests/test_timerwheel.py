@@ -0,0 +1,16 @@
+from http_suite.simnet import VirtualClock
+from http_suite.timerwheel import TimerWheel
+
+clock = VirtualClock()
+wheel = TimerWheel(tick=0.1, slots=8, clock=clock)
+
+wheel.schedule(0.25, "header timeout")
+wheel.schedule(2.0, "idle timeout")
+cancelled = wheel.schedule(0.5, "write timeout")
+wheel.cancel(cancelled)
+
+print("Pending timers:", len(wheel))
+
+for now in [0.2, 0.5, 1.0, 2.5]:
+    clock.now = now
+    print("At {}s expired: {}".format(now, wheel.advance()))
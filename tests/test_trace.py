@@ -0,0 +1,78 @@
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+from http_suite.client import TCPClient, UDPReliableClient
+from http_suite.server import TCPServer, UDPReliableServer
+from http_suite.tracing import Tracer
+
+path = os.path.join(tempfile.mkdtemp(), "requests.trace.json")
+
+# Server and clients write to one trace, so their spans share a timeline
+tracer = Tracer(path, sample_rate=1.0, flush_interval=0.1)
+
+tcp_server = TCPServer(port=50166, debug=False, tracer=tracer)
+udp_server = UDPReliableServer(port=50167, debug=False, tracer=tracer)
+for server in (tcp_server, udp_server):
+    threading.Thread(target=server.run, daemon=True).start()
+time.sleep(0.5)
+
+tcp = TCPClient(tracer=tracer)
+tcp.connect(host="127.0.0.1", port=50166)
+udp = UDPReliableClient(server_port=50168, server_addr="127.0.0.1", tracer=tracer)
+
+for i in range(50):
+    tcp.http_send(method="POST", params={"expression": "* {} {}".format(i, i)})
+    tcp.result()
+
+    udp.http_send(port=50167, method="POST", params={"expression": "+ 1 2"})
+    udp.result()
+
+tcp.http_send(file="/stats")
+tcp.result()
+
+time.sleep(0.2)
+tracer.close()
+
+with open(path) as trace:
+    events = json.load(trace)
+
+durations = collections.defaultdict(list)
+for event in events:
+    if event["ph"] == "X":
+        durations[event["cat"], event["name"]].append(event["dur"])
+
+print("Trace events written to", path, ":", len(events))
+for (cat, name), values in sorted(durations.items()):
+    print(
+        "{:<8} {:<14} {:>4} spans, mean {:8.1f} us".format(
+            cat, name, len(values), sum(values) / len(values)
+        )
+    )
+
+# Cost of tracing on the server: off, sampling nothing, sampling everything
+for label, server_tracer in (
+    ("off", None),
+    ("rate 0", Tracer(os.devnull, sample_rate=0.0)),
+    ("rate 1", Tracer(os.devnull, sample_rate=1.0)),
+):
+    server = TCPServer(port=50169, debug=False, tracer=server_tracer)
+
+    for i in range(22000):
+        # The first requests only warm up
+        if i == 2000:
+            start = time.perf_counter()
+
+        if server_tracer is not None:
+            server.start_trace(time.time())
+        server.process_request(
+            "POST /?expression=%2B+1+2 HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n"
+        )
+        server.finish_trace("send")
+
+    elapsed = time.perf_counter() - start
+    print("Tracing {:<6}: {:.2f} us per request".format(label, elapsed / 20000 * 1e6))
+    server.close()